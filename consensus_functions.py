@@ -0,0 +1,621 @@
+# consensus functions for the probabilistic consensus simulations
+
+# Groups of local consensus:
+# Only adjacent block of nodes sharing same dominant decision belongs to same group. The groups
+# are the connected components of the network after removing the connections between nodes of
+# different decisions. They are labeled with union-find over the remaining connections, done on
+# all connections together in numpy arrays: every node points to the smallest node index it has
+# been joined with, and the pointers are shortened until every node points to the root of its
+# group. The number of rounds grows with log of the group diameter instead of the group sizes.
+
+from __future__ import division
+import numpy as np
+
+# label the groups of local consensus, "connections" is a CSRConnections of the network
+# return three arrays: the group index of each node, the size of each group, and the exhibited
+# decision of each group; the groups are in order of their smallest node index
+def consensus_groups(connections, deci_domi):
+    deci_domi = np.asarray(deci_domi)
+    edges_i, edges_j = connections.edges()
+    agreed = deci_domi[edges_i] == deci_domi[edges_j]
+    edges_i = edges_i[agreed]
+    edges_j = edges_j[agreed]
+    parents = np.arange(connections.size)  # the node each node is pointing to
+    while True:
+        # hook the roots of two joined nodes to the smaller one
+        roots_i = parents[edges_i]
+        roots_j = parents[edges_j]
+        roots_low = np.minimum(roots_i, roots_j)
+        parents_old = parents
+        parents = np.copy(parents)
+        np.minimum.at(parents, roots_i, roots_low)
+        np.minimum.at(parents, roots_j, roots_low)
+        # shorten the pointers until all point to roots
+        grandparents = parents[parents]
+        while np.any(grandparents != parents):
+            parents = grandparents
+            grandparents = parents[parents]
+        if np.array_equal(parents, parents_old): break
+    roots, group_labels = np.unique(parents, return_inverse=True)
+    group_sizes = np.bincount(group_labels, minlength=len(roots))
+    return group_labels, group_sizes, deci_domi[roots]
+
+# live count of the connections whose two nodes have different dominant decisions
+# A node has converged with all its neighbors when none of its connections disagree, and the
+# network has converged when the total is zero. Only the connections of the nodes whose
+# dominant decision changed are compared again in an update, instead of all connections. The
+# nodes whose convergence may have changed in the last update are flagged as dirty.
+class ConvergenceTracker(object):
+    def __init__(self, connections, deci_domi):
+        self.connections = connections
+        self.deci_domi = np.array(deci_domi)
+        conn_rows = connections.row_index()
+        disagreed = self.deci_domi[conn_rows] != self.deci_domi[connections.col_index]
+        # number of disagreeing connections of each node, and of the network
+        self.disagree_nums = np.bincount(conn_rows[disagreed], minlength=connections.size)
+        self.disagree_total = np.sum(disagreed) // 2  # each connection listed at both ends
+        self.dirty = np.ones(connections.size, dtype=bool)
+    # update with the new dominant decisions, return the nodes whose decision changed
+    def update(self, deci_domi):
+        deci_domi = np.asarray(deci_domi)
+        changed = np.nonzero(deci_domi != self.deci_domi)[0]
+        self.dirty = np.zeros(self.connections.size, dtype=bool)
+        if len(changed) == 0: return changed
+        # the connections of the changed nodes, each listed once
+        row_ptr = self.connections.row_ptr
+        counts = row_ptr[changed+1] - row_ptr[changed]
+        hosts = np.repeat(changed, counts)
+        entries = (np.repeat(row_ptr[changed] - np.cumsum(counts) + counts, counts) +
+                   np.arange(np.sum(counts)))
+        neighbors = self.connections.col_index[entries]
+        is_changed = np.zeros(self.connections.size, dtype=bool)
+        is_changed[changed] = True
+        once = ~is_changed[neighbors] | (hosts < neighbors)
+        hosts = hosts[once]
+        neighbors = neighbors[once]
+        diffs = ((deci_domi[hosts] != deci_domi[neighbors]).astype(int) -
+                 (self.deci_domi[hosts] != self.deci_domi[neighbors]))
+        np.add.at(self.disagree_nums, hosts, diffs)
+        np.add.at(self.disagree_nums, neighbors, diffs)
+        self.disagree_total = self.disagree_total + np.sum(diffs)
+        self.deci_domi[changed] = deci_domi[changed]
+        flipped = diffs != 0
+        self.dirty[hosts[flipped]] = True
+        self.dirty[neighbors[flipped]] = True
+        return changed
+    # whether each node has converged with all its neighbors
+    def converged(self):
+        return self.disagree_nums == 0
+    def all_converged(self):
+        return self.disagree_total == 0
+
+# lists of nodes for the groups, from the group index of each node
+def group_lists(group_labels, group_quantity):
+    if group_quantity == 0: return []
+    order = np.argsort(group_labels, kind='mergesort')
+    group_ptr = np.cumsum(np.bincount(group_labels, minlength=group_quantity))[:-1]
+    return [list_temp.tolist() for list_temp in np.split(order, group_ptr)]
+
+# discrete entropy of each distribution in bits, zero probabilities count as zero
+def discrete_entropy(deci_dist):
+    deci_dist = np.asarray(deci_dist, dtype=float)
+    logs = np.log2(np.where(deci_dist > 0, deci_dist, 1.0))
+    return -np.sum(deci_dist * logs, axis=-1)
+
+# number of groups and size of the largest group in each part of the network, the nodes are in
+# parts of "part_size" one after another, like the trials of a batch
+def group_metrics(group_labels, group_lens, part_size):
+    part_num = len(group_labels) // part_size if part_size != 0 else 0
+    group_parts = np.zeros(len(group_lens), dtype=int)
+    group_parts[group_labels] = np.arange(len(group_labels)) // max(part_size, 1)
+    group_nums = np.bincount(group_parts, minlength=part_num)
+    group_maxs = np.zeros(part_num, dtype=int)
+    np.maximum.at(group_maxs, group_parts, group_lens)
+    return group_nums, group_maxs
+
+# Probabilistic consensus step:
+# Every node averages the decision distributions over the block of itself and its neighbors.
+# If all neighbors share the dominant decision of the host, the average is equally weighted,
+# and a linear multiplier is then applied to increase the unipolarity, if the largest difference
+# between two distributions in the block is small enough. Otherwise the distributions are
+# weighted by the group sizes of the nodes. The averages of all nodes are sums over the blocks
+# in CSR form (a sparse matrix product), the blocks have the host listed first.
+# The old loop updated the nodes one by one in index order, the largest difference in a block
+# was measured with the final distributions of the neighbors with smaller index, and the old
+# distributions of those with larger index. To get the same results, the converged nodes are
+# updated in batches of levels: a node is one level above the highest converged neighbor
+# with smaller index, so the nodes in one batch never depend on each other.
+
+# blocks of nodes in CSR form, each node followed by its neighbors
+# return the pointers and the node indices of the blocks
+def neighbor_blocks(connections):
+    block_ptr = connections.row_ptr + np.arange(connections.size+1)
+    block_index = np.insert(connections.col_index, connections.row_ptr[:-1],
+                            np.arange(connections.size))
+    return block_ptr, block_index
+
+# blocks of the active nodes only, return the pointers and node indices of these blocks, and
+# the host node of every entry in them
+def active_blocks(block_ptr, block_index, active):
+    block_rows = np.repeat(np.arange(len(block_ptr)-1), np.diff(block_ptr))
+    in_active = np.asarray(active, dtype=bool)[block_rows]
+    active_ptr = np.concatenate(([0], np.cumsum(np.diff(block_ptr)[active]))).astype(int)
+    return active_ptr, block_index[in_active], block_rows[in_active]
+
+# levels of the selected nodes for updating in batches, same as one by one in index order
+def update_levels(connections, selected):
+    selected = np.asarray(selected, dtype=bool)
+    conn_rows = connections.row_index()
+    # the host depends on the selected neighbors with smaller index
+    depend = selected[conn_rows] & selected[connections.col_index] & (
+        connections.col_index < conn_rows)
+    hosts = conn_rows[depend]
+    neighbors = connections.col_index[depend]
+    levels = np.zeros(connections.size, dtype=int)
+    while True:
+        levels_new = np.zeros(connections.size, dtype=int)
+        np.maximum.at(levels_new, hosts, levels[neighbors] + 1)
+        if np.array_equal(levels_new, levels): break
+        levels = levels_new
+    return levels
+
+# every pair of entries in the blocks of the selected nodes, each entry paired with the entries
+# after it in the same block; return the block positions of the two entries of the pairs, and
+# the node each block belongs to for all block positions
+def block_pairs(block_ptr, selected):
+    block_rows = np.repeat(np.arange(len(block_ptr)-1), np.diff(block_ptr))
+    firsts = np.nonzero(np.asarray(selected)[block_rows])[0]
+    counts = block_ptr[block_rows[firsts]+1] - firsts - 1
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    firsts = np.repeat(firsts, counts)
+    seconds = firsts + 1 + offsets
+    return firsts, seconds, block_rows
+
+# largest of the differences of the pairs in each block, -1 for blocks without pairs
+def pairs_max(pair_rows, pair_diffs, block_num):
+    dist_diff_max = -np.ones(block_num)
+    pair_nums = np.bincount(pair_rows, minlength=block_num)
+    has_pairs = pair_nums != 0
+    if np.any(has_pairs):
+        pair_starts = np.cumsum(pair_nums) - pair_nums
+        dist_diff_max[has_pairs] = np.maximum.reduceat(pair_diffs, pair_starts[has_pairs])
+    return dist_diff_max
+
+# largest difference between two distributions in the block of each selected node, the
+# difference is the sum of absolute differences of all probabilities
+# If "deci_dist_old" is given, the neighbors with larger index than the host take their old
+# distributions, like updating the nodes one by one in index order.
+# return the largest differences, -1 for nodes not selected or without neighbors
+def block_diff_max(block_ptr, block_index, deci_dist, selected, deci_dist_old=None):
+    firsts, seconds, block_rows = block_pairs(block_ptr, selected)
+    dists_temp = []
+    for entries in (firsts, seconds):
+        dist_temp = deci_dist[block_index[entries]]
+        if deci_dist_old is not None:
+            later = block_index[entries] > block_rows[entries]
+            dist_temp[later] = deci_dist_old[block_index[entries[later]]]
+        dists_temp.append(dist_temp)
+    dist_diff = np.sum(np.abs(dists_temp[0] - dists_temp[1]), axis=1)
+    return pairs_max(block_rows[firsts], dist_diff, len(block_ptr)-1)
+
+# apply the linear multiplier to the distributions, given the ratios of their largest block
+# difference to the threshold; the smaller the ratio, the steeper the linear multiplier
+# Probabilities are multiplied in ascending order, equal ones keep their order like in the old
+# bubble sort. return the normalized distributions
+def linear_multiply(deci_dist, dist_diff_ratio, dist_diff_power):
+    deci_num = deci_dist.shape[1]
+    # '1.0/deci_num' is the average value of the linear multiplier
+    small_end = 1.0/deci_num * np.power(dist_diff_ratio, dist_diff_power)
+    large_end = 2.0/deci_num - small_end
+    multipliers = (small_end[:,None] + (np.arange(deci_num)/(deci_num-1.0))[None,:] *
+                   (large_end-small_end)[:,None])
+    sort_index = np.argsort(deci_dist, axis=1, kind='mergesort')  # ascending order
+    multipliers_all = np.zeros(deci_dist.shape)
+    multipliers_all[np.arange(len(deci_dist))[:,None], sort_index] = multipliers
+    deci_dist = deci_dist * multipliers_all
+    return deci_dist / np.sum(deci_dist, axis=1)[:,None]
+
+# one step of the probabilistic consensus for all nodes
+# "group_sizes" is the size of the group each node is in; "converged" can be given from a
+# ConvergenceTracker, otherwise it's found by comparing the decisions over all connections;
+# "active" marks the nodes to update, see ActiveSet, the others keep their distributions
+# return the new distributions, and whether each node has converged with all its neighbors
+def consensus_step(connections, deci_dist, deci_domi, group_sizes,
+                   dist_diff_thres, dist_diff_power, converged=None, active=None):
+    deci_dist = np.asarray(deci_dist, dtype=float)
+    deci_domi = np.asarray(deci_domi)
+    if converged is None:
+        converged = ConvergenceTracker(connections, deci_domi).converged()
+    if active is None:
+        active = np.ones(connections.size, dtype=bool)
+    # step 1: take the average on all distributions in the blocks, equally weighted for
+    # converged nodes, weighted by group sizes otherwise
+    block_ptr, block_index = neighbor_blocks(connections)
+    active_ptr, active_index, active_rows = active_blocks(block_ptr, block_index, active)
+    weights = np.where(converged[active_rows], 1.0,
+                       np.asarray(group_sizes, dtype=float)[active_index])
+    deci_dist_new = np.copy(deci_dist)
+    if np.any(active):
+        dist_sums = np.add.reduceat(deci_dist[active_index] * weights[:,None],
+                                    active_ptr[:-1], axis=0)
+        deci_dist_new[active] = dist_sums / np.sum(dist_sums, axis=1)[:,None]
+    # step 2: increase the unipolarity by applying the linear multiplier, for the converged
+    # nodes whose largest distribution difference in the block is under the threshold
+    levels = update_levels(connections, converged & active)
+    for level in range(np.max(levels)+1 if connections.size != 0 else 0):
+        selected = converged & active & (levels == level)
+        dist_diff_max = block_diff_max(block_ptr, block_index, deci_dist_new, selected,
+                                       deci_dist)
+        multiplied = (dist_diff_max >= 0) & (dist_diff_max < dist_diff_thres)
+        if np.any(multiplied):
+            deci_dist_new[multiplied] = linear_multiply(deci_dist_new[multiplied],
+                dist_diff_max[multiplied]/dist_diff_thres, dist_diff_power)
+    return deci_dist_new, converged
+
+# Top-k sparse distributions:
+# With a large number of decisions, like as many roles as the nodes, the dense distributions
+# take n*d memory, mostly of probabilities close to zero. The sparse form keeps only the k
+# largest probabilities of each node, and a residual for the sum of all the others, which is
+# taken as spread evenly over them. The probabilities are exact if k is not less than the
+# number of decisions, a smaller k trades accuracy for memory of n*k.
+# The listed probabilities of a node are in descending order. Fewer than k can be listed,
+# the empty places have decision index -1 and probability 0.
+class TopKDists(object):
+    def __init__(self, index, probs, residual, deci_num):
+        self.index = np.asarray(index, dtype=int)
+        self.probs = np.asarray(probs, dtype=float)
+        self.residual = np.maximum(np.asarray(residual, dtype=float), 0.0)
+        self.deci_num = deci_num
+        self.size = len(self.index)  # number of nodes
+        self.top_k = self.index.shape[1]
+    # from listed decisions and probabilities in any order, sorted here
+    @classmethod
+    def from_entries(cls, index, probs, residual, deci_num):
+        index = np.asarray(index, dtype=int)
+        probs = np.asarray(probs, dtype=float)
+        # descending probabilities, equal ones with larger decision index first, so their
+        # ascending order is the same as the stable sort on the dense distributions
+        order = np.lexsort((-index, -probs), axis=1)
+        rows = np.arange(len(index))[:,None]
+        return cls(index[rows, order], probs[rows, order], residual, deci_num)
+    # keep the k largest probabilities of the dense distributions, normalized here
+    @classmethod
+    def from_dense(cls, deci_dist, top_k):
+        deci_dist = np.asarray(deci_dist, dtype=float)
+        size, deci_num = deci_dist.shape
+        top_k = min(top_k, deci_num)
+        if top_k < deci_num:
+            index = np.argpartition(-deci_dist, top_k-1, axis=1)[:,:top_k]
+        else:
+            index = np.tile(np.arange(deci_num), (size, 1))
+        sums = np.sum(deci_dist, axis=1)
+        probs = deci_dist[np.arange(size)[:,None], index] / sums[:,None]
+        return cls.from_entries(index, probs, 1.0 - np.sum(probs, axis=1), deci_num)
+    # draw the dense random numbers and keep the k largest, a block of rows at a time, the
+    # random numbers are the same as "random_state.rand(size, deci_num)"
+    @classmethod
+    def from_random(cls, random_state, size, deci_num, top_k, block_rows=256):
+        blocks = []
+        for start in range(0, size, block_rows):
+            rows = min(block_rows, size-start)
+            blocks.append(cls.from_dense(random_state.rand(rows, deci_num), top_k))
+        return cls.concatenate(blocks, deci_num, top_k)
+    @classmethod
+    def concatenate(cls, dists_list, deci_num, top_k):
+        if len(dists_list) == 0:
+            return cls(np.zeros((0, top_k)), np.zeros((0, top_k)), np.zeros(0), deci_num)
+        return cls(np.concatenate([dists.index for dists in dists_list]),
+                   np.concatenate([dists.probs for dists in dists_list]),
+                   np.concatenate([dists.residual for dists in dists_list]), deci_num)
+    # distributions of the selected nodes, by index array or boolean mask
+    def select(self, selected):
+        return TopKDists(self.index[selected], self.probs[selected], self.residual[selected],
+                         self.deci_num)
+    # replace the distributions of the selected nodes with the given ones
+    def assign(self, selected, dists):
+        self.index[selected] = dists.index
+        self.probs[selected] = dists.probs
+        self.residual[selected] = dists.residual
+    def copy(self):
+        return TopKDists(np.copy(self.index), np.copy(self.probs), np.copy(self.residual),
+                         self.deci_num)
+    # probability of each decision not listed
+    def levels(self):
+        unlisted = self.deci_num - np.sum(self.index >= 0, axis=1)
+        return np.where(unlisted > 0, self.residual / np.maximum(unlisted, 1), 0.0)
+    # discrete entropy of each node in bits, the unlisted decisions share the residual evenly
+    def entropy(self):
+        levels = self.levels()
+        unlisted = self.deci_num - np.sum(self.index >= 0, axis=1)
+        return (discrete_entropy(self.probs) -
+                unlisted * levels * np.log2(np.where(levels > 0, levels, 1.0)))
+    # dominant decision of each node, the smallest decision index among equal ones
+    def dominant(self):
+        tied = (self.probs == self.probs[:,:1]) & (self.index >= 0)
+        return np.min(np.where(tied, self.index, self.deci_num), axis=1)
+    # average distribution of all nodes, as dense array of the decisions
+    def mean(self):
+        listed = self.index >= 0
+        diffs = (self.probs - self.levels()[:,None])[listed]
+        return np.mean(self.levels()) + np.bincount(self.index[listed],
+            weights=diffs, minlength=self.deci_num) / self.size
+    def to_dense(self):
+        deci_dist = np.repeat(self.levels()[:,None], self.deci_num, axis=1)
+        listed = self.index >= 0
+        deci_dist[np.nonzero(listed)[0], self.index[listed]] = self.probs[listed]
+        return deci_dist
+
+# weighted average of the distributions over the blocks, same as the dense sum over blocks,
+# then the k largest of each average are kept and the rest goes to the residual
+def topk_block_average(block_ptr, block_index, dists, weights):
+    block_num = len(block_ptr) - 1
+    if block_num == 0: return dists.select(np.zeros(0, dtype=int))
+    block_rows = np.repeat(np.arange(block_num), np.diff(block_ptr))
+    weights = np.asarray(weights, dtype=float)
+    weight_sums = np.add.reduceat(weights, block_ptr[:-1])
+    # all decisions start from the weighted sum of the levels, then the listed decisions add
+    # their differences from the levels
+    levels = dists.levels()[block_index]
+    bases = np.add.reduceat(weights * levels, block_ptr[:-1])
+    listed = dists.index[block_index] >= 0
+    entry_rows = np.repeat(block_rows[:,None], dists.top_k, axis=1)[listed]
+    entry_deci = dists.index[block_index][listed]
+    entry_values = (weights[:,None] * (dists.probs[block_index] - levels[:,None]))[listed]
+    # sum the values of same decision in same block
+    keys, inverse = np.unique(entry_rows * dists.deci_num + entry_deci, return_inverse=True)
+    values = np.bincount(inverse, weights=entry_values, minlength=len(keys))
+    rows = keys // dists.deci_num
+    values = (bases[rows] + values) / weight_sums[rows]
+    # keep the k largest of each block
+    order = np.lexsort((-values, rows))
+    rows = rows[order]
+    row_starts = np.searchsorted(rows, np.arange(block_num))
+    ranks = np.arange(len(rows)) - row_starts[rows]
+    kept = ranks < dists.top_k
+    index = -np.ones((block_num, dists.top_k), dtype=int)
+    probs = np.zeros((block_num, dists.top_k))
+    index[rows[kept], ranks[kept]] = (keys % dists.deci_num)[order][kept]
+    probs[rows[kept], ranks[kept]] = values[order][kept]
+    return TopKDists.from_entries(index, probs, 1.0 - np.sum(probs, axis=1), dists.deci_num)
+
+# sum of absolute differences of all probabilities between pairs of sparse distributions,
+# each side given as (index, probs, levels) of the pairs
+def topk_pair_diffs(side_a, side_b, deci_num):
+    pair_num = len(side_a[0])
+    pair_ids = np.repeat(np.arange(pair_num)[:,None], side_a[0].shape[1], axis=1)
+    terms = []
+    matched_nums = []
+    for (index_1, probs_1, levels_1), (index_2, probs_2, levels_2) in (
+            (side_a, side_b), (side_b, side_a)):
+        listed_1 = index_1 >= 0
+        listed_2 = index_2 >= 0
+        keys_1 = (pair_ids * deci_num + index_1)[listed_1]
+        keys_2 = (pair_ids * deci_num + index_2)[listed_2]
+        order_2 = np.argsort(keys_2)
+        keys_2 = keys_2[order_2]
+        # find the listed decisions of side 1 in side 2, or take the level of side 2
+        found = np.minimum(np.searchsorted(keys_2, keys_1), max(len(keys_2)-1, 0))
+        matched = np.zeros(len(keys_1), dtype=bool)
+        if len(keys_2) != 0:
+            matched = keys_2[found] == keys_1
+        values_2 = levels_2[pair_ids[listed_1]]
+        values_2[matched] = probs_2[listed_2][order_2][found[matched]]
+        diffs = np.abs(probs_1[listed_1] - values_2)
+        if len(terms) == 1:
+            diffs[matched] = 0.0  # decisions listed on both sides are counted once
+        terms.append(np.bincount(pair_ids[listed_1], weights=diffs, minlength=pair_num))
+        matched_nums.append(np.bincount(pair_ids[listed_1], weights=matched,
+                                        minlength=pair_num))
+    # the decisions listed on neither side differ by the difference of the levels
+    unions = (np.sum(side_a[0] >= 0, axis=1) + np.sum(side_b[0] >= 0, axis=1) -
+              matched_nums[0])
+    return terms[0] + terms[1] + (deci_num - unions) * np.abs(side_a[2] - side_b[2])
+
+# block_diff_max() for sparse distributions
+def topk_block_diff_max(block_ptr, block_index, dists, selected, dists_old=None):
+    firsts, seconds, block_rows = block_pairs(block_ptr, selected)
+    sides = []
+    levels = dists.levels()
+    if dists_old is not None: levels_old = dists_old.levels()
+    for entries in (firsts, seconds):
+        nodes = block_index[entries]
+        index = dists.index[nodes]
+        probs = dists.probs[nodes]
+        levels_temp = levels[nodes]
+        if dists_old is not None:
+            later = nodes > block_rows[entries]
+            index[later] = dists_old.index[nodes[later]]
+            probs[later] = dists_old.probs[nodes[later]]
+            levels_temp[later] = levels_old[nodes[later]]
+        sides.append((index, probs, levels_temp))
+    dist_diff = topk_pair_diffs(sides[0], sides[1], dists.deci_num)
+    return pairs_max(block_rows[firsts], dist_diff, len(block_ptr)-1)
+
+# linear_multiply() for sparse distributions
+# The decisions not listed share the lowest multipliers in ascending order, their residual is
+# multiplied by the average of those multipliers.
+def topk_linear_multiply(dists, dist_diff_ratio, dist_diff_power):
+    deci_num = dists.deci_num
+    small_end = 1.0/deci_num * np.power(dist_diff_ratio, dist_diff_power)
+    large_end = 2.0/deci_num - small_end
+    step = (large_end - small_end) / (deci_num - 1.0)
+    unlisted = deci_num - np.sum(dists.index >= 0, axis=1)
+    # listed probabilities are in descending order, the first one takes the largest multiplier
+    multipliers = (small_end[:,None] + step[:,None] *
+                   (deci_num - 1 - np.arange(dists.top_k))[None,:])
+    probs = dists.probs * multipliers
+    residual = dists.residual * (small_end + step * (unlisted - 1) / 2.0)
+    sums = np.sum(probs, axis=1) + residual
+    return TopKDists(dists.index, probs / sums[:,None], residual / sums, deci_num)
+
+# consensus_step() for sparse distributions, return the new TopKDists and the converged flags
+def topk_consensus_step(connections, dists, deci_domi, group_sizes,
+                        dist_diff_thres, dist_diff_power, converged=None, active=None):
+    deci_domi = np.asarray(deci_domi)
+    if converged is None:
+        converged = ConvergenceTracker(connections, deci_domi).converged()
+    if active is None:
+        active = np.ones(connections.size, dtype=bool)
+    block_ptr, block_index = neighbor_blocks(connections)
+    active_ptr, active_index, active_rows = active_blocks(block_ptr, block_index, active)
+    weights = np.where(converged[active_rows], 1.0,
+                       np.asarray(group_sizes, dtype=float)[active_index])
+    dists_new = dists.copy()
+    dists_new.assign(active, topk_block_average(active_ptr, active_index, dists, weights))
+    levels = update_levels(connections, converged & active)
+    for level in range(np.max(levels)+1 if connections.size != 0 else 0):
+        selected = converged & active & (levels == level)
+        dist_diff_max = topk_block_diff_max(block_ptr, block_index, dists_new, selected, dists)
+        multiplied = (dist_diff_max >= 0) & (dist_diff_max < dist_diff_thres)
+        if np.any(multiplied):
+            dists_temp = topk_linear_multiply(dists_new.select(multiplied),
+                dist_diff_max[multiplied]/dist_diff_thres, dist_diff_power)
+            dists_new.assign(multiplied, dists_temp)
+    return dists_new, converged
+
+# Active-set scheduling:
+# Once the local groups are formed, most nodes only sharpen their distributions a little bit
+# every step. A node is updated only if itself or a neighbor moved more than "epsilon" in last
+# step, measured as the sum of absolute differences of all probabilities, or if the group
+# sizes or the convergence changed around it. The other nodes keep their distributions, so the
+# work follows the moving front of the consensus. The number of skipped updates is counted.
+# The nodes are in parts of "part_size" one after another, like the trials of a batch. If
+# nothing is marked in a part, all its nodes are updated, otherwise it would freeze before
+# reaching the consensus.
+class ActiveSet(object):
+    def __init__(self, connections, epsilon, part_size=None):
+        self.connections = connections
+        self.epsilon = epsilon
+        self.part_size = part_size if part_size is not None else connections.size
+        self.conn_rows = connections.row_index()
+        self.moved = np.ones(connections.size, dtype=bool)  # all nodes move at start
+        self.active = np.ones(connections.size, dtype=bool)
+        self.group_sizes = None  # group sizes and convergence of the nodes in last step
+        self.converged = None
+        self.skipped = 0  # node updates skipped in last step
+        self.skipped_total = 0  # node updates skipped in all steps
+    # choose the nodes to update in next step, given the group size each node is in and the
+    # convergence of the nodes for next step; return the active flags
+    def schedule(self, group_sizes, converged):
+        group_sizes = np.array(group_sizes)
+        converged = np.array(converged, dtype=bool)
+        marked = np.copy(self.moved)
+        if self.group_sizes is not None:
+            marked = marked | (group_sizes != self.group_sizes) | (converged != self.converged)
+        self.group_sizes = group_sizes
+        self.converged = converged
+        if self.part_size != 0:
+            frozen = ~np.any(marked.reshape(-1, self.part_size), axis=1)
+            marked = marked | np.repeat(frozen, self.part_size)
+        self.active = np.copy(marked)
+        self.active[self.conn_rows[marked[self.connections.col_index]]] = True
+        self.skipped = int(self.connections.size - np.count_nonzero(self.active))
+        self.skipped_total = self.skipped_total + self.skipped
+        return self.active
+    # record which nodes moved in the step, from the distributions before and after it
+    def record(self, deci_dist_old, deci_dist_new):
+        moves = np.zeros(self.connections.size)
+        active = np.nonzero(self.active)[0]
+        if isinstance(deci_dist_new, TopKDists):
+            dists_old = deci_dist_old.select(active)
+            dists_new = deci_dist_new.select(active)
+            moves[active] = topk_pair_diffs(
+                (dists_old.index, dists_old.probs, dists_old.levels()),
+                (dists_new.index, dists_new.probs, dists_new.levels()), dists_new.deci_num)
+        else:
+            moves[active] = np.sum(np.abs(deci_dist_new[active] - deci_dist_old[active]),
+                                   axis=1)
+        self.moved = moves > self.epsilon
+    # keep only the selected nodes, when the network is reduced to them
+    def select(self, selected, connections):
+        self.connections = connections
+        self.conn_rows = connections.row_index()
+        self.moved = self.moved[selected]
+        self.active = self.active[selected]
+        if self.group_sizes is not None:
+            self.group_sizes = self.group_sizes[selected]
+            self.converged = self.converged[selected]
+
+# run many trials of the probabilistic consensus on the same network together
+# The trials are copies of the network side by side, so one consensus step updates all of
+# them. A trial is retired from the batch once it converges.
+# "deci_dists" is the initial distributions of shape (trials, nodes, decisions), or a
+# TopKDists of the nodes of all trials one after another; if "epsilon" is given, the nodes are
+# updated by active-set scheduling, see ActiveSet; if "metrics" is given, like a MetricsWriter
+# from metrics_functions.py, the entropy and groups of every running trial are written to it
+# after each step
+# return the steps taken to converge and the final decision of each trial, and the number of
+# node updates skipped by the active-set scheduling
+def consensus_trials(connections, deci_dists, dist_diff_thres, dist_diff_power,
+                     epsilon=None, metrics=None, verbose=False):
+    net_size = connections.size
+    sparse = isinstance(deci_dists, TopKDists)
+    if sparse:
+        trial_num = deci_dists.size // net_size
+        step_function = topk_consensus_step
+    else:
+        trial_num, net_size, deci_num = np.shape(deci_dists)
+        deci_dists = np.asarray(deci_dists, dtype=float).reshape(trial_num*net_size, deci_num)
+        step_function = consensus_step
+    all_steps = np.zeros(trial_num, dtype=int)
+    all_decisions = np.zeros(trial_num, dtype=int)
+    trials = np.arange(trial_num)  # trials still running
+    connections_all = connections.tile(trial_num)
+    tracker = None
+    active_set = None
+    if epsilon is not None:
+        active_set = ActiveSet(connections_all, epsilon, net_size)
+    iter_count = 0
+    while len(trials) != 0:
+        if sparse:
+            deci_domi = deci_dists.dominant()
+        else:
+            deci_domi = np.argmax(deci_dists, axis=1)
+        if tracker is None:
+            tracker = ConvergenceTracker(connections_all, deci_domi)
+        else:
+            tracker.update(deci_domi)
+        group_labels, group_lens, group_deci = consensus_groups(connections_all, deci_domi)
+        group_sizes = group_lens[group_labels]
+        converged = tracker.converged()
+        active = None
+        if active_set is not None:
+            active = active_set.schedule(group_sizes, converged)
+        deci_dists_new, converged = step_function(connections_all, deci_dists, deci_domi,
+            group_sizes, dist_diff_thres, dist_diff_power, converged, active)
+        if active_set is not None:
+            active_set.record(deci_dists, deci_dists_new)
+        deci_dists = deci_dists_new
+        if metrics is not None:
+            if sparse:
+                entropy = deci_dists.entropy()
+            else:
+                entropy = discrete_entropy(deci_dists)
+            group_nums, group_maxs = group_metrics(group_labels, group_lens, net_size)
+            metrics.write(trials, iter_count, entropy.reshape(len(trials), net_size),
+                          group_nums, group_maxs)
+        # retire the converged trials, a trial has converged with no disagreeing connections
+        trial_disagree = np.sum(tracker.disagree_nums.reshape(len(trials), net_size), axis=1)
+        finished = trial_disagree == 0
+        all_steps[trials[finished]] = iter_count
+        all_decisions[trials[finished]] = deci_domi.reshape(len(trials), net_size)[finished,0]
+        if np.any(finished):
+            running = np.repeat(~finished, net_size)
+            if sparse:
+                deci_dists = deci_dists.select(running)
+            else:
+                deci_dists = deci_dists[running]
+            trials = trials[~finished]
+            connections_all = connections.tile(len(trials))
+            tracker = None  # start again on the remaining trials
+            if active_set is not None:
+                active_set.select(running, connections_all)
+        if verbose:
+            if active_set is not None:
+                print("iteration {}, {} trials running, {} updates skipped".format(
+                    iter_count, len(trials), active_set.skipped))
+            else:
+                print("iteration {}, {} trials running".format(iter_count, len(trials)))
+        iter_count = iter_count + 1
+    skipped_total = active_set.skipped_total if active_set is not None else 0
+    return all_steps, all_decisions, skipped_total
@@ -68,6 +68,10 @@ from __future__ import print_function
 import pygame
 import sys, os, getopt, math, random
 import numpy as np
+from neighbor_functions import *
+from motion_functions import *
+from consensus_functions import *
+from relay_functions import *
 import pickle  # for storing variables
 
 swarm_size = 30  # default size of the swarm
@@ -134,29 +138,27 @@ force_shape_set = range(shape_quantity)
 
 # robot properties
 robot_poses = np.random.rand(swarm_size, 2) * world_side_length  # initialize the robot poses
-dist_table = np.zeros((swarm_size, swarm_size))  # distances between robots
-conn_table = np.zeros((swarm_size, swarm_size))  # connections between robots
-    # 0 for disconnected, 1 for connected
+dist_table = LazyDistTable(robot_poses)  # distances between robots, calculated when read
+conn_table = CSRConnections.from_pairs([], [], swarm_size)  # sparse connections between robots
+    # conn_table[i,j] is 0 for disconnected, 1 for connected
 conn_lists = [[] for i in range(swarm_size)]  # lists of robots connected
+# incremental neighbor lists, for simulation 1 and 4 where most in-group robots stay still
+# the candidate pairs of a robot are only searched again after it moved half of the skin
+verlet_mode = True  # False to search all connected pairs with the grid every time
+verlet_skin = 0.2  # skin radius of the neighbor lists, larger than step moving distance
+verlet_neighbors = VerletNeighbors(comm_range, verlet_skin)
 # function for all simulations, update the distances and connections between the robots
+# the connected pairs are found with a uniform grid, instead of checking every pair of robots
 def dist_conn_update():
-    global dist_table
     global conn_table
     global conn_lists
-    conn_lists = [[] for i in range(swarm_size)]  # empty the lists
-    for i in range(swarm_size):
-        for j in range(i+1, swarm_size):
-            dist_temp = np.linalg.norm(robot_poses[i] - robot_poses[j])
-            dist_table[i,j] = dist_temp
-            dist_table[j,i] = dist_temp
-            if dist_temp > comm_range:
-                conn_table[i,j] = 0
-                conn_table[j,i] = 0
-            else:
-                conn_table[i,j] = 1
-                conn_table[j,i] = 1
-                conn_lists[i].append(j)
-                conn_lists[j].append(i)
+    if verlet_mode:
+        pairs_i, pairs_j, pairs_dist = verlet_neighbors.update(robot_poses)
+    else:
+        pairs_i, pairs_j, pairs_dist = grid_pairs(robot_poses, comm_range)
+    dist_table.update(robot_poses)
+    conn_table = CSRConnections.from_pairs(pairs_i, pairs_j, swarm_size, pairs_dist)
+    conn_lists = conn_table.to_lists()
 dist_conn_update()  # update the distances and connections
 disp_poses = []  # display positions
 # function for all simulations, update the display positions
@@ -261,6 +263,18 @@ def S14_closest_robot(robot_host, robot_neighbors):
             dist_closest = dist_temp
     return robot_closest
 
+# closest state '0' robot in range for every state '0' robot, -1 if there is none
+# The robots are queried together through the grid, instead of each state '0' robot scanning
+# its connections through the distance table. Ties go to the smaller index, like above.
+# use global variables "robot_poses", "robot_states", "swarm_size", "comm_range"
+def S14_closest_state0():
+    state0_mask = robot_states == 0
+    state0_robots = np.nonzero(state0_mask)[0]
+    state0_closest = -np.ones(swarm_size, dtype=int)
+    state0_closest[state0_robots] = SpatialQuery(robot_poses, comm_range).nearest_within(
+        state0_robots, comm_range, state0_mask)
+    return state0_closest
+
 # general function to normalize a numpy vector
 def normalize(v):
     norm = np.linalg.norm(v)
@@ -276,49 +290,6 @@ def reset_radian(radian):
         radian = radian + 2*math.pi
     return radian
 
-# general function to steer robot away from wall if out of boundary (following physics)
-# use global variable "world_side_length"
-def robot_boundary_check(robot_pos, robot_ori):
-    new_ori = robot_ori
-    if robot_pos[0] >= world_side_length:  # outside of right boundary
-        if math.cos(new_ori) > 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            # further check if new angle is too much perpendicular
-            if new_ori > 0:
-                if (math.pi - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-            else:
-                if (new_ori + math.pi) < perp_thres:
-                    new_ori = new_ori + devia_angle
-    elif robot_pos[0] <= 0:  # outside of left boundary
-        if math.cos(new_ori) < 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            if new_ori > 0:
-                if new_ori < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    if robot_pos[1] >= world_side_length:  # outside of top boundary
-        if math.sin(new_ori) > 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > -math.pi/2:
-                if (new_ori + math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    elif robot_pos[1] <= 0:  # outside of bottom boundary
-        if math.sin(new_ori) < 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > math.pi/2:
-                if (new_ori - math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    return new_ori
-
 # # general function to steer robot away from wall if out of boundary (in random direction)
 # # use global variable "world_side_length"
 # def robot_boundary_check(robot_pos, robot_ori):
@@ -447,6 +418,7 @@ while True:
 
         # update the "relations" of the robots
         dist_conn_update()
+        state0_closest = S14_closest_state0()  # for state '0' robots forming new groups
         # check any state transition, and schedule the tasks
         for i in range(swarm_size):
             if robot_states[i] == -1:  # for host robot with state '-1'
@@ -491,7 +463,7 @@ while True:
                 elif len(state0_list) != 0:
                     # there is no robot '1', but has robot '0'
                     # find the closest robot, schedule to start a new group with it
-                    st_0to1_new[i] = S14_closest_robot(i, state0_list)
+                    st_0to1_new[i] = int(state0_closest[i])
             elif robot_states[i] == 1:  # for host robot with state '1'
                 conn_temp  = conn_lists[i][:]  # a list of connections with only state '1'
                 has_other_group = False  # whether there is robot '1' from other group
@@ -569,60 +541,49 @@ while True:
             else:
                 groups[group_id_temp][2] = False
 
-        # local connection lists for state '1' robots
-        local_conn_lists = [[] for i in range(swarm_size)]  # connections in same group
+        # local connections in same group for state '1' robots, as a list of directed edges
+        conn_rows = conn_table.row_index()
+        local_conn = conn_table.select((robot_states[conn_rows] == 1) &
+            (robot_states[conn_table.col_index] == 1) &
+            (robot_group_ids[conn_rows] == robot_group_ids[conn_table.col_index]))
+        local_conn_lists = local_conn.to_lists()  # connections in same group
+        local_nums = local_conn.degrees()
         robot_poses_t = np.copy(robot_poses)  # as old poses
+        robot_moves = np.ones(swarm_size, dtype=bool)  # robots to be moved in this step
         # update the physics
-        for i in range(swarm_size):
-            # change move direction only for robot '1', for adjusting location in group
-            if robot_states[i] == 1:
-                # find the neighbors in the same group
-                host_group_id = robot_group_ids[i]
-                for j in conn_lists[i]:
-                    if (robot_states[j] == 1) and (robot_group_ids[j] == host_group_id):
-                        local_conn_lists[i].append(j)
-                if len(local_conn_lists[i]) == 0:  # should not happen after parameter tuning
-                    printf("robot {} loses its group {}".format(i, host_group_id))
-                    sys.exit()
-                # calculating the moving direction, based on neighbor situation
-                if (len(local_conn_lists[i]) == 1) and (len(groups[host_group_id][0]) > 2):
-                    # If the robot has only one neighbor, and it is not the case that the group
-                    # has only members, then the robot will try to secure another neighbor, by
-                    # rotating counter-clockwise around this only neighbor.
-                    center = local_conn_lists[i][0]  # the center robot
-                    # use the triangle of (desired_space, dist_table[i,center], step_moving_dist)
-                    if dist_table[i,center] > (desired_space + step_moving_dist):
-                        # moving toward the center robot
-                        robot_oris[i] = math.atan2(robot_poses_t[center,1] - robot_poses_t[i,1],
-                            robot_poses_t[center,0] - robot_poses_t[i,0])
-                    elif (dist_table[i,center] + step_moving_dist) < desired_space:
-                        # moving away from the center robot
-                        robot_oris[i] = math.atan2(robot_poses_t[i,1] - robot_poses_t[center,1],
-                            robot_poses_t[i,0] - robot_poses_t[center,0])
-                    else:
-                        # moving tangent along the circle of radius of "desired_space"
-                        robot_oris[i] = math.atan2(robot_poses_t[i,1] - robot_poses_t[center,1],
-                            robot_poses_t[i,0] - robot_poses_t[center,0])
-                        # interior angle between dist_table[i,center] and step_moving_dist
-                        int_angle_temp = math.acos((math.pow(dist_table[i,center],2) +
-                            math.pow(step_moving_dist,2) - math.pow(desired_space,2)) /
-                            (2.0*dist_table[i,center]*step_moving_dist))
-                        robot_oris[i] = reset_radian(robot_oris[i] + (math.pi - int_angle_temp))
-                else:  # the normal situation
-                    # calculate the moving vector, and check if destination is within error range
-                    mov_vec = np.zeros(2)
-                    for j in local_conn_lists[i]:  # accumulate the influence from all neighbors
-                        mov_vec = mov_vec + (mov_vec_ratio * (dist_table[i,j] - desired_space) *
-                            normalize(robot_poses_t[j] - robot_poses_t[i]))
-                    if np.linalg.norm(mov_vec) < destination_error:
-                        continue  # skip the physics update if within destination error
-                    else:
-                        robot_oris[i] = math.atan2(mov_vec[1], mov_vec[0])  # change direction
-            # check if out of boundaries
-            robot_oris[i] = robot_boundary_check(robot_poses_t[i], robot_oris[i])
-            # update one step of move
-            robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
-                np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+        # change move direction only for robot '1', for adjusting location in group
+        state1_robots = robot_states == 1
+        for i in np.nonzero(state1_robots & (local_nums == 0))[0]:
+            # should not happen after parameter tuning
+            print("robot {} loses its group {}".format(i, robot_group_ids[i]))
+            sys.exit()
+        group_sizes = np.zeros(swarm_size, dtype=int)  # size of the group a robot is in
+        for group_id_temp in groups.keys():
+            group_sizes[groups[group_id_temp][0]] = len(groups[group_id_temp][0])
+        # calculating the moving direction, based on neighbor situation
+        # If the robot has only one neighbor, and it is not the case that the group has only
+        # members, then the robot will try to secure another neighbor, by rotating
+        # counter-clockwise around this only neighbor.
+        orbit_robots = state1_robots & (local_nums == 1) & (group_sizes > 2)
+        orbit_entries = local_conn.row_ptr[:-1][orbit_robots]  # the only entry of each robot
+        robot_oris[orbit_robots] = orbit_oris(robot_poses_t, np.nonzero(orbit_robots)[0],
+            local_conn.col_index[orbit_entries], local_conn.edge_dists[orbit_entries],
+            desired_space, step_moving_dist)
+        # the normal situation
+        # calculate the moving vectors, and check if destination is within error range
+        normal_robots = state1_robots & ~orbit_robots
+        mov_vecs = spring_vectors(robot_poses_t, local_conn.row_index(), local_conn.col_index,
+            local_conn.edge_dists, desired_space, mov_vec_ratio)
+        mov_norms = np.sqrt(mov_vecs[:,0]*mov_vecs[:,0] + mov_vecs[:,1]*mov_vecs[:,1])
+        robot_moves[normal_robots & (mov_norms < destination_error)] = False  # within error
+        normal_robots = normal_robots & robot_moves
+        robot_oris[normal_robots] = np.arctan2(mov_vecs[normal_robots,1],
+            mov_vecs[normal_robots,0])  # change direction
+        # check if out of boundaries, and update one step of move for all moving robots
+        robot_oris[robot_moves] = robot_boundary_check_all(robot_poses_t[robot_moves],
+            robot_oris[robot_moves], world_side_length, perp_thres, devia_angle)
+        robot_poses[robot_moves] = robot_move_all(robot_poses_t[robot_moves],
+            robot_oris[robot_moves], step_moving_dist)
 
         # update the graphics
         disp_poses_update()
@@ -646,14 +607,12 @@ while True:
                 color_group = color_black
             else:
                 color_group = color_grey
-            conn_draw_sets = []  # avoid draw same connection two times
             # draw the robots and connections in the group
             for i in groups[group_id_temp][0]:
                 for j in local_conn_lists[i]:
-                    if set([i,j]) not in conn_draw_sets:
+                    if j > i:  # each connection drawn once
                         pygame.draw.line(screen, color_group, disp_poses[i],
                             disp_poses[j], conn_width_formation)
-                        conn_draw_sets.append(set([i,j]))
                 # draw robots in the group
                 if robot_seeds[i]:  # force color red for seed robot
                     pygame.draw.circle(screen, color_red, disp_poses[i],
@@ -709,8 +668,8 @@ while True:
     screen.fill(color_white)
     for i in range(swarm_size):
         pygame.draw.circle(screen, color_black, disp_poses[i], robot_size_consensus, 0)
-        for j in range(i+1, swarm_size):
-            if conn_table[i,j]:
+        for j in conn_lists[i]:
+            if j > i:  # each connection drawn once
                 pygame.draw.line(screen, color_black, disp_poses[i], disp_poses[j],
                     conn_width_thin_consensus)
     pygame.display.update()
@@ -722,6 +681,8 @@ while True:
     for i in range(swarm_size):
         deci_dist[i] = deci_dist[i] / sum_temp[i]
     deci_domi = np.argmax(deci_dist, axis=1)
+    # disagreeing connections, updated only for the robots changing their dominant decision
+    tracker = ConvergenceTracker(conn_table, deci_domi)
     groups = []  # robots reach local consensus are in same group
     robot_group_sizes = [0 for i in range(swarm_size)]  # group size for each robot
     # color assignments for the robots and decisions
@@ -768,47 +729,12 @@ while True:
 
         # 1.update the dominant decision for all robots
         deci_domi = np.argmax(deci_dist, axis=1)
+        tracker.update(deci_domi)
 
         # 2.update the groups
-        groups = []  # empty the group container
-        group_deci = []  # the exhibited decision of the groups
-        robot_pool = range(swarm_size)  # a robot pool, to be assigned into groups
-        while len(robot_pool) != 0:  # searching groups one by one from the global robot pool
-            # start a new group, with first robot in the robot_pool
-            first_member = robot_pool[0]  # first member of this group
-            group_temp = [first_member]  # current temporary group
-            robot_pool.pop(0)  # pop out first robot in the pool
-            # a list of potential members for current group
-            # this list may increase when new members of group are discovered
-            p_members = list(conn_lists[first_member])
-            # an index for iterating through p_members, in searching group members
-            p_index = 0  # if it climbs to the end, the searching ends
-            # index of dominant decision for current group
-            current_domi = deci_domi[first_member]
-            # dynamically iterating through p_members with p_index
-            while p_index < len(p_members):  # index still in valid range
-                if deci_domi[p_members[p_index]] == current_domi:
-                    # a new member has been found
-                    new_member = p_members[p_index]  # get index of the new member
-                    p_members.remove(new_member)  # remove it from p_members list
-                        # but not increase p_index, because new value in p_members will flush in
-                    robot_pool.remove(new_member)  # remove it from the global robot pool
-                    group_temp.append(new_member)  # add it to current group
-                    # check if new potential members are available, due to new robot discovery
-                    p_members_new = conn_lists[new_member]  # new potential members
-                    for member in p_members_new:
-                        if member not in p_members:  # should not already in p_members
-                            if member not in group_temp:  # should not in current group
-                                if member in robot_pool:  # should be available in global pool
-                                    # if conditions satisfied, it is qualified as a potential member
-                                    p_members.append(member)  # append at the end
-                else:
-                    # a boundary robot(share different decision) has been met
-                    # leave it in p_members, will help to avoid checking back again on this robot
-                    p_index = p_index + 1  # shift right one position
-            # all connected members for this group have been located
-            groups.append(group_temp)  # append the new group
-            group_deci.append(deci_domi[first_member])  # append new group's exhibited decision
+        # the group index of each robot, the size and exhibited decision of each group
+        group_labels, group_lens, group_deci = consensus_groups(conn_table, deci_domi)
+        groups = group_lists(group_labels, len(group_lens))
         # update the colors for the exhibited decisions
         if not color_initialized:
             color_initialized = True
@@ -854,113 +780,30 @@ while True:
             group_colors.append(deci_colors[group_deci[i]])
 
         # 3.update the group size for each robot
-        for i in range(len(groups)):
-            size_temp = len(groups[i])
-            color_temp = group_colors[i]
-            for robot in groups[i]:
-                robot_group_sizes[robot] = size_temp
-                robot_colors[robot] = color_temp  # update the color for each robot
+        robot_group_sizes = group_lens[group_labels]
+        robot_colors = np.array(group_colors)[group_labels]  # update the color for each robot
 
         # the decision distribution evolution
-        converged_all = True  # flag for convergence of entire network
-        deci_dist_t = np.copy(deci_dist)  # deep copy of the 'deci_dist'
-        for i in range(swarm_size):
-            host_domi = deci_domi[i]
-            converged = True
-            for neighbor in conn_lists[i]:
-                if host_domi != deci_domi[neighbor]:
-                    converged = False
-                    break
-            # action based on convergence of dominant decision
-            if converged:  # all neighbors have converged with host
-                # step 1: take equally weighted average on all distributions
-                # including host and all neighbors
-                deci_dist[i] = deci_dist_t[i]*1.0  # start with host itself
-                for neighbor in conn_lists[i]:
-                    # accumulate neighbor's distribution
-                    deci_dist[i] = deci_dist[i] + deci_dist_t[neighbor]
-                # normalize the distribution such that sum is 1.0
-                sum_temp = np.sum(deci_dist[i])
-                deci_dist[i] = deci_dist[i] / sum_temp
-                # step 2: increase the unipolarity by applying the linear multiplier
-                # (this step is only for when all neighbors are converged)
-                # First find the largest difference between two distributions in this block
-                # of robots, including the host and all its neighbors.
-                comb_pool = [i] + list(conn_lists[i])  # add host to a pool with its neighbors
-                    # will be used to form combinations from this pool
-                comb_pool_len = len(comb_pool)
-                dist_diff = []
-                for j in range(comb_pool_len):
-                    for k in range(j+1, comb_pool_len):
-                        j_robot = comb_pool[j]
-                        k_robot = comb_pool[k]
-                        dist_diff.append(np.sum(abs(deci_dist[j_robot] - deci_dist[k_robot])))
-                dist_diff_max = max(dist_diff)  # maximum distribution difference of all
-                if dist_diff_max < dist_diff_thres:
-                    # distribution difference is small enough,
-                    # that linear multiplier should be applied to increase unipolarity
-                    dist_diff_ratio = dist_diff_max/dist_diff_thres
-                    # Linear multiplier is generated from value of smaller and larger ends, the
-                    # smaller end is positively related with dist_diff_ratio. The smaller the
-                    # maximum distribution difference, the smaller the dist_diff_ratio, and the
-                    # steeper the linear multiplier.
-                    # '1.0/shape_quantity' is the average value of the linear multiplier
-                    small_end = 1.0/shape_quantity * np.power(dist_diff_ratio, dist_diff_power)
-                    large_end = 2.0/shape_quantity - small_end
-                    # sort the magnitude of the current distribution
-                    dist_temp = np.copy(deci_dist[i])  # temporary distribution
-                    sort_index = range(shape_quantity)
-                    for j in range(shape_quantity-1):  # bubble sort, ascending order
-                        for k in range(shape_quantity-1-j):
-                            if dist_temp[k] > dist_temp[k+1]:
-                                # exchange values in 'dist_temp'
-                                temp = dist_temp[k]
-                                dist_temp[k] = dist_temp[k+1]
-                                dist_temp[k+1] = temp
-                                # exchange values in 'sort_index'
-                                temp = sort_index[k]
-                                sort_index[k] = sort_index[k+1]
-                                sort_index[k+1] = temp
-                    # applying the linear multiplier
-                    for j in range(shape_quantity):
-                        multiplier = small_end + float(j)/(shape_quantity-1) * (large_end-small_end)
-                        deci_dist[i][sort_index[j]] = deci_dist[i][sort_index[j]] * multiplier
-                    # normalize the distribution such that sum is 1.0
-                    sum_temp = np.sum(deci_dist[i])
-                    deci_dist[i] = deci_dist[i]/sum_temp
-                else:
-                    # not applying linear multiplier when distribution difference is large
-                    pass
-            else:  # at least one neighbor has different opinion with host
-                converged_all = False  # the network is not converged
-                # take unequal weights in the averaging process based on group sizes
-                deci_dist[i] = deci_dist_t[i]*robot_group_sizes[i]  # start with host itself
-                for neighbor in conn_lists[i]:
-                    # accumulate neighbor's distribution
-                    deci_dist[i] = deci_dist[i] + deci_dist_t[neighbor]*robot_group_sizes[neighbor]
-                # normalize the distribution
-                sum_temp = np.sum(deci_dist[i])
-                deci_dist[i] = deci_dist[i] / sum_temp
+        # all robots are updated together, see consensus_step() in consensus_functions.py
+        deci_dist, converged = consensus_step(conn_table, deci_dist, deci_domi,
+            robot_group_sizes, dist_diff_thres, dist_diff_power, tracker.converged())
+        converged_all = tracker.all_converged()  # flag for convergence of entire network
 
         # update the graphics
         screen.fill(color_white)
         # draw the regualr connecting lines
         for i in range(swarm_size):
-            for j in range(i+1, swarm_size):
-                if conn_table[i,j]:
+            for j in conn_lists[i]:
+                if j > i:  # each connection drawn once
                     pygame.draw.line(screen, color_black, disp_poses[i], disp_poses[j],
                         conn_width_thin_consensus)
         # draw the connecting lines marking the groups
-        for i in range(len(groups)):
-            group_len = len(groups[i])
-            for j in range(group_len):
-                for k in range(j+1, group_len):
-                    j_robot = groups[i][j]
-                    k_robot = groups[i][k]
-                    # check if two robots in one group is connected
-                    if conn_table[j_robot,k_robot]:
-                        pygame.draw.line(screen, distinct_color_set[group_colors[i]],
-                            disp_poses[j_robot], disp_poses[k_robot], conn_width_thick_consensus)
+        for i in range(swarm_size):
+            for j in conn_lists[i]:
+                # check if two connected robots are in one group
+                if j > i and group_labels[i] == group_labels[j]:
+                    pygame.draw.line(screen, distinct_color_set[robot_colors[i]],
+                        disp_poses[i], disp_poses[j], conn_width_thick_consensus)
         # draw the robots as dots
         for i in range(swarm_size):
             pygame.draw.circle(screen, distinct_color_set[robot_colors[i]],
@@ -988,87 +831,26 @@ while True:
     screen.fill(color_white)
     for i in range(swarm_size):
         pygame.draw.circle(screen, color_black, disp_poses[i], robot_size_consensus, 0)
-        for j in range(i+1, swarm_size):
-            if conn_table[i,j]:
+        for j in conn_lists[i]:
+            if j > i:  # each connection drawn once
                 pygame.draw.line(screen, color_black, disp_poses[i], disp_poses[j],
                     conn_width_thin_consensus)
     pygame.display.update()
 
     # calculate the gradient map for message transmission
-    gradients = np.copy(conn_table)  # build gradient map on connection map
-    pool_gradient = 1  # gradients of the connections in the pool
-    pool_conn = {}
-    for i in range(swarm_size):
-        pool_conn[i] = conn_lists[i][:]  # start with gradient 1 connections
-    while len(pool_conn.keys()) != 0:
-        source_deactivate = []
-        for source in pool_conn:
-            targets_temp = []  # the new targets
-            for target in pool_conn[source]:
-                for target_new in conn_lists[target]:
-                    if target_new == source: continue  # skip itself
-                    if gradients[source, target_new] == 0:
-                        gradients[source, target_new] = pool_gradient + 1
-                        targets_temp.append(target_new)
-            if len(targets_temp) == 0:
-                source_deactivate.append(source)
-            else:
-                pool_conn[source] = targets_temp[:]  # update with new targets
-        for source in source_deactivate:
-            pool_conn.pop(source)  # remove the finished sources
-        pool_gradient = pool_gradient + 1
-    # calculate the relative gradient values
-    gradients_rel = []
-        # gradients_rel[i][j,k] refers to gradient of k relative to j with message source i
-    for i in range(swarm_size):  # message source i
-        gradient_temp = np.zeros((swarm_size, swarm_size))
-        for j in range(swarm_size):  # in the view point of j
-            gradient_temp[j] = gradients[i] - gradients[i,j]
-        gradients_rel.append(gradient_temp)
+    gradients = relay_gradients(conn_table)
     # list the neighbors a robot can send message to regarding a message source
-    neighbors_send = [[[] for j in range(swarm_size)] for i in range(swarm_size)]
-        # neighbors_send[i][j][k] means, if message from source i is received in j,
-        # it should be send to k
-    for i in range(swarm_size):  # message source i
-        for j in range(swarm_size):  # in the view point of j
-            for neighbor in conn_lists[j]:
-                if gradients_rel[i][j,neighbor] == 1:
-                    neighbors_send[i][j].append(neighbor)
-
-    # initialize the role assignment variables
+    relay_targets = RelayTargets.from_gradients(conn_table, gradients)
+        # relay_targets[i,j] is the robots to send to, if message from source i is received in j
+
+    # initialize the role assignment variables, see RoleAssignment in relay_functions.py
     # preference distribution of all robots
     pref_dist = np.random.rand(swarm_size, swarm_size)  # no need to normalize it
-    initial_roles = np.argmax(pref_dist, axis=1)  # the chosen role
-    # the local assignment information
-    local_role_assignment = [[[-1, 0, -1] for j in range(swarm_size)] for i in range(swarm_size)]
-        # local_role_assignment[i][j] is local assignment information of robot i for robot j
-        # first number is chosen role, second is probability, third is time stamp
-    local_robot_assignment = [[[] for j in range(swarm_size)] for i in range(swarm_size)]
-        # local_robot_assignment[i][j] is local assignment of robot i for role j
-        # contains a list of robots that choose role j
-    # populate the chosen role of itself to the local assignment information
-    for i in range(swarm_size):
-        local_role_assignment[i][i][0] = initial_roles[i]
-        local_role_assignment[i][i][1] = pref_dist[i, initial_roles[i]]
-        local_role_assignment[i][i][2] = 0
-        local_robot_assignment[i][initial_roles[i]].append(i)
-
-    # received message container for all robots
-    message_rx = [[] for i in range(swarm_size)]
-    # for each message entry, it containts:
-        # message[0]: ID of message source
-        # message[1]: its preferred role
-        # message[2]: probability of chosen role
-        # message[3]: time stamp
-    # all robots transmit once their chosen role before the loop
-    transmission_total = 0  # count message transmissions for each iteration
-    iter_count = 0  # also used as time stamp in message
-    for source in range(swarm_size):
-        chosen_role = local_role_assignment[source][source][0]
-        message_temp = [source, chosen_role, pref_dist[source, chosen_role], iter_count]
-        for target in conn_lists[source]:  # send to all neighbors
-            message_rx[target].append(message_temp)
-            transmission_total = transmission_total + 1
+    # all robots transmit once their chosen role when initialized
+    assignment = RoleAssignment(conn_table, relay_targets, pref_dist)
+        # assignment.local_roles[i,j] is the role of robot j known by robot i
+        # assignment.role_counts[i,j] is the number of robots choosing role j known by robot i
+    scheme_converged = assignment.scheme_converged
     role_color = [0 for i in range(swarm_size)]  # colors for a conflicting role
     # Dynamically manage color for conflicting robots is unnecessarily complicated, might just
     # assign the colors in advance.
@@ -1084,13 +866,6 @@ while True:
             color_index_pool = range(color_quantity)
             random.shuffle(color_index_pool)
 
-    # flags
-    transmit_flag = [[False for j in range(swarm_size)] for i in range(swarm_size)]
-        # whether robot i should transmit received message of robot j
-    change_flag = [False for i in range(swarm_size)]
-        # whether robot i should change its chosen role
-    scheme_converged = [False for i in range(swarm_size)]
-
     # the loop for simulation 3
     sim_haulted = False
     time_last = pygame.time.get_ticks()
@@ -1098,7 +873,7 @@ while True:
     time_period = 2000  # not frame_period
     sim_freq_control = True
     flash_delay = 200
-    sys.stdout.write("iteration {}".format(iter_count))
+    sys.stdout.write("iteration {}".format(assignment.iter_count))
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:  # close window button is clicked
@@ -1117,112 +892,32 @@ while True:
             else:
                 continue
 
-        # increase iteration count
-        iter_count = iter_count + 1
-        sys.stdout.write("\riteration {}".format(iter_count))
-        sys.stdout.flush()
-
-        # process the received messages
-        # transfer messages to the processing buffer, then empty the message receiver
-        message_rx_buf = [[[k for k in j] for j in i] for i in message_rx]
-        message_rx = [[] for i in range(swarm_size)]
-        yield_robots = []  # the robots that are yielding on chosen roles
-        yield_roles = []  # the old roles of yield_robots before yielding
-        for i in range(swarm_size):  # messages received by robot i
-            for message in message_rx_buf[i]:
-                source = message[0]
-                role = message[1]
-                probability = message[2]
-                time_stamp = message[3]
-                if source == i:
-                    print("error, robot {} receives message of itself".format(i))
-                    sys.exit()
-                if time_stamp > local_role_assignment[i][source][2]:
-                    # received message will only take any effect if time stamp is new
-                    # update local_robot_assignment
-                    role_old = local_role_assignment[i][source][0]
-                    if role_old >= 0:  # has been initialized before, not -1
-                        local_robot_assignment[i][role_old].remove(source)
-                    local_robot_assignment[i][role].append(source)
-                    # update local_role_assignment
-                    local_role_assignment[i][source][0] = role
-                    local_role_assignment[i][source][1] = probability
-                    local_role_assignment[i][source][2] = time_stamp
-                    transmit_flag[i][source] = True
-                    # check conflict with itself
-                    if role == local_role_assignment[i][i][0]:
-                        if probability >= pref_dist[i, local_role_assignment[i][i][0]]:
-                            # change its choice after all message received
-                            change_flag[i] = True
-                            yield_robots.append(i)
-                            yield_roles.append(local_role_assignment[i][i][0])
-        # change the choice of role for those decide to
-        for i in range(swarm_size):
-            if change_flag[i]:
-                change_flag[i] = False
-                role_old = local_role_assignment[i][i][0]
-                pref_dist_temp = np.copy(pref_dist[i])
-                pref_dist_temp[local_role_assignment[i][i][0]] = -1
-                    # set to negative to avoid being chosen
-                for j in range(swarm_size):
-                    if len(local_robot_assignment[i][j]) != 0:
-                        # eliminate those choices that have been taken
-                        pref_dist_temp[j] = -1
-                role_new = np.argmax(pref_dist_temp)
-                if pref_dist_temp[role_new] < 0:
-                    print("error, robot {} has no available role".format(i))
-                    sys.exit()
-                # role_new is good to go
-                # update local_robot_assignment
-                local_robot_assignment[i][role_old].remove(i)
-                local_robot_assignment[i][role_new].append(i)
-                # update local_role_assignment
-                local_role_assignment[i][i][0] = role_new
-                local_role_assignment[i][i][1] = pref_dist[i][role_new]
-                local_role_assignment[i][i][2] = iter_count
-                transmit_flag[i][i] = True
+        # process the received messages, change the choice of role for those decide to, then
         # transmit the received messages or initial new message transmission
-        transmission_total = 0
-        for transmitter in range(swarm_size):  # transmitter robot
-            for source in range(swarm_size):  # message is for this source robot
-                if transmit_flag[transmitter][source]:
-                    transmit_flag[transmitter][source] = False
-                    message_temp = [source, local_role_assignment[transmitter][source][0],
-                                            local_role_assignment[transmitter][source][1],
-                                            local_role_assignment[transmitter][source][2]]
-                    for target in neighbors_send[source][transmitter]:
-                        message_rx[target].append(message_temp)
-                        transmission_total = transmission_total + 1
-
-        # check if role assignment scheme is converged at every robot
-        for i in range(swarm_size):
-            if not scheme_converged[i]:
-                converged = True
-                for j in range(swarm_size):
-                    if len(local_robot_assignment[i][j]) != 1:
-                        converged  = False
-                        break
-                if converged:
-                    scheme_converged[i] = True
+        yield_robots, yield_roles = assignment.iterate()
+        sys.stdout.write("\riteration {}".format(assignment.iter_count))
+        sys.stdout.flush()
 
         # for display, scan the robots that have detected conflict but not yielding
+        chosen_roles = assignment.chosen_roles()
+        conflicting = assignment.conflicting()
         persist_robots = []
         for i in range(swarm_size):
             if i in yield_robots: continue
-            if len(local_robot_assignment[i][local_role_assignment[i][i][0]]) > 1:
+            if conflicting[i]:
                 persist_robots.append(i)
 
         # update the display
         for i in range(swarm_size):
-            for j in range(i+1, swarm_size):
-                if conn_table[i,j]:
+            for j in conn_lists[i]:
+                if j > i:  # each connection drawn once
                     pygame.draw.line(screen, color_black, disp_poses[i], disp_poses[j],
                         conn_width_thin_consensus)
         for i in range(swarm_size):
             pygame.draw.circle(screen, color_black, disp_poses[i], robot_size_consensus, 0)
         # draw the persisting robots with color of conflicting role
         for i in persist_robots:
-            pygame.draw.circle(screen, distinct_color_set[role_color[local_role_assignment[i][i][0]]],
+            pygame.draw.circle(screen, distinct_color_set[role_color[chosen_roles[i]]],
                 disp_poses[i], robot_size_consensus, 0)
         # draw extra ring on robot if local scheme has converged
         for i in range(swarm_size):
@@ -1246,13 +941,9 @@ while True:
             pygame.time.delay(flash_delay)
 
         # exit the simulation if all role assignment schemes have converged
-        all_converged = scheme_converged[0]
-        for i in range(1, swarm_size):
-            all_converged = all_converged and scheme_converged[i]
-            if not all_converged: break
-        if all_converged:
+        if assignment.all_converged():
             for i in range(swarm_size):
-                assignment_scheme[i] = local_role_assignment[0][i][0]
+                assignment_scheme[i] = assignment.local_roles[0,i]
             print("")  # move cursor to the new line
             print("simulation 3 is finished")
             if manual_mode: raw_input("<Press Enter to continue>")
@@ -1363,6 +1054,7 @@ while True:
             # key is the left side of the slot, value is a list of robots intend to join
 
         dist_conn_update()  # update "relations" of the robots
+        state0_closest = S14_closest_state0()  # for state '0' robots forming new groups
         # check state transitions, and schedule the tasks
         for i in range(swarm_size):
             if robot_states[i] == -1:  # for host robot with state '-1'
@@ -1447,7 +1139,7 @@ while True:
                 #         robot_oris[i] = math.atan2(vect_temp[1], vect_temp[0])
                 elif state0_quantity != 0:
                     # form new group with state '0' robots
-                    st_0to2[i] = S14_closest_robot(i, state0_list)
+                    st_0to2[i] = int(state0_closest[i])
             elif (robot_states[i] == 1) or (robot_states[i] == 2):
                 # disassemble the minority groups
                 state12_list = []  # list of state '1' and '2' robots in the list
@@ -1691,13 +1383,16 @@ while True:
                         continue
                     else:
                         robot_oris[i] = math.atan2(fb_vect[1], fb_vect[0])
-            # check if out of boundaries
-            if (robot_states[i] == -1) or (robot_states[i] == 0):
-                # only applies for state '-1' and '0'
-                robot_oris[i] = robot_boundary_check(robot_poses_t[i], robot_oris[i])
-            # update one step of move
-            robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
-                np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+            # update one step of move, robots '-1' and '0' are moved after the loop
+            if (robot_states[i] == 1) or (robot_states[i] == 2):
+                robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
+                    np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+        # check if out of boundaries, only applies for state '-1' and '0'
+        robot_wanders = (robot_states == -1) | (robot_states == 0)
+        robot_oris[robot_wanders] = robot_boundary_check_all(robot_poses_t[robot_wanders],
+            robot_oris[robot_wanders], world_side_length, perp_thres, devia_angle)
+        robot_poses[robot_wanders] = robot_move_all(robot_poses_t[robot_wanders],
+            robot_oris[robot_wanders], step_moving_dist)
 
         # update the graphics
         disp_poses_update()
@@ -1815,19 +1510,10 @@ while True:
         print("fail to locate shape file: {}".format(filepath))
         sys.exit()
     # calculate the interior angles for the robots(instead of target positions)
-    inter_target = np.zeros(swarm_size)
-    for i in range(swarm_size):  # i on the target loop
-        i_l = (i-1)%swarm_size
-        i_r = (i+1)%swarm_size
-        vect_l = target_poses[i_l] - target_poses[i]
-        vect_r = target_poses[i_r] - target_poses[i]
-        dist_l = np.linalg.norm(vect_l)
-        dist_r = np.linalg.norm(vect_r)
-        robot_temp = list(assignment_scheme).index(i)  # find the robot that chooses role i
-        inter_target[robot_temp] = math.acos(np.around(
-            np.dot(vect_l, vect_r) / (dist_l * dist_r) ,6))
-        if np.cross(vect_r, vect_l) < 0:
-            inter_target[robot_temp] = 2*math.pi - inter_target[robot_temp]
+    # the robot choosing role i gets the interior angle of node i on the target loop
+    roles_temp = np.arange(swarm_size)
+    inter_target = loop_interior_angles(target_poses, (roles_temp-1)%swarm_size,
+        (roles_temp+1)%swarm_size)[np.asarray(assignment_scheme, dtype=int)]
 
     # reusing robot_key_neighbors variable from S4
     for i in range(swarm_size):
@@ -1844,6 +1530,9 @@ while True:
                 ((role_i_right-role_i)%swarm_size != 1)):
                 print("loop formed with incorrect order")
                 sys.exit()
+    # the left and right key neighbors of the robots on the loop
+    loop_lefts = np.array([robot_key_neighbors[i][0] for i in range(swarm_size)])
+    loop_rights = np.array([robot_key_neighbors[i][1] for i in range(swarm_size)])
 
     # formation control variables
     inter_err_thres = 0.1
@@ -1878,35 +1567,9 @@ while True:
         iter_count = iter_count + 1
 
         # update the physics
-        robot_poses_t = np.copy(robot_poses)
-        inter_curr = np.zeros(swarm_size)  # current interior angles
-        for i in range(swarm_size):
-            i_l = robot_key_neighbors[i][0]
-            i_r = robot_key_neighbors[i][1]
-            # vectors
-            vect_l = robot_poses_t[i_l] - robot_poses_t[i]
-            vect_r = robot_poses_t[i_r] - robot_poses_t[i]
-            vect_lr = robot_poses_t[i_r] - robot_poses_t[i_l]
-            # distances
-            dist_l = np.linalg.norm(vect_l)
-            dist_r = np.linalg.norm(vect_r)
-            dist_lr = np.linalg.norm(vect_lr)
-            # unit vectors
-            u_vect_l = vect_l / dist_l
-            u_vect_r = vect_r / dist_r
-            u_vect_in = np.array([-vect_lr[1], vect_lr[0]]) / dist_lr
-            # calculate current interior angle
-            inter_curr[i] = math.acos(np.around(
-                np.dot(vect_l, vect_r) / (dist_l * dist_r), 6))
-            if np.cross(vect_r, vect_l) < 0:
-                inter_curr[i] = 2*math.pi - inter_curr[i]
-            # feedback vector for the SMA algorithm
-            fb_vect = np.zeros(2)
-            fb_vect = fb_vect + (dist_l - desired_space) * linear_const * u_vect_l
-            fb_vect = fb_vect + (dist_r - desired_space) * linear_const * u_vect_r
-            fb_vect = fb_vect + (inter_target[i] - inter_curr[i]) * bend_const * u_vect_in
-            # update one step of position
-            robot_poses[i] = robot_poses_t[i] + disp_coef * fb_vect
+        # current interior angles, and one step of position for all robots on the loop
+        robot_poses, inter_curr = sma_step(robot_poses, loop_lefts, loop_rights, inter_target,
+            desired_space, linear_const, bend_const, disp_coef)
 
         # update the graphics
         disp_poses_update()
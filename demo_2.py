@@ -28,6 +28,8 @@ from __future__ import print_function
 import pygame
 import sys, os, getopt, math
 import numpy as np
+from neighbor_functions import *
+from motion_functions import *
 import pickle
 
 swarm_size = 30  # default swarm size
@@ -81,29 +83,19 @@ force_shape_set = range(shape_quantity)
 
 # robot properties
 robot_poses = np.random.rand(swarm_size, 2) * world_side_length  # initialize the robot poses
-dist_table = np.zeros((swarm_size, swarm_size))  # distances between robots
-conn_table = np.zeros((swarm_size, swarm_size))  # connections between robots
-    # 0 for disconnected, 1 for connected
+dist_table = LazyDistTable(robot_poses)  # distances between robots, calculated when read
+conn_table = CSRConnections.from_pairs([], [], swarm_size)  # sparse connections between robots
+    # conn_table[i,j] is 0 for disconnected, 1 for connected
 conn_lists = [[] for i in range(swarm_size)]  # lists of robots connected
 # function for all simulations, update the distances and connections between the robots
+# the connected pairs are found with a uniform grid, instead of checking every pair of robots
 def dist_conn_update():
-    global dist_table
     global conn_table
     global conn_lists
-    conn_lists = [[] for i in range(swarm_size)]  # empty the lists
-    for i in range(swarm_size):
-        for j in range(i+1, swarm_size):
-            dist_temp = np.linalg.norm(robot_poses[i] - robot_poses[j])
-            dist_table[i,j] = dist_temp
-            dist_table[j,i] = dist_temp
-            if dist_temp > comm_range:
-                conn_table[i,j] = 0
-                conn_table[j,i] = 0
-            else:
-                conn_table[i,j] = 1
-                conn_table[j,i] = 1
-                conn_lists[i].append(j)
-                conn_lists[j].append(i)
+    pairs_i, pairs_j, pairs_dist = grid_pairs(robot_poses, comm_range)
+    dist_table.update(robot_poses)
+    conn_table = CSRConnections.from_pairs(pairs_i, pairs_j, swarm_size, pairs_dist)
+    conn_lists = conn_table.to_lists()
 dist_conn_update()  # update the distances and connections
 disp_poses = []  # display positions
 # function for all simulations, update the display positions
@@ -207,49 +199,6 @@ def reset_radian(radian):
         radian = radian + 2*math.pi
     return radian
 
-# general function to steer robot away from wall if out of boundary (following physics)
-# use global variable "world_side_length"
-def robot_boundary_check(robot_pos, robot_ori):
-    new_ori = robot_ori
-    if robot_pos[0] >= world_side_length:  # outside of right boundary
-        if math.cos(new_ori) > 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            # further check if new angle is too much perpendicular
-            if new_ori > 0:
-                if (math.pi - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-            else:
-                if (new_ori + math.pi) < perp_thres:
-                    new_ori = new_ori + devia_angle
-    elif robot_pos[0] <= 0:  # outside of left boundary
-        if math.cos(new_ori) < 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            if new_ori > 0:
-                if new_ori < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    if robot_pos[1] >= world_side_length:  # outside of top boundary
-        if math.sin(new_ori) > 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > -math.pi/2:
-                if (new_ori + math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    elif robot_pos[1] <= 0:  # outside of bottom boundary
-        if math.sin(new_ori) < 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > math.pi/2:
-                if (new_ori - math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    return new_ori
-
 ########### simulation 1: aggregate together to form a random loop ###########
 
 print("##### simulation 1: loop formation #####")
@@ -639,13 +588,16 @@ while True:
                     continue
                 else:
                     robot_oris[i] = math.atan2(fb_vect[1], fb_vect[0])
-        # check if out of boundaries
-        if (robot_states[i] == -1) or (robot_states[i] == 0):
-            # only applies for state '-1' and '0'
-            robot_oris[i] = robot_boundary_check(robot_poses_t[i], robot_oris[i])
-        # update one step of move
-        robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
-            np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+        # update one step of move, robots '-1' and '0' are moved after the loop
+        if (robot_states[i] == 1) or (robot_states[i] == 2):
+            robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
+                np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+    # check if out of boundaries, only applies for state '-1' and '0'
+    robot_wanders = (robot_states == -1) | (robot_states == 0)
+    robot_oris[robot_wanders] = robot_boundary_check_all(robot_poses_t[robot_wanders],
+        robot_oris[robot_wanders], world_side_length, perp_thres, devia_angle)
+    robot_poses[robot_wanders] = robot_move_all(robot_poses_t[robot_wanders],
+        robot_oris[robot_wanders], step_moving_dist)
 
     # update the graphics
     disp_poses_update()
@@ -1003,18 +955,12 @@ while True:
         print("fail to locate shape file: {}".format(filepath))
         sys.exit()
     # calculate the interior angles for the robots(instead of target positions)
-    inter_target = np.zeros(swarm_size)
-    for i in range(swarm_size):  # i on the target loop
-        i_l = (i-1)%swarm_size
-        i_r = (i+1)%swarm_size
-        vect_l = target_poses[i_l] - target_poses[i]
-        vect_r = target_poses[i_r] - target_poses[i]
-        dist_l = np.linalg.norm(vect_l)
-        dist_r = np.linalg.norm(vect_r)
-        inter_target[i] = math.acos(np.around(
-            np.dot(vect_l, vect_r) / (dist_l * dist_r) ,6))
-        if np.cross(vect_r, vect_l) < 0:
-            inter_target[i] = 2*math.pi - inter_target[i]
+    roles_temp = np.arange(swarm_size)  # i on the target loop
+    inter_target = loop_interior_angles(target_poses, (roles_temp-1)%swarm_size,
+        (roles_temp+1)%swarm_size)
+    # the left and right key neighbors of the robots on the loop
+    loop_lefts = np.array([robot_key_neighbors[i][0] for i in range(swarm_size)])
+    loop_rights = np.array([robot_key_neighbors[i][1] for i in range(swarm_size)])
 
     # draw the network for the first time
     screen.fill(color_white)
@@ -1233,40 +1179,13 @@ while True:
                 pref_dist[i] = pref_dist[i] / dist_sum
 
         # update the physics
-        robot_poses_t = np.copy(robot_poses)  # as old poses
-        inter_curr = np.zeros(swarm_size)
-        for i in range(swarm_size):
-            i_l = robot_key_neighbors[i][0]
-            i_r = robot_key_neighbors[i][1]
-            # vectors
-            vect_l = robot_poses_t[i_l] - robot_poses_t[i]
-            vect_r = robot_poses_t[i_r] - robot_poses_t[i]
-            vect_lr = robot_poses_t[i_r] - robot_poses_t[i_l]
-            # distances
-            dist_l = np.linalg.norm(vect_l)
-            dist_r = np.linalg.norm(vect_r)
-            dist_lr = np.linalg.norm(vect_lr)
-            # unit vectors
-            u_vect_l = vect_l / dist_l
-            u_vect_r = vect_r / dist_r
-            u_vect_in = np.array([-vect_lr[1], vect_lr[0]]) / dist_lr
-            # calculate current interior angle
-            inter_curr[i] = math.acos(np.around(
-                np.dot(vect_l, vect_r) / (dist_l * dist_r), 6))
-            if np.cross(vect_r, vect_l) < 0:
-                inter_curr[i] = 2*math.pi - inter_curr[i]
-            # feedback vector for the SMA algorithm
-            fb_vect = np.zeros(2)
-            fb_vect = fb_vect + (dist_l - desired_space) * linear_const * u_vect_l
-            fb_vect = fb_vect + (dist_r - desired_space) * linear_const * u_vect_r
-            if formation_stretched:
-                fb_vect = (fb_vect +
-                    (inter_target[deci_domi[i]] - inter_curr[i]) * bend_const * u_vect_in)
-            else:
-                fb_vect = (fb_vect +
-                    (inter_target_circle - inter_curr[i]) * bend_const * u_vect_in)
-            # update one step of position
-            robot_poses[i] = robot_poses_t[i] + disp_coef * fb_vect
+        # stretch into a circle first, then bend to the interior angles of dominant nodes
+        if formation_stretched:
+            inter_target_temp = inter_target[deci_domi]
+        else:
+            inter_target_temp = inter_target_circle * np.ones(swarm_size)
+        robot_poses, inter_curr = sma_step(robot_poses, loop_lefts, loop_rights,
+            inter_target_temp, desired_space, linear_const, bend_const, disp_coef)
 
         # check if the stretching process is done
         if not formation_stretched:
@@ -24,6 +24,8 @@ from __future__ import print_function
 import pygame
 import sys, os, getopt, math
 import numpy as np
+from neighbor_functions import *
+from motion_functions import *
 import pickle
 
 swarm_size = 30  # default swarm size
@@ -75,29 +77,19 @@ force_shape_set = range(shape_quantity)
 
 # robot properties
 robot_poses = np.random.rand(swarm_size, 2) * world_side_length  # initialize the robot poses
-dist_table = np.zeros((swarm_size, swarm_size))  # distances between robots
-conn_table = np.zeros((swarm_size, swarm_size))  # connections between robots
-    # 0 for disconnected, 1 for connected
+dist_table = LazyDistTable(robot_poses)  # distances between robots, calculated when read
+conn_table = CSRConnections.from_pairs([], [], swarm_size)  # sparse connections between robots
+    # conn_table[i,j] is 0 for disconnected, 1 for connected
 conn_lists = [[] for i in range(swarm_size)]  # lists of robots connected
 # function for all simulations, update the distances and connections between the robots
+# the connected pairs are found with a uniform grid, instead of checking every pair of robots
 def dist_conn_update():
-    global dist_table
     global conn_table
     global conn_lists
-    conn_lists = [[] for i in range(swarm_size)]  # empty the lists
-    for i in range(swarm_size):
-        for j in range(i+1, swarm_size):
-            dist_temp = np.linalg.norm(robot_poses[i] - robot_poses[j])
-            dist_table[i,j] = dist_temp
-            dist_table[j,i] = dist_temp
-            if dist_temp > comm_range:
-                conn_table[i,j] = 0
-                conn_table[j,i] = 0
-            else:
-                conn_table[i,j] = 1
-                conn_table[j,i] = 1
-                conn_lists[i].append(j)
-                conn_lists[j].append(i)
+    pairs_i, pairs_j, pairs_dist = grid_pairs(robot_poses, comm_range)
+    dist_table.update(robot_poses)
+    conn_table = CSRConnections.from_pairs(pairs_i, pairs_j, swarm_size, pairs_dist)
+    conn_lists = conn_table.to_lists()
 dist_conn_update()  # update the distances and connections
 disp_poses = []  # display positions
 # function for all simulations, update the display positions
@@ -193,49 +185,6 @@ def S1_closest_robot(robot_host, robot_neighbors):
             dist_closest = dist_temp
     return robot_closest
 
-# general function to steer robot away from wall if out of boundary (following physics)
-# use global variable "world_side_length"
-def robot_boundary_check(robot_pos, robot_ori):
-    new_ori = robot_ori
-    if robot_pos[0] >= world_side_length:  # outside of right boundary
-        if math.cos(new_ori) > 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            # further check if new angle is too much perpendicular
-            if new_ori > 0:
-                if (math.pi - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-            else:
-                if (new_ori + math.pi) < perp_thres:
-                    new_ori = new_ori + devia_angle
-    elif robot_pos[0] <= 0:  # outside of left boundary
-        if math.cos(new_ori) < 0:
-            new_ori = reset_radian(2*(math.pi/2) - new_ori)
-            if new_ori > 0:
-                if new_ori < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    if robot_pos[1] >= world_side_length:  # outside of top boundary
-        if math.sin(new_ori) > 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > -math.pi/2:
-                if (new_ori + math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (-math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    elif robot_pos[1] <= 0:  # outside of bottom boundary
-        if math.sin(new_ori) < 0:
-            new_ori = reset_radian(2*(0) - new_ori)
-            if new_ori > math.pi/2:
-                if (new_ori - math.pi/2) < perp_thres:
-                    new_ori = new_ori + devia_angle
-            else:
-                if (math.pi/2 - new_ori) < perp_thres:
-                    new_ori = new_ori - devia_angle
-    return new_ori
-
 # general function to reset radian angle to [-pi, pi)
 def reset_radian(radian):
     while radian >= math.pi:
@@ -679,13 +628,16 @@ while True:
                         continue  # stay in position if within destination error
                     else:
                         robot_oris[i] = math.atan2(des_vect[1], des_vect[0])
-        # check if out of boundaries
-        if (robot_states[i] == -1) or (robot_states[i] == 0):
-            # only applies for state '-1' and '0'
-            robot_oris[i] = robot_boundary_check(robot_poses_t[i], robot_oris[i])
-        # update one step of move
-        robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
-            np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+        # update one step of move, robots '-1' and '0' are moved after the loop
+        if (robot_states[i] == 1) or (robot_states[i] == 2):
+            robot_poses[i] = robot_poses_t[i] + (step_moving_dist *
+                np.array([math.cos(robot_oris[i]), math.sin(robot_oris[i])]))
+    # check if out of boundaries, only applies for state '-1' and '0'
+    robot_wanders = (robot_states == -1) | (robot_states == 0)
+    robot_oris[robot_wanders] = robot_boundary_check_all(robot_poses_t[robot_wanders],
+        robot_oris[robot_wanders], world_side_length, perp_thres, devia_angle)
+    robot_poses[robot_wanders] = robot_move_all(robot_poses_t[robot_wanders],
+        robot_oris[robot_wanders], step_moving_dist)
 
     # update the graphics
     disp_poses_update()
@@ -0,0 +1,120 @@
+# analytics index of the triangle grid network files
+
+# Every run of the simulations used to read the text file of the network, find the connections
+# from the node positions, and search the gradient map or the dependencies again. They are now
+# kept in an index folder next to the network file, "<net_filename>.index" in trigrid-networks,
+# one numpy file for each of them: the node positions, the CSR connections, the histogram of
+# node degrees, the hop counts between all nodes, and the individual dependencies (the
+# shortest-path betweenness), plus the diameter in a small json file. Each is built and saved
+# the first time it is used, and memory-mapped on later runs, so only the parts a simulation
+# uses are read from disk.
+# The index is keyed by the hash of the content of the network file. An index left from an
+# older content of the file is cleared when the network is opened.
+# If the index can't be written, like in a read-only folder, the results are only kept in
+# memory for this run.
+
+from __future__ import division
+import hashlib, json, os, shutil
+import numpy as np
+from trigridnet_generator import trigrid_pairs
+from neighbor_functions import CSRConnections
+from relay_functions import relay_gradients
+from dependency_functions import path_dependencies
+
+index_suffix = '.index'  # the index folder is the network filepath plus this suffix
+index_info_name = 'info.json'  # file of the content hash and the small results
+
+# analytics index of one network file
+class NetworkIndex(object):
+    def __init__(self, net_filepath):
+        self.net_filepath = net_filepath
+        self.index_path = net_filepath + index_suffix
+        f = open(net_filepath, 'rb')
+        self.content = f.read()
+        f.close()
+        self.content_hash = hashlib.sha1(self.content).hexdigest()
+        self.arrays = {}  # the arrays used in this run
+        self.info = None
+        info_path = os.path.join(self.index_path, index_info_name)
+        if os.path.isfile(info_path):
+            f = open(info_path, 'r')
+            try:
+                self.info = json.load(f)
+            except ValueError:
+                self.info = None  # a broken info file, build the index again
+            f.close()
+        if self.info is None or self.info.get('hash') != self.content_hash:
+            # a new network file, or its content has changed since the index was built
+            self.info = {'hash': self.content_hash}
+            try:
+                if os.path.isdir(self.index_path):
+                    shutil.rmtree(self.index_path)
+                os.mkdir(self.index_path)
+            except (IOError, OSError):
+                pass
+            self.save_info()
+    # write the info file, a temporary file is renamed over it so it's never read half written
+    def save_info(self):
+        info_path = os.path.join(self.index_path, index_info_name)
+        try:
+            f = open(info_path + '.tmp', 'w')
+            json.dump(self.info, f)
+            f.close()
+            os.rename(info_path + '.tmp', info_path)
+        except (IOError, OSError):
+            pass
+    # whether the array of "name" is in the index or used in this run
+    def saved(self, name):
+        return (name in self.arrays or
+                os.path.isfile(os.path.join(self.index_path, name + '.npy')))
+    # the array of "name" from the index, built by "build" and saved if not in the index yet
+    def array(self, name, build):
+        if name in self.arrays:
+            return self.arrays[name]
+        array_path = os.path.join(self.index_path, name + '.npy')
+        if os.path.isfile(array_path):
+            self.arrays[name] = np.load(array_path, mmap_mode='r')
+            return self.arrays[name]
+        array = np.asarray(build())
+        self.arrays[name] = array
+        try:
+            f = open(array_path + '.tmp', 'wb')
+            np.save(f, array)
+            f.close()
+            os.rename(array_path + '.tmp', array_path)
+            self.arrays[name] = np.load(array_path, mmap_mode='r')
+        except (IOError, OSError):
+            pass
+        return self.arrays[name]
+    # node positions on the triangle grid, as an array of net_size*2
+    def nodes(self):
+        return self.array('nodes', self.read_nodes)
+    def read_nodes(self):
+        return np.array([int(value) for value in self.content.split()],
+                        dtype=int).reshape(-1, 2)
+    # the connections as CSRConnections
+    def connections(self):
+        csr = None
+        if not (self.saved('row_ptr') and self.saved('col_index')):
+            nodes = self.nodes().tolist()
+            pairs_i, pairs_j = trigrid_pairs(nodes)
+            csr = CSRConnections.from_pairs(pairs_i, pairs_j, len(nodes))
+        row_ptr = self.array('row_ptr', lambda: csr.row_ptr)
+        col_index = self.array('col_index', lambda: csr.col_index)
+        return CSRConnections(row_ptr, col_index)
+    # number of nodes of each degree, from 0 to the largest degree
+    def degree_histogram(self):
+        return self.array('degree_hist', lambda: np.bincount(self.connections().degrees()))
+    # hop counts between all nodes, same as the gradient map of relay_gradients()
+    def hop_counts(self):
+        return self.array('hop_counts', lambda: relay_gradients(self.connections()))
+    # the largest hop count between any two nodes
+    def diameter(self):
+        if 'diameter' not in self.info:
+            self.info['diameter'] = int(np.max(self.hop_counts())) if len(self.nodes()) else 0
+            self.save_info()
+        return self.info['diameter']
+    # individual dependencies of all nodes, see path_dependencies() in dependency_functions.py
+    def dependencies(self, process_num=1):
+        return self.array('dependencies',
+                          lambda: path_dependencies(self.connections(), process_num))
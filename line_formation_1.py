@@ -45,8 +45,10 @@
 
 import pygame
 import math, random
+import numpy as np
 from line_formation_1_robot import LFRobot
 from formation_functions import *
+from neighbor_functions import *
 
 pygame.init()  # initialize pygame
 
@@ -107,10 +109,6 @@ groups = {}
         # 3.forth element: a list of robots off the line, not in order, status '1'
         # 4.fifth element: true or false, being the dominant group
 
-# instantiate a distance table for every pair of robots
-# will calculate once for symmetric data
-dist_table = [[-1.0 for j in range(robot_quantity)] for i in range(robot_quantity)]
-
 # calculate the corner positions of virtual boundaries, for display
 # left bottom corner
 pos_lb = world_to_display([world_size[0]*vbound_gap_ratio,
@@ -149,46 +147,14 @@ while not sim_exit:
     if (timer_now - timer_last) > frame_period:
         timer_last = timer_now  # reset timer
         # prepare the distance data for every pair of robots
-        for i in range(robot_quantity):
-            for j in range(i+1, robot_quantity):
-                # status of '-1' does not involve in any connection, so skip
-                if (robots[i].status == -1) or (robots[j].status == -1):
-                    dist_table[i][j] = -1.0
-                    dist_table[j][i] = -1.0
-                    continue  # skip the rest
-                # it only covers the upper triangle without the diagonal
-                vect_temp = (robots[i].pos[0]-robots[j].pos[0],
-                            robots[i].pos[1]-robots[j].pos[1])
-                dist_temp = math.sqrt(vect_temp[0]*vect_temp[0] +
-                                      vect_temp[1]*vect_temp[1])
-                if dist_temp <= comm_range:
-                    # only record distance smaller than communication range
-                    dist_table[i][j] = dist_temp
-                    dist_table[j][i] = dist_temp
-                else:  # ignore the neighbors too far away
-                    dist_table[i][j] = -1.0
-                    dist_table[j][i] = -1.0
-        # sort the distance in another table, record the index here
-        index_list = [[] for i in range(robot_quantity)]  # index of neighbors in range
-        # find all robots with non-zero distance
-        for i in range(robot_quantity):
-            for j in range(robot_quantity):
-                if j == i: continue  # skip the self, not necessary
-                if dist_table[i][j] > 0: index_list[i].append(j)
-        # sort the index_list in the order of increasing distance
-        for i in range(robot_quantity):
-            len_temp = len(index_list[i])  # number of neighbors
-            if (len_temp < 2): continue  # no need to sort
-            else:
-                # bubble sort
-                for j in range(len_temp-1):
-                    for k in range(len_temp-1-j):
-                        if (dist_table[i][index_list[i][k]] >
-                            dist_table[i][index_list[i][k+1]]):
-                           # swap the position of the two index
-                           index_temp = index_list[i][k]
-                           index_list[i][k] = index_list[i][k+1]
-                           index_list[i][k+1] = index_temp
+        # status of '-1' does not involve in any connection
+        dist_all, conn_all, index_all, conn_nums = pairwise_neighbors(
+            [robot.pos for robot in robots], comm_range,
+            [robot.status != -1 for robot in robots])
+        # only record distance smaller than communication range, -1.0 for not connected
+        dist_table = np.where(conn_all, dist_all, -1.0)
+        # index of neighbors in range, in the order of increasing distance
+        index_list = sorted_neighbor_lists(index_all, conn_nums)
         # get the status list corresponds to the sorted index_list
         status_list = [[] for i in range(robot_quantity)]
         for i in range(robot_quantity):
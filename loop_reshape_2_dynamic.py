@@ -46,6 +46,7 @@
 
 import pygame
 from formation_functions import *
+from motion_functions import *
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 
@@ -351,6 +352,9 @@ for i in range(2):
 # use interior angle instead of deviation angle because they should be equivalent
 inter_curr = inter_ang[0][:]  # interior angles of initial(dynamic) setup formation
 inter_targ = inter_ang[1][:]  # interior angles of target formation
+# the left and right neighbors of the nodes on the loop
+loop_lefts = (np.arange(poly_n)-1) % poly_n
+loop_rights = (np.arange(poly_n)+1) % poly_n
 # variable for the preferability distribution
 pref_dist = np.zeros((poly_n, poly_n))
 # variable indicating which target node has largest probability in the distributions
@@ -702,45 +706,10 @@ while not sim_exit:
     #                    node_h[1] + vel*physics_period*math.sin(ori)]
 
     ##### new SMA motion algorithm based on 'loop_reshape_test_moiton.py' #####
-    # variable for the neighboring nodes on the loop
-    dist_neigh = [0 for i in range(poly_n)]
-    # update the dynamic neighbor distances of the loop
-    for i in range(poly_n):
-        vect_r = nodes[0][(i+1)%poly_n] - nodes[0][i]  # from host to right node
-        dist_neigh[i] = math.sqrt(vect_r[0]*vect_r[0] + vect_r[1]*vect_r[1])
-    # update the dynamic interior angles of the loop
-    for i in range(poly_n):
-        i_l = (i-1)%poly_n
-        i_r = (i+1)%poly_n
-        vect_l = nodes[0][i_l] - nodes[0][i]
-        vect_r = nodes[0][i_r] - nodes[0][i]
-        inter_curr[i] = math.acos((vect_l[0]*vect_r[0] + vect_l[1]*vect_r[1])/
-                                  (dist_neigh[i_l] * dist_neigh[i]))
-        if (vect_r[0]*vect_l[1] - vect_r[1]*vect_l[0]) < 0:
-            inter_curr[i] = 2*math.pi - inter_curr[i]
-    # the feedback from all spring effects
-    fb_vect = [np.zeros([1,2]) for i in range(poly_n)]
-    for i in range(poly_n):
-        i_l = (i-1)%poly_n
-        i_r = (i+1)%poly_n
-        # unit vector from host to left
-        vect_l = (nodes[0][i_l]-nodes[0][i])/dist_neigh[i_l]
-        # unit vector from host to right
-        vect_r = (nodes[0][i_r]-nodes[0][i])/dist_neigh[i]
-        # unit vector along central axis pointing inward the polygon
-        vect_lr = nodes[0][i_r]-nodes[0][i_l]  # from left neighbor to right
-        dist_temp = math.sqrt(vect_lr[0]*vect_lr[0]+vect_lr[1]*vect_lr[1])
-        vect_in = np.array([-vect_lr[1]/dist_temp, vect_lr[0]/dist_temp])  # rotate ccw pi/2
-
-        # add the pulling or pushing effect from left neighbor
-        fb_vect[i] = fb_vect[i] + (dist_neigh[i_l]-loop_space) * linear_const * vect_l
-        # add the pulling or pushing effect from right neighbor
-        fb_vect[i] = fb_vect[i] + (dist_neigh[i]-loop_space) * linear_const * vect_r
-        # add the bending effect initialized by the host node itself
-        fb_vect[i] = fb_vect[i] + ((inter_targ[domi_node[i]]-inter_curr[i])*
-                                   bend_const * vect_in)
-        # update positions once, comment below if wishing to see the decision process only
-        nodes[0][i] = nodes[0][i] + disp_coef * fb_vect[i]
+    # the interior angles and the spring effects are updated for all nodes at once
+    # update positions once, comment below if wishing to see the decision process only
+    nodes[0], inter_curr = sma_step(nodes[0], loop_lefts, loop_rights,
+        np.array(inter_targ)[domi_node], loop_space, linear_const, bend_const, disp_coef)
 
     # use delay to slow down the physics update when bar graph animation is skpped
     # not clean buy quick way to adjust simulation speed
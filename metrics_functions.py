@@ -0,0 +1,84 @@
+# metrics functions for recording the probabilistic consensus simulations
+
+# The metrics of every iteration are streamed to a file, instead of being drawn in the bar
+# graph and lost afterwards. Each record is one trial at one iteration: the trial index, the
+# iteration, the summation of entropy, the number of groups, the size of the largest group,
+# and the discrete entropy of every node. The records have the same size, so the file can be
+# read back as a memory-mapped array, and each metric as a column of it, without loading the
+# per-node entropy of all records.
+# The file starts with a line of text: "consensus-metrics <net_size> <deci_num>".
+# The records are kept in a buffer and written to the file in blocks.
+
+# metrics_plotter.py plots the metrics from the file.
+
+from __future__ import division
+import numpy as np
+
+metrics_header = 'consensus-metrics'  # first word of the file
+
+# record type of the metrics file for a network of "net_size" nodes
+def metrics_dtype(net_size):
+    return np.dtype([('trial', '<i4'), ('iteration', '<i4'), ('entropy_sum', '<f8'),
+                     ('group_num', '<i4'), ('group_max', '<i4'),
+                     ('entropy', '<f4', (net_size,))])
+
+# buffered writer of the metrics file
+class MetricsWriter(object):
+    def __init__(self, filepath, net_size, deci_num, buffer_size=1024):
+        self.filepath = filepath
+        self.net_size = net_size
+        self.deci_num = deci_num
+        self.f = open(filepath, 'wb')
+        self.f.write('{} {} {}\n'.format(metrics_header, net_size, deci_num).encode('ascii'))
+        self.buffer = np.zeros(buffer_size, dtype=metrics_dtype(net_size))
+        self.buffer_len = 0  # number of records in the buffer
+        self.record_num = 0  # number of records written, including those in the buffer
+    # add the records of the trials at this iteration, "entropy" is the entropy of the nodes
+    # in each trial, "group_nums" and "group_maxs" are the number of groups and the size of
+    # the largest group in each trial
+    def write(self, trials, iteration, entropy, group_nums, group_maxs):
+        trials = np.asarray(trials)
+        entropy = np.asarray(entropy)
+        start = 0
+        while start < len(trials):
+            rows = min(len(trials) - start, len(self.buffer) - self.buffer_len)
+            records = self.buffer[self.buffer_len:self.buffer_len+rows]
+            records['trial'] = trials[start:start+rows]
+            records['iteration'] = iteration
+            records['entropy'] = entropy[start:start+rows]
+            records['entropy_sum'] = np.sum(entropy[start:start+rows], axis=1)
+            records['group_num'] = group_nums[start:start+rows]
+            records['group_max'] = group_maxs[start:start+rows]
+            self.buffer_len = self.buffer_len + rows
+            self.record_num = self.record_num + rows
+            start = start + rows
+            if self.buffer_len == len(self.buffer):
+                self.flush()
+    # write the records in the buffer to the file
+    def flush(self):
+        self.f.write(self.buffer[:self.buffer_len].tobytes())
+        self.f.flush()
+        self.buffer_len = 0
+    def close(self):
+        self.flush()
+        self.f.close()
+
+# read the metrics file, return the network size, the number of decisions, and the records as
+# a read-only memory-mapped array, like records['entropy_sum'] for the entropy summations
+def read_metrics(filepath):
+    f = open(filepath, 'rb')
+    header = f.readline().decode('ascii').split()
+    f.seek(0, 2)  # to the end of the file, for the file size
+    file_size = f.tell()
+    f.close()
+    if len(header) != 3 or header[0] != metrics_header:
+        raise ValueError('{} is not a metrics file'.format(filepath))
+    net_size = int(header[1])
+    deci_num = int(header[2])
+    dtype = metrics_dtype(net_size)
+    offset = len(' '.join(header)) + 1
+    record_num = (file_size - offset) // dtype.itemsize  # a partial record is left out
+    if record_num == 0:
+        return net_size, deci_num, np.zeros(0, dtype=dtype)
+    records = np.memmap(filepath, dtype=dtype, mode='r', offset=offset, shape=(record_num,))
+    return net_size, deci_num, records
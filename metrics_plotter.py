@@ -0,0 +1,98 @@
+# a program to plot the metrics file written by the probabilistic consensus simulation, after
+# the simulation is finished, see metrics_functions.py for the file
+
+# input arguments:
+# '-i': path of the metrics file
+# '-t': index of the trial to plot; default=0
+# '-f': filename of the triangle grid network of the trial, to draw the discrete entropy of all
+#       nodes in a 3D bar graph, as the simulation does
+# '-n': iteration of the 3D bar graph; default is the last iteration of the trial
+
+# ex: "python metrics_plotter.py -i metrics-50-3 -t 2 -f 50-3"
+
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
+from trigridnet_generator import *
+from metrics_functions import *
+import sys, os, getopt
+import numpy as np
+
+metrics_filepath = None  # path of the metrics file
+trial_index = 0  # trial to plot
+net_folder = 'trigrid-networks'  # folder for triangle grid network files
+net_filename = None  # network of the trial, no 3D bar graph if None
+bar_iteration = None  # iteration of the 3D bar graph, the last one if None
+
+# read command line options
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'i:t:f:n:')
+except getopt.GetoptError as err:
+    print(str(err))
+    sys.exit()
+for opt,arg in opts:
+    if opt == '-i':
+        metrics_filepath = arg
+    elif opt == '-t':
+        trial_index = int(arg)
+    elif opt == '-f':
+        net_filename = arg
+    elif opt == '-n':
+        bar_iteration = int(arg)
+if metrics_filepath is None or not os.path.isfile(metrics_filepath):
+    print("metrics file is not given or does not exist")
+    sys.exit()
+
+net_size, deci_num, records = read_metrics(metrics_filepath)
+trial_records = records[records['trial'] == trial_index]
+if len(trial_records) == 0:
+    print("trial {} is not in the metrics file".format(trial_index))
+    sys.exit()
+iterations = trial_records['iteration']
+print("trial {}: {} iterations, {} nodes, {} decisions".format(trial_index, len(iterations),
+    net_size, deci_num))
+print("final summation of entropy: {}".format(trial_records['entropy_sum'][-1]))
+
+# the summation of entropy, the number of groups, and the size of the largest group
+fig = plt.figure()
+fig.canvas.set_window_title('Metrics of Trial {}'.format(trial_index))
+ax = fig.add_subplot(311)
+ax.plot(iterations, trial_records['entropy_sum'])
+ax.set_ylabel('entropy sum')
+ax = fig.add_subplot(312)
+ax.plot(iterations, trial_records['group_num'])
+ax.set_ylabel('groups')
+ax = fig.add_subplot(313)
+ax.plot(iterations, trial_records['group_max'])
+ax.set_ylabel('largest group')
+ax.set_xlabel('iteration')
+
+# the discrete entropy of all nodes at one iteration
+if net_filename is not None:
+    nodes = []
+    f = open(os.path.join(os.getcwd(), net_folder, net_filename), 'r')
+    new_line = f.readline()
+    while len(new_line) != 0:  # not the end of the file yet
+        pos_str = new_line[0:-1].split(' ')  # get rid of '\n' at end
+        nodes.append([int(pos_str[0]), int(pos_str[1])])
+        new_line = f.readline()
+    f.close()
+    if len(nodes) != net_size:
+        print("network {} does not have {} nodes".format(net_filename, net_size))
+        sys.exit()
+    if bar_iteration is None:
+        bar_record = trial_records[-1]
+    else:
+        bar_records = trial_records[iterations == bar_iteration]
+        if len(bar_records) == 0:
+            print("iteration {} is not in trial {}".format(bar_iteration, trial_index))
+            sys.exit()
+        bar_record = bar_records[0]
+    nodes_plt = np.array([trigrid_to_cartesian(pos) for pos in nodes])
+    fig = plt.figure()
+    fig.canvas.set_window_title('Discrete Entropy of the Preference Distributions')
+    ax = fig.add_subplot(111, projection='3d')
+    ax.bar3d(nodes_plt[:,0], nodes_plt[:,1], np.zeros(net_size), 0.5*np.ones(net_size),
+             0.5*np.ones(net_size), bar_record['entropy'])
+    ax.set_title('iteration {}'.format(bar_record['iteration']))
+
+plt.show()
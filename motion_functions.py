@@ -0,0 +1,153 @@
+# motion functions for the swarm simulations
+
+# The physics of the simulations used to be updated one robot at a time. The functions here
+# take the positions and orientations of many robots as numpy arrays, and update them all
+# together with the same rules, which is much faster for large swarms.
+
+from __future__ import division
+import math
+import numpy as np
+
+# reset radian angles to [-pi, pi), same as reset_radian() for each element
+def reset_radians(radians):
+    radians = np.array(radians, dtype=float)
+    over = radians >= math.pi
+    while np.any(over):
+        radians[over] = radians[over] - 2*math.pi
+        over = radians >= math.pi
+    under = radians < -math.pi
+    while np.any(under):
+        radians[under] = radians[under] + 2*math.pi
+        under = radians < -math.pi
+    return radians
+
+# steer robots away from the walls if out of boundaries (following physics)
+# The moving direction is reflected on the wall the robot is running into. If the reflected
+# direction is within "perp_thres" of the perpendicular line of the wall, it is deviated for
+# another "devia_angle", so the robot won't keep bouncing between two walls. The left and right
+# walls are checked before the bottom and top walls, a robot in the corner is reflected twice.
+# return the new orientations of the robots
+def robot_boundary_check_all(robot_poses, robot_oris, world_side_length,
+                             perp_thres, devia_angle):
+    robot_poses = np.asarray(robot_poses, dtype=float)
+    new_oris = np.array(robot_oris, dtype=float)
+    if len(new_oris) == 0: return new_oris
+    # outside of right boundary, or outside of left boundary
+    right = (robot_poses[:,0] >= world_side_length) & (np.cos(new_oris) > 0)
+    left = (robot_poses[:,0] <= 0) & (np.cos(new_oris) < 0)
+    reflect = right | left
+    new_oris[reflect] = reset_radians(2*(math.pi/2) - new_oris[reflect])
+    # further check if new angle is too much perpendicular
+    upper = new_oris > 0
+    new_oris[right & upper & ((math.pi - new_oris) < perp_thres)] -= devia_angle
+    new_oris[right & ~upper & ((new_oris + math.pi) < perp_thres)] += devia_angle
+    new_oris[left & upper & (new_oris < perp_thres)] += devia_angle
+    new_oris[left & ~upper & ((-new_oris) < perp_thres)] -= devia_angle
+    # outside of top boundary, or outside of bottom boundary
+    top = (robot_poses[:,1] >= world_side_length) & (np.sin(new_oris) > 0)
+    bottom = (robot_poses[:,1] <= 0) & (np.sin(new_oris) < 0)
+    reflect = top | bottom
+    new_oris[reflect] = reset_radians(2*(0) - new_oris[reflect])
+    upper = new_oris > -math.pi/2
+    new_oris[top & upper & ((new_oris + math.pi/2) < perp_thres)] += devia_angle
+    new_oris[top & ~upper & ((-math.pi/2 - new_oris) < perp_thres)] -= devia_angle
+    upper = new_oris > math.pi/2
+    new_oris[bottom & upper & ((new_oris - math.pi/2) < perp_thres)] += devia_angle
+    new_oris[bottom & ~upper & ((math.pi/2 - new_oris) < perp_thres)] -= devia_angle
+    return new_oris
+
+# move the robots one step along their orientations, return the new positions
+def robot_move_all(robot_poses, robot_oris, step_moving_dist):
+    robot_oris = np.asarray(robot_oris, dtype=float)
+    return np.asarray(robot_poses, dtype=float) + (step_moving_dist *
+        np.column_stack((np.cos(robot_oris), np.sin(robot_oris))))
+
+# accumulate the spring-like pull and push from the neighbors over a list of directed edges
+# Every edge (i, j) pulls robot i toward robot j if their distance is larger than the desired
+# space, or pushes it away if smaller, in proportion to the difference. The influences are
+# added to the robots together, instead of looping through the neighbors of each robot.
+# return the moving vectors of all robots, zero for robots without edges
+def spring_vectors(robot_poses, edges_i, edges_j, edges_dist, desired_space, mov_vec_ratio):
+    robot_poses = np.asarray(robot_poses, dtype=float)
+    vects = robot_poses[edges_j] - robot_poses[edges_i]
+    norms = np.sqrt(vects[:,0]*vects[:,0] + vects[:,1]*vects[:,1])
+    norms[norms == 0] = 1.0  # leave the zero vectors as they are
+    units = vects / norms[:,None]
+    weights = mov_vec_ratio * (np.asarray(edges_dist, dtype=float) - desired_space)
+    mov_vecs = np.zeros((len(robot_poses), 2))
+    for k in range(2):
+        mov_vecs[:,k] = np.bincount(edges_i, weights=weights*units[:,k],
+                                    minlength=len(robot_poses))
+    return mov_vecs
+
+# moving directions of the robots rotating counter-clockwise around their center robots
+# A robot moves toward the center if too far, away from it if too close, otherwise it moves
+# tangent along the circle of radius of "desired_space" around the center, using the triangle
+# of (desired_space, distance to center, step_moving_dist).
+# return the orientations of the robots
+def orbit_oris(robot_poses, robots, centers, center_dists, desired_space, step_moving_dist):
+    robot_poses = np.asarray(robot_poses, dtype=float)
+    center_dists = np.asarray(center_dists, dtype=float)
+    vects = robot_poses[robots] - robot_poses[centers]  # pointing away from the center
+    oris = np.arctan2(vects[:,1], vects[:,0])
+    toward = center_dists > (desired_space + step_moving_dist)
+    away = (center_dists + step_moving_dist) < desired_space
+    tangent = ~(toward | away)
+    oris[toward] = np.arctan2(-vects[toward,1], -vects[toward,0])
+    # interior angle between distance to center and step_moving_dist
+    int_angles = np.arccos((center_dists[tangent]*center_dists[tangent] +
+        step_moving_dist*step_moving_dist - desired_space*desired_space) /
+        (2.0*center_dists[tangent]*step_moving_dist))
+    oris[tangent] = reset_radians(oris[tangent] + (math.pi - int_angles))
+    return oris
+
+# SMA (shape memory alloy) algorithm for the loop reshape:
+# Every robot on the loop is connected to its left and right neighbors by linear springs of
+# rest length "desired_space", and it bends toward its target interior angle along the axis
+# pointing inward the loop, which is perpendicular to the line from left to right neighbors.
+# The robots on a loop are given by index arrays of their left and right neighbors, so loops
+# in any robot order can be updated together.
+
+# interior angles of the robots on a loop, rotating from the right neighbor to the left one
+# return the interior angles in range of [0, 2*pi)
+def loop_interior_angles(robot_poses, lefts, rights):
+    robot_poses = np.asarray(robot_poses, dtype=float)
+    vects_l = robot_poses[lefts] - robot_poses
+    vects_r = robot_poses[rights] - robot_poses
+    dists_l = np.sqrt(vects_l[:,0]*vects_l[:,0] + vects_l[:,1]*vects_l[:,1])
+    dists_r = np.sqrt(vects_r[:,0]*vects_r[:,0] + vects_r[:,1]*vects_r[:,1])
+    # round the cosine to avoid falling outside of [-1, 1]
+    inter_angles = np.arccos(np.around((vects_l[:,0]*vects_r[:,0] +
+        vects_l[:,1]*vects_r[:,1]) / (dists_l * dists_r), 6))
+    # cross product of vect_r to vect_l is smaller than 0
+    reflex = (vects_r[:,0]*vects_l[:,1] - vects_r[:,1]*vects_l[:,0]) < 0
+    inter_angles[reflex] = 2*math.pi - inter_angles[reflex]
+    return inter_angles
+
+# feedback vectors of the SMA algorithm for all robots on a loop
+# return the feedback vectors and the current interior angles
+def sma_feedback(robot_poses, lefts, rights, inter_targets, desired_space,
+                 linear_const, bend_const):
+    robot_poses = np.asarray(robot_poses, dtype=float)
+    inter_curr = loop_interior_angles(robot_poses, lefts, rights)
+    vects_l = robot_poses[lefts] - robot_poses
+    vects_r = robot_poses[rights] - robot_poses
+    vects_lr = robot_poses[rights] - robot_poses[lefts]
+    dists_l = np.sqrt(vects_l[:,0]*vects_l[:,0] + vects_l[:,1]*vects_l[:,1])
+    dists_r = np.sqrt(vects_r[:,0]*vects_r[:,0] + vects_r[:,1]*vects_r[:,1])
+    dists_lr = np.sqrt(vects_lr[:,0]*vects_lr[:,0] + vects_lr[:,1]*vects_lr[:,1])
+    # unit vectors to the neighbors, and along central axis pointing inward, rotate ccw pi/2
+    u_vects_l = vects_l / dists_l[:,None]
+    u_vects_r = vects_r / dists_r[:,None]
+    u_vects_in = np.column_stack((-vects_lr[:,1], vects_lr[:,0])) / dists_lr[:,None]
+    fb_vects = (((dists_l - desired_space) * linear_const)[:,None] * u_vects_l +
+                ((dists_r - desired_space) * linear_const)[:,None] * u_vects_r +
+                ((np.asarray(inter_targets) - inter_curr) * bend_const)[:,None] * u_vects_in)
+    return fb_vects, inter_curr
+
+# one step of the SMA algorithm, return the new positions and the current interior angles
+def sma_step(robot_poses, lefts, rights, inter_targets, desired_space,
+             linear_const, bend_const, disp_coef):
+    fb_vects, inter_curr = sma_feedback(robot_poses, lefts, rights, inter_targets,
+        desired_space, linear_const, bend_const)
+    return np.asarray(robot_poses, dtype=float) + disp_coef * fb_vects, inter_curr
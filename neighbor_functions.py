@@ -0,0 +1,318 @@
+# neighbor search functions for the swarm simulations
+
+# Uniform grid for finding connected robots:
+# The world is divided into square cells with side length of the communication range, so two
+# connected robots are either in the same cell or in two adjacent cells. Each robot is only
+# checked against the robots in its own cell and in four of its eight surrounding cells (the
+# other four are covered when the robots there check back), so every candidate pair is visited
+# once. The robots are sorted by cell, and the robots of one cell are located with binary
+# search, which keeps the whole search in numpy arrays instead of python loops.
+
+from __future__ import division
+import math
+import numpy as np
+
+# the four surrounding cells to check, plus the cell itself
+grid_cell_offsets = ((0,0), (1,-1), (1,0), (1,1), (0,1))
+# all eight surrounding cells, plus the cell itself
+grid_cell_offsets_all = ((-1,-1), (-1,0), (-1,1), (0,-1), (0,0), (0,1), (1,-1), (1,0), (1,1))
+
+# put the robots in a uniform grid with square cells of side length "cell_size"
+# return the cell key of each robot, the key difference between two adjacent columns of cells,
+# the robots sorted by cell key, and the sorted cell keys
+def grid_cells(poses, cell_size):
+    # cell indices start from 1, leaving an empty row of cells on each side
+    cells = np.floor((poses - poses.min(axis=0)) / cell_size).astype(int) + 1
+    row_num = cells[:,1].max() + 2  # number of cells in one column
+    cell_keys = cells[:,0] * row_num + cells[:,1]
+    key_order = np.argsort(cell_keys, kind='mergesort')  # robots sorted by cell
+    return cell_keys, row_num, key_order, cell_keys[key_order]
+
+# expand the ranges [starts, ends) in sorted order into flat arrays of pairs
+# return the robot owning each range, and the robot at each position of the ranges
+def grid_expand(owners, starts, ends, key_order):
+    counts = np.maximum(ends - starts, 0)
+    count_total = counts.sum()
+    shifts = np.arange(count_total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(owners, counts), key_order[np.repeat(starts, counts) + shifts]
+
+# keep the pairs within range, return them as smaller index, larger index, and distance
+def pairs_in_range(poses, pairs_first, pairs_second, radius):
+    vects = poses[pairs_first] - poses[pairs_second]
+    dists = np.sqrt(vects[:,0]*vects[:,0] + vects[:,1]*vects[:,1])
+    in_range = dists <= radius
+    pairs_first = pairs_first[in_range]
+    pairs_second = pairs_second[in_range]
+    return (np.minimum(pairs_first, pairs_second), np.maximum(pairs_first, pairs_second),
+            dists[in_range])
+
+# find all pairs of robots within communication range using a uniform grid
+# return three arrays of same length: the smaller robot index, the larger robot index, and
+# the distance of every connected pair
+def grid_pairs(poses, comm_range):
+    poses = np.asarray(poses, dtype=float)
+    poses_num = len(poses)
+    if poses_num < 2:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))
+    cell_keys, row_num, key_order, keys_sorted = grid_cells(poses, comm_range)
+    key_ranks = np.empty(poses_num, dtype=int)  # position of each robot in key_order
+    key_ranks[key_order] = np.arange(poses_num)
+    pairs_first = []
+    pairs_second = []
+    for (dx, dy) in grid_cell_offsets:
+        if (dx, dy) == (0,0):
+            # same cell, only pair with robots after itself in the sorted order
+            starts = key_ranks + 1
+        else:
+            starts = np.searchsorted(keys_sorted, cell_keys + dx*row_num + dy, 'left')
+        ends = np.searchsorted(keys_sorted, cell_keys + dx*row_num + dy, 'right')
+        # expand the candidate ranges of all robots into one flat list of pairs
+        firsts_temp, seconds_temp = grid_expand(np.arange(poses_num), starts, ends, key_order)
+        pairs_first.append(firsts_temp)
+        pairs_second.append(seconds_temp)
+    return pairs_in_range(poses, np.concatenate(pairs_first), np.concatenate(pairs_second),
+                          comm_range)
+
+# find all pairs of robots within "radius" that have at least one robot in "query" robots
+# return in the same form as grid_pairs(), each pair is listed once
+def grid_query_pairs(poses, query, radius):
+    poses = np.asarray(poses, dtype=float)
+    query = np.asarray(query, dtype=int)
+    if len(query) == 0 or len(poses) < 2:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0))
+    cell_keys, row_num, key_order, keys_sorted = grid_cells(poses, radius)
+    in_query = np.zeros(len(poses), dtype=bool)
+    in_query[query] = True
+    pairs_first = []
+    pairs_second = []
+    for (dx, dy) in grid_cell_offsets_all:
+        keys_temp = cell_keys[query] + dx*row_num + dy
+        firsts_temp, seconds_temp = grid_expand(query,
+            np.searchsorted(keys_sorted, keys_temp, 'left'),
+            np.searchsorted(keys_sorted, keys_temp, 'right'), key_order)
+        # skip itself, and the pair found twice when both robots are in the query
+        valid = (seconds_temp != firsts_temp) & (~in_query[seconds_temp] |
+                                                 (firsts_temp < seconds_temp))
+        pairs_first.append(firsts_temp[valid])
+        pairs_second.append(seconds_temp[valid])
+    return pairs_in_range(poses, np.concatenate(pairs_first), np.concatenate(pairs_second),
+                          radius)
+
+# sparse connections in compressed sparse row (CSR) form, replacing the dense n*n tables
+# The neighbors of node i are col_index[row_ptr[i]:row_ptr[i+1]] in increasing order, with
+# the distances of the edges at same positions in edge_dists. Memory grows with the number of
+# connections instead of n*n, the dense table is only exported on request for small runs.
+class CSRConnections(object):
+    def __init__(self, row_ptr, col_index, edge_dists=None):
+        self.row_ptr = np.asarray(row_ptr, dtype=int)
+        self.col_index = np.asarray(col_index, dtype=int)
+        if edge_dists is None:
+            edge_dists = np.ones(len(self.col_index))  # unit length for grid networks
+        self.edge_dists = np.asarray(edge_dists, dtype=float)
+        self.size = len(self.row_ptr) - 1  # number of nodes
+    # build from connected pairs, each pair listed once in any order
+    @classmethod
+    def from_pairs(cls, pairs_i, pairs_j, size, pairs_dist=None):
+        pairs_i = np.asarray(pairs_i, dtype=int)
+        pairs_j = np.asarray(pairs_j, dtype=int)
+        if pairs_dist is None:
+            pairs_dist = np.ones(len(pairs_i))
+        firsts = np.concatenate((pairs_i, pairs_j))
+        seconds = np.concatenate((pairs_j, pairs_i))
+        order = np.lexsort((seconds, firsts))
+        counts = np.bincount(firsts, minlength=size)
+        row_ptr = np.concatenate(([0], np.cumsum(counts)))
+        dists = np.concatenate((pairs_dist, pairs_dist))
+        return cls(row_ptr, seconds[order], dists[order])
+    # build from lists of neighbors for each node
+    @classmethod
+    def from_lists(cls, conn_lists):
+        counts = [len(conn_list) for conn_list in conn_lists]
+        row_ptr = np.concatenate(([0], np.cumsum(counts))).astype(int)
+        col_index = np.zeros(row_ptr[-1], dtype=int)
+        for i in range(len(conn_lists)):
+            col_index[row_ptr[i]:row_ptr[i+1]] = sorted(conn_lists[i])
+        return cls(row_ptr, col_index)
+    # neighbors of node i, as numpy array
+    def neighbors(self, i):
+        return self.col_index[self.row_ptr[i]:self.row_ptr[i+1]]
+    # number of neighbors of all nodes
+    def degrees(self):
+        return np.diff(self.row_ptr)
+    # source node of every entry in col_index
+    def row_index(self):
+        return np.repeat(np.arange(self.size), self.degrees())
+    # each connection listed once, as two arrays of smaller and larger node index
+    def edges(self):
+        rows = self.row_index()
+        upper = rows < self.col_index
+        return rows[upper], self.col_index[upper]
+    # read like the dense table, conn_table[i,j] is 1 for connected, 0 for not connected
+    def __getitem__(self, index):
+        if index[1] in self.neighbors(index[0]):
+            return 1
+        return 0
+    # several copies of the network side by side, node i of copy k is node k*size+i
+    def tile(self, copies):
+        nnz = len(self.col_index)
+        row_ptr = (self.row_ptr[1:][None,:] + nnz*np.arange(copies)[:,None]).ravel()
+        col_index = (self.col_index[None,:] + self.size*np.arange(copies)[:,None]).ravel()
+        return CSRConnections(np.concatenate(([0], row_ptr)).astype(int), col_index,
+                              np.tile(self.edge_dists, copies))
+    # connections with only the selected entries, "selected" is boolean mask over col_index
+    def select(self, selected):
+        selected = np.asarray(selected, dtype=bool)
+        counts = np.bincount(self.row_index()[selected], minlength=self.size)
+        row_ptr = np.concatenate(([0], np.cumsum(counts))).astype(int)
+        return CSRConnections(row_ptr, self.col_index[selected], self.edge_dists[selected])
+    # lists of neighbors for each node, same as the old "conn_lists"
+    def to_lists(self):
+        if self.size == 0: return []
+        return [list_temp.tolist() for list_temp in np.split(self.col_index, self.row_ptr[1:-1])]
+    # dense n*n table, only for debugging on small networks
+    def to_dense(self, values='connection'):
+        dense = np.zeros((self.size, self.size))
+        if values == 'distance':
+            dense[self.row_index(), self.col_index] = self.edge_dists
+        else:
+            dense[self.row_index(), self.col_index] = 1
+        return dense
+
+# spatial query service on a uniform grid, for finding the closest robots of many robots
+# Built once from the current positions, the queries are batched for all the query robots.
+# "valid" marks the robots that can be found, like only the robots of state '0'. Among robots
+# of same distance, the one with smaller index is taken first, same as scanning in order.
+class SpatialQuery(object):
+    def __init__(self, poses, cell_size):
+        self.poses = np.array(poses, dtype=float)
+        self.cell_size = cell_size
+        if len(self.poses) != 0:
+            (self.cell_keys, self.row_num, self.key_order,
+                self.keys_sorted) = grid_cells(self.poses, cell_size)
+    # the k nearest valid robots within radius for each query robot, itself excluded
+    # return two arrays of shape (number of query robots, k), the robot indices in the order
+    # of increasing distance and the distances; padded with -1 and inf if not enough robots
+    def k_nearest(self, query, k, radius, valid=None):
+        query = np.asarray(query, dtype=int)
+        indices = -np.ones((len(query), k), dtype=int)
+        dists = np.inf * np.ones((len(query), k))
+        if len(query) == 0 or len(self.poses) < 2: return indices, dists
+        ring = int(math.ceil(radius / self.cell_size))  # rings of cells to cover the radius
+        rows = self.cell_keys[query] % self.row_num
+        owners = []
+        others = []
+        for dx in range(-ring, ring+1):
+            for dy in range(-ring, ring+1):
+                keys_temp = self.cell_keys[query] + dx*self.row_num + dy
+                starts = np.searchsorted(self.keys_sorted, keys_temp, 'left')
+                ends = np.searchsorted(self.keys_sorted, keys_temp, 'right')
+                # skip the cells outside of the column, or it wraps into the next column
+                outside = (rows + dy < 0) | (rows + dy >= self.row_num)
+                ends[outside] = starts[outside]
+                owners_temp, others_temp = grid_expand(np.arange(len(query)), starts, ends,
+                                                       self.key_order)
+                owners.append(owners_temp)
+                others.append(others_temp)
+        owners = np.concatenate(owners)
+        others = np.concatenate(others)
+        kept = others != query[owners]
+        if valid is not None:
+            kept = kept & np.asarray(valid, dtype=bool)[others]
+        owners = owners[kept]
+        others = others[kept]
+        vects = self.poses[query[owners]] - self.poses[others]
+        dists_temp = np.sqrt(vects[:,0]*vects[:,0] + vects[:,1]*vects[:,1])
+        in_range = dists_temp <= radius
+        owners = owners[in_range]
+        others = others[in_range]
+        dists_temp = dists_temp[in_range]
+        # sort by query robot, then distance, then robot index
+        order = np.lexsort((others, dists_temp, owners))
+        owners = owners[order]
+        others = others[order]
+        dists_temp = dists_temp[order]
+        counts = np.bincount(owners, minlength=len(query))
+        ranks = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+        first_k = ranks < k
+        indices[owners[first_k], ranks[first_k]] = others[first_k]
+        dists[owners[first_k], ranks[first_k]] = dists_temp[first_k]
+        return indices, dists
+    # the nearest valid robot within radius for each query robot, -1 if there is none
+    def nearest_within(self, query, radius, valid=None):
+        return self.k_nearest(query, 1, radius, valid)[0][:,0]
+
+# Verlet neighbor lists with skin radius, for swarms with most robots staying still:
+# Each robot keeps the candidate pairs within "comm_range + skin" of its position at the last
+# rebuild. The pairs of a robot are only searched again once it has moved more than half of
+# the skin since then, so a connection can not be missed before it has to be rebuilt. The
+# search uses the rebuild positions of all robots, the candidate lists stay complete even if
+# robots are rebuilt at different times. Results are the same as grid_pairs().
+class VerletNeighbors(object):
+    def __init__(self, comm_range, skin):
+        self.comm_range = comm_range
+        self.skin = skin
+        self.ref_poses = None  # positions of the robots at their last rebuild
+        self.cand_i = np.zeros(0, dtype=int)  # candidate pairs, smaller index
+        self.cand_j = np.zeros(0, dtype=int)  # candidate pairs, larger index
+        self.rebuild_num = 0  # number of robots rebuilt in last update
+    # update with current positions, return the connected pairs same as grid_pairs()
+    def update(self, poses):
+        poses = np.array(poses, dtype=float)
+        cand_range = self.comm_range + self.skin
+        if self.ref_poses is None or len(self.ref_poses) != len(poses):
+            # first update, search the pairs for all robots
+            self.ref_poses = np.copy(poses)
+            self.cand_i, self.cand_j, dists_temp = grid_pairs(poses, cand_range)
+            self.rebuild_num = len(poses)
+        else:
+            vects = poses - self.ref_poses
+            moved = (vects[:,0]*vects[:,0] + vects[:,1]*vects[:,1]) > (self.skin/2.0)**2
+            self.rebuild_num = np.sum(moved)
+            if self.rebuild_num != 0:
+                self.ref_poses[moved] = poses[moved]
+                # drop old pairs of the moved robots, and search again for them
+                kept = ~(moved[self.cand_i] | moved[self.cand_j])
+                new_i, new_j, dists_temp = grid_query_pairs(self.ref_poses,
+                    np.nonzero(moved)[0], cand_range)
+                self.cand_i = np.concatenate((self.cand_i[kept], new_i))
+                self.cand_j = np.concatenate((self.cand_j[kept], new_j))
+        return pairs_in_range(poses, self.cand_i, self.cand_j, self.comm_range)
+
+# distance table that only calculates the distance of a pair of robots when it is read
+# The positions are copied when updated, so the distances read are the same as the ones in
+# a full table calculated at that moment. Read it like a numpy array, dist_table[i,j].
+class LazyDistTable(object):
+    def __init__(self, poses):
+        self.update(poses)
+    def update(self, poses):
+        self.poses = np.array(poses, dtype=float)
+    def __getitem__(self, index):
+        vect = self.poses[index[0]] - self.poses[index[1]]
+        return math.sqrt(vect[0]*vect[0] + vect[1]*vect[1])
+
+# distances, connections and distance sorted neighbors of all robots, in one numpy pass
+# "active" marks the robots that can be connected, default is all robots
+# return four arrays:
+#   dists[i,j]: distance between robot i and j
+#   in_range[i,j]: robot i and j are connected, a robot is not connected with itself, and
+#       two robots at exactly same position are skipped like itself
+#   sorted_index[i]: robot indices in the order of increasing distance from robot i, with the
+#       connected ones first; same distances keep the increasing index order
+#   neighbor_nums[i]: number of connected robots, the length of the valid part of sorted_index[i]
+def pairwise_neighbors(poses, comm_range, active=None):
+    poses = np.asarray(poses, dtype=float)
+    vects_x = poses[:,0][:,np.newaxis] - poses[:,0][np.newaxis,:]
+    vects_y = poses[:,1][:,np.newaxis] - poses[:,1][np.newaxis,:]
+    dists = np.sqrt(vects_x*vects_x + vects_y*vects_y)
+    in_range = (dists <= comm_range) & (dists > 0)
+    if active is not None:
+        active = np.asarray(active, dtype=bool)
+        in_range = in_range & active[:,np.newaxis] & active[np.newaxis,:]
+    neighbor_nums = np.sum(in_range, axis=1)
+    # stable sort, the robots not connected are pushed to the end
+    sorted_index = np.argsort(np.where(in_range, dists, np.inf), axis=1, kind='mergesort')
+    return dists, in_range, sorted_index, neighbor_nums
+
+# lists of connected robots in the order of increasing distance, from pairwise_neighbors()
+def sorted_neighbor_lists(sorted_index, neighbor_nums):
+    return [sorted_index[i,:neighbor_nums[i]].tolist() for i in range(len(neighbor_nums))]
@@ -0,0 +1,377 @@
+# message relay functions for the role assignment simulations
+
+# The role assignment algorithm used to live inside the loop of the simulation window. It is
+# kept here without any graphics, so the simulation window and the trials run in parallel by
+# trial_runner.py share the same algorithm. See trigridnet_role_assignment.py for the ideas of
+# the gradient values and the message relay.
+
+from __future__ import division
+import sys
+import numpy as np
+
+# Gradient map:
+# The gradient value of a node to a message source is the number of hops on the shortest path
+# between them. The map is found by breadth-first search from every source, all sources
+# expanding their frontiers together in one round over the CSR connections: the frontier is a
+# list of (source, node) pairs, the pairs are expanded to the neighbors of the nodes, and those
+# already reached by the source are dropped. (It used to expand a pool of frontier lists source
+# by source in python, which took longer than the role assignment on large networks.)
+# The hop counts are stored in the smallest integer type for the network size.
+
+# integer type of the gradient map for a network of "net_size" nodes
+def gradient_dtype(net_size):
+    if net_size <= np.iinfo(np.uint8).max:
+        return np.uint8
+    if net_size <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+# pre-calculated gradient map, searching the shortest path between any two nodes
+# "connections" is a CSRConnections of the network
+# gradients[i,j] is gradient value of node j, to message source i, 0 if not reachable
+def relay_gradients(connections):
+    net_size = connections.size
+    gradients = np.zeros((net_size, net_size), dtype=gradient_dtype(net_size))
+    reached = np.eye(net_size, dtype=bool)  # whether node j is reached from source i
+    degrees = connections.degrees()
+    sources = np.arange(net_size)  # the frontier pairs of sources and nodes
+    fronts = np.arange(net_size)
+    gradient = 0
+    while len(sources) != 0:
+        gradient = gradient + 1
+        # all neighbors of the frontier nodes, paired with the sources
+        counts = degrees[fronts]
+        starts = np.repeat(connections.row_ptr[fronts] - np.cumsum(counts) + counts, counts)
+        targets = connections.col_index[starts + np.arange(np.sum(counts))]
+        sources = np.repeat(sources, counts)
+        pair_keys = sources * net_size + targets  # the pairs as indices in the flat map
+        pair_keys = np.sort(pair_keys[~reached.ravel()[pair_keys]])
+        # a node reached by several frontier nodes of the same source is kept once
+        first = np.ones(len(pair_keys), dtype=bool)
+        first[1:] = pair_keys[1:] != pair_keys[:-1]
+        pair_keys = pair_keys[first]
+        reached.ravel()[pair_keys] = True
+        gradients.ravel()[pair_keys] = gradient
+        sources = pair_keys // net_size
+        fronts = pair_keys % net_size
+    return gradients
+
+# Relay targets:
+# A node only relays a message to the neighbors one gradient higher to the message source.
+# The targets of all sources and nodes are kept in CSR form: row i*net_size+j lists the
+# neighbors node j sends the message of source i to, in increasing order. They are found from
+# the gradient map over all connections of the network, a block of sources at a time. (They
+# used to be found through the relative gradients of all nodes to all nodes for every source,
+# net_size**3 numbers in memory.)
+class RelayTargets(object):
+    def __init__(self, net_size, row_ptr, col_index):
+        self.net_size = net_size
+        self.row_ptr = np.asarray(row_ptr, dtype=np.int64)
+        self.col_index = np.asarray(col_index, dtype=np.int32)
+    # build from the connections and the gradient map of the network
+    @classmethod
+    def from_gradients(cls, connections, gradients, block_size=1 << 22):
+        net_size = connections.size
+        conn_rows = connections.row_index()
+        conn_cols = connections.col_index
+        # number of sources checked together, bounding the table of all their connections
+        sources_step = max(1, block_size // max(len(conn_cols), 1))
+        counts = []
+        col_index = []
+        for start in range(0, net_size, sources_step):
+            gradients_block = gradients[start:start+sources_step].astype(int)
+            relayed = (gradients_block[:,conn_cols] - gradients_block[:,conn_rows]) == 1
+            rows_block = (np.arange(len(gradients_block))[:,None] * net_size +
+                          conn_rows[None,:])[relayed]
+            counts.append(np.bincount(rows_block, minlength=len(gradients_block)*net_size))
+            col_index.append(np.nonzero(relayed)[1])
+        if net_size == 0:
+            return cls(0, [0], [])
+        counts = np.concatenate(counts)
+        return cls(net_size, np.concatenate(([0], np.cumsum(counts))),
+                   conn_cols[np.concatenate(col_index)])
+    # row of every entry in col_index
+    def row_index(self):
+        return np.repeat(np.arange(len(self.row_ptr)-1), np.diff(self.row_ptr))
+    # targets with only the selected entries, "selected" is boolean mask over col_index
+    def select(self, selected):
+        selected = np.asarray(selected, dtype=bool)
+        counts = np.bincount(self.row_index()[selected], minlength=len(self.row_ptr)-1)
+        return RelayTargets(self.net_size, np.concatenate(([0], np.cumsum(counts))),
+                            self.col_index[selected])
+    # the designated entries, one for every pair of source and receiving node: of the nodes
+    # relaying the message of the source to the node, the one with the smallest index
+    def designated(self):
+        rows = self.row_index()
+        pair_keys = (rows // self.net_size) * self.net_size + self.col_index
+        order = np.argsort(pair_keys, kind='mergesort')  # keep smaller relaying node first
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_keys[order[1:]] != pair_keys[order[:-1]]
+        designated = np.zeros(len(order), dtype=bool)
+        designated[order[first]] = True
+        return designated
+    # the neighbors to relay the message, relay_targets[i,j] is the neighbors node j sends the
+    # message of source i to
+    def __getitem__(self, index):
+        row = index[0] * self.net_size + index[1]
+        return self.col_index[self.row_ptr[row]:self.row_ptr[row+1]]
+    # the entries to relay for many pairs of sources and nodes at once, return the index of
+    # the pair and the position in col_index for every relay
+    def expand_entries(self, sources, nodes):
+        rows = np.asarray(sources, dtype=np.int64) * self.net_size + nodes
+        counts = self.row_ptr[rows+1] - self.row_ptr[rows]
+        starts = np.repeat(self.row_ptr[rows] - np.cumsum(counts) + counts, counts)
+        pair_index = np.repeat(np.arange(len(rows)), counts)
+        return pair_index, starts + np.arange(np.sum(counts))
+    # same as expand_entries(), return the neighbor instead of the position for every relay
+    def expand(self, sources, nodes):
+        pair_index, entries = self.expand_entries(sources, nodes)
+        return pair_index, self.col_index[entries]
+
+# Relay strategies:
+# Every relay strategy has expand() like RelayTargets, giving the neighbors to relay for pairs
+# of sources and nodes. With the targets of all neighbors one gradient higher ('flood'), a node
+# often receives the same message from several neighbors. The gradient spanning tree ('tree')
+# sends it only from the designated neighbor, so each node receives each message once. The
+# probabilistic forwarding ('random') sends the designated relays, and each of the others with
+# a probability. The messages still travel only on the shortest paths and arrive at the same
+# time in all strategies, so the role assignment goes the same way, only with different number
+# of transmissions.
+relay_strategy_names = ['flood', 'tree', 'random']
+
+# probabilistic forwarding, the designated relays always, the others by "probability"
+class RandomRelay(object):
+    def __init__(self, relay_targets, probability, random_state=np.random):
+        self.relay_targets = relay_targets
+        self.designated = relay_targets.designated()
+        self.probability = probability
+        self.random_state = random_state
+    def expand(self, sources, nodes):
+        pair_index, entries = self.relay_targets.expand_entries(sources, nodes)
+        relayed = (self.designated[entries] |
+                   (self.random_state.rand(len(entries)) < self.probability))
+        return pair_index[relayed], self.relay_targets.col_index[entries[relayed]]
+
+# the relay strategy of the name, from the targets of all neighbors one gradient higher
+def relay_strategy(relay_targets, strategy, probability=0.5, random_state=np.random):
+    if strategy == 'flood':
+        return relay_targets
+    elif strategy == 'tree':
+        return relay_targets.select(relay_targets.designated())
+    elif strategy == 'random':
+        return RandomRelay(relay_targets, probability, random_state)
+    print("error, unknown relay strategy {}".format(strategy))
+    sys.exit()
+
+# Message bus:
+# The messages in transmission are records in a numpy buffer, each with the receiving node, the
+# message source, its chosen role, the probability of the role, and the time stamp. There are
+# two buffers, the messages sent in an iteration are written into one, while the messages
+# received are read from the other, then the two swap at the start of next iteration. The
+# buffers grow when more space is needed, and are reused afterwards.
+message_dtype = np.dtype([('target', np.int32), ('source', np.int32), ('role', np.int32),
+                          ('probability', np.float64), ('time_stamp', np.int32)])
+# bytes of one message in the air, the receiving node is not part of the content
+message_bytes = message_dtype.itemsize - message_dtype['target'].itemsize
+
+class MessageBus(object):
+    def __init__(self, capacity=1024):
+        self.buffers = [np.zeros(capacity, dtype=message_dtype),
+                        np.zeros(capacity, dtype=message_dtype)]
+        self.tx_index = 0  # index of the buffer for sending
+        self.tx_len = 0  # number of messages sent to the buffer
+        self.rx_len = 0  # number of messages in the buffer for receiving
+    # send the messages, one for each receiving node
+    def send(self, targets, sources, roles, probabilities, time_stamps):
+        message_num = len(targets)
+        buffer_tx = self.buffers[self.tx_index]
+        if self.tx_len + message_num > len(buffer_tx):
+            capacity = max(2*len(buffer_tx), self.tx_len + message_num)
+            buffer_new = np.zeros(capacity, dtype=message_dtype)
+            buffer_new[:self.tx_len] = buffer_tx[:self.tx_len]
+            self.buffers[self.tx_index] = buffer_new
+            buffer_tx = buffer_new
+        messages = buffer_tx[self.tx_len:self.tx_len+message_num]
+        messages['target'] = targets
+        messages['source'] = sources
+        messages['role'] = roles
+        messages['probability'] = probabilities
+        messages['time_stamp'] = time_stamps
+        self.tx_len = self.tx_len + message_num
+    # the messages sent become received, return them; the sending buffer is emptied
+    def swap(self):
+        self.rx_len = self.tx_len
+        self.tx_index = 1 - self.tx_index
+        self.tx_len = 0
+        return self.buffers[1-self.tx_index][:self.rx_len]
+
+# role assignment with message relay, the state of all nodes in the network
+# One call of iterate() is one step of message transmission. All nodes transmit once their
+# chosen role when initialized.
+# The local assignment information of all nodes are n*n tables: local_roles[i,j] is the role of
+# node j known by node i, with the probability in local_probs[i,j] and the time stamp in
+# local_times[i,j]; role_counts[i,j] is the number of nodes choosing role j known by node i.
+# The received messages are merged into the tables together: of the messages of the same source
+# to a node, the one with the latest time stamp is taken, and only if it's newer than what the
+# node knows. (The messages of a source arrive at a node in an iteration all with the same time
+# stamp, because they travel only on the shortest paths, so this is the same as processing
+# them one by one.)
+# The local scheme of a node has converged when every role is chosen by exactly one node. Each
+# node counts the roles not chosen by exactly one node, updated with the role counts, and only
+# the nodes whose local scheme changed in the iteration are checked.
+# The iteration is driven by events: the pairs of node and source whose information has just
+# changed make the worklist of relays for the iteration, so the work of an iteration grows
+# with the messages in transmission, instead of checking all pairs of nodes and sources.
+# "relay_targets" is a RelayTargets or another relay strategy. The transmissions are counted
+# for each iteration, with the most messages sent by one node in an iteration, for the radio
+# budget of the robots.
+class RoleAssignment(object):
+    def __init__(self, connections, relay_targets, pref_dist):
+        net_size = connections.size
+        self.net_size = net_size
+        self.relay_targets = relay_targets
+        self.pref_dist = np.asarray(pref_dist)  # no need to normalize it
+        nodes = np.arange(net_size)
+        initial_roles = np.argmax(self.pref_dist, axis=1)  # the chosen role
+        # the local assignment information, -1 for no information
+        self.local_roles = -np.ones((net_size, net_size), dtype=np.int32)
+        self.local_probs = np.zeros((net_size, net_size))
+        self.local_times = -np.ones((net_size, net_size), dtype=np.int32)
+        self.role_counts = np.zeros((net_size, net_size), dtype=np.int32)
+        # populate the chosen role of itself to the local assignment information
+        self.local_roles[nodes, nodes] = initial_roles
+        self.local_probs[nodes, nodes] = self.pref_dist[nodes, initial_roles]
+        self.local_times[nodes, nodes] = 0
+        self.role_counts[nodes, initial_roles] = 1
+        self.roles_unsettled = (net_size - 1) * np.ones(net_size, dtype=int)
+            # number of roles not chosen by exactly one node in role_counts[i]
+        self.scheme_converged = np.zeros(net_size, dtype=bool)
+        self.converged_num = 0  # number of nodes whose local scheme has converged
+        self.iter_count = 0  # also used as time stamp in message
+        self.transmission_history = []  # number of message transmissions in each iteration
+        self.transmission_sum = 0  # number of message transmissions in all iterations
+        self.peak_transmissions = 0  # most messages sent by one node in an iteration
+        # all nodes send their chosen role to all neighbors
+        self.message_bus = MessageBus(max(1024, 4*len(connections.col_index)))
+        pair_index, relay_nodes = relay_targets.expand(nodes, nodes)
+        sources = nodes[pair_index]
+        self.message_bus.send(relay_nodes, sources, initial_roles[sources],
+                              self.local_probs[sources, sources], 0)
+        self.count_transmissions(sources)
+    # count the transmissions of the iteration, given the sending node of every message
+    def count_transmissions(self, transmitters):
+        self.transmission_total = len(transmitters)  # message transmissions for this iteration
+        self.transmission_history.append(self.transmission_total)
+        self.transmission_sum = self.transmission_sum + self.transmission_total
+        if len(transmitters) != 0:
+            self.peak_transmissions = max(self.peak_transmissions,
+                                          int(np.max(np.bincount(transmitters))))
+    # bytes of all message transmissions
+    def transmission_bytes(self):
+        return self.transmission_sum * message_bytes
+    # the role chosen by each node
+    def chosen_roles(self):
+        return np.diagonal(self.local_roles)
+    # whether each node knows other nodes choosing the same role as itself
+    def conflicting(self):
+        nodes = np.arange(self.net_size)
+        return self.role_counts[nodes, self.chosen_roles()] > 1
+    # add "changes" to role_counts[nodes,roles], and keep the unsettled roles up to date
+    def change_counts(self, nodes, roles, changes):
+        cell_keys = np.unique(nodes.astype(np.int64) * self.net_size + roles)
+        cell_nodes = cell_keys // self.net_size
+        cell_roles = cell_keys % self.net_size
+        unsettled_old = self.role_counts[cell_nodes, cell_roles] != 1
+        np.add.at(self.role_counts, (nodes, roles), changes)
+        unsettled_new = self.role_counts[cell_nodes, cell_roles] != 1
+        np.add.at(self.roles_unsettled, cell_nodes,
+                  unsettled_new.astype(int) - unsettled_old.astype(int))
+    # one step of message transmission, return the nodes that are yielding on chosen roles,
+    # and the old roles of them before yielding
+    def iterate(self):
+        net_size = self.net_size
+        self.iter_count = self.iter_count + 1
+        # process the received messages, sorted by node they are the inboxes of the nodes
+        messages = self.message_bus.swap()
+        if np.any(messages['source'] == messages['target']):
+            i = messages['target'][messages['source'] == messages['target']][0]
+            print("error, node {} receives message of itself".format(i))
+            sys.exit()
+        # the message with the latest time stamp of each source to each node, the earliest
+        # received of those with the same time stamp
+        pair_keys = messages['target'].astype(np.int64) * net_size + messages['source']
+        order = np.lexsort((-messages['time_stamp'], pair_keys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_keys[order[1:]] != pair_keys[order[:-1]]
+        messages = messages[order[first]]
+        targets = messages['target']
+        sources = messages['source']
+        # received message will only take any effect if time stamp is new
+        newer = messages['time_stamp'] > self.local_times[targets, sources]
+        messages = messages[newer]
+        targets = targets[newer]
+        sources = sources[newer]
+        roles = messages['role']
+        # update the role counts, each pair of node and source is updated once
+        roles_old = self.local_roles[targets, sources]
+        initialized = roles_old >= 0  # has been initialized before, not -1
+        self.change_counts(np.concatenate((targets[initialized], targets)),
+                           np.concatenate((roles_old[initialized], roles)),
+                           np.concatenate((-np.ones(np.sum(initialized), dtype=np.int32),
+                                           np.ones(len(targets), dtype=np.int32))))
+        self.local_roles[targets, sources] = roles
+        self.local_probs[targets, sources] = messages['probability']
+        self.local_times[targets, sources] = messages['time_stamp']
+        # check conflict with itself, yield if the other node prefers the role no less
+        chosen_roles = self.local_roles[targets, targets]
+        yielding = ((roles == chosen_roles) &
+                    (messages['probability'] >= self.pref_dist[targets, chosen_roles]))
+        yield_nodes = np.unique(targets[yielding])  # the nodes that are yielding on chosen roles
+        yield_roles = self.local_roles[yield_nodes, yield_nodes]  # the old roles of them
+        # change the choice of role for those decide to, avoid the roles that have been taken
+        if len(yield_nodes) != 0:
+            pref_dist_temp = np.where(self.role_counts[yield_nodes] != 0, -1.0,
+                                      self.pref_dist[yield_nodes])
+            roles_new = np.argmax(pref_dist_temp, axis=1)
+            no_role = pref_dist_temp[np.arange(len(yield_nodes)), roles_new] < 0
+            if np.any(no_role):
+                print("error, node {} has no available role".format(yield_nodes[no_role][0]))
+                sys.exit()
+            # roles_new is good to go
+            self.change_counts(np.concatenate((yield_nodes, yield_nodes)),
+                               np.concatenate((yield_roles, roles_new)),
+                               np.concatenate((-np.ones(len(yield_nodes), dtype=np.int32),
+                                               np.ones(len(yield_nodes), dtype=np.int32))))
+            self.local_roles[yield_nodes, yield_nodes] = roles_new
+            self.local_probs[yield_nodes, yield_nodes] = self.pref_dist[yield_nodes, roles_new]
+            self.local_times[yield_nodes, yield_nodes] = self.iter_count
+        # transmit the received messages or initial new message transmission
+        # the worklist of relays: the new information received, and the new roles chosen
+        transmitters = np.concatenate((targets, yield_nodes))
+        sources = np.concatenate((sources, yield_nodes))
+        pair_index, relay_nodes = self.relay_targets.expand(sources, transmitters)
+        transmitters = transmitters[pair_index]
+        sources = sources[pair_index]
+        self.message_bus.send(relay_nodes, sources, self.local_roles[transmitters, sources],
+                              self.local_probs[transmitters, sources],
+                              self.local_times[transmitters, sources])
+        self.count_transmissions(transmitters)
+        # check if role assignment scheme is converged at the nodes with changed scheme
+        changed = np.unique(np.concatenate((targets, yield_nodes)))
+        changed = changed[~self.scheme_converged[changed]]
+        settled = changed[self.roles_unsettled[changed] == 0]
+        self.scheme_converged[settled] = True
+        self.converged_num = self.converged_num + len(settled)
+        return yield_nodes, yield_roles
+    # whether the role assignment schemes have converged at all nodes
+    def all_converged(self):
+        return self.converged_num == self.net_size
+
+# run the role assignment until the schemes have converged at all nodes
+# return the number of iterations, the number of message transmissions in total, and the most
+# messages sent by one node in an iteration
+def role_assignment_trial(connections, relay_targets, pref_dist):
+    assignment = RoleAssignment(connections, relay_targets, pref_dist)
+    while not assignment.all_converged():
+        assignment.iterate()
+    return assignment.iter_count, assignment.transmission_sum, assignment.peak_transmissions
@@ -0,0 +1,221 @@
+# run many trials of the triangle grid network simulations in parallel, without graphics
+# The trials on one network are spread over a pool of processes, one for each core by default.
+# Every trial has its own seed derived from the base seed and the trial index, so the results
+# don't depend on how the trials are divided among the processes, and any single trial can be
+# run again by its seed, here or with '-s' in the simulation window.
+
+# input arguments:
+# '-f': filename of the triangle grid network
+# '-d': number of decisions each node can choose from, for the consensus; default=30
+# '-r': number of trials; default=100
+# '-p': number of processes; default is the number of cores
+# '-s': base seed for deriving the seeds of the trials; default=0
+# '-k': keep only the k largest probabilities of each node for the consensus, see TopKDists in
+#       consensus_functions.py; default is to keep all of them
+# '-e': epsilon of the active-set scheduling for the consensus, see ActiveSet in
+#       consensus_functions.py; default is to update all nodes every step
+# '--seed': seed of a single trial to reproduce, run it alone and print its result
+# '--role': run the role assignment trials instead of the probabilistic consensus
+# '--relay': relay strategy of the role assignment, 'flood', 'tree' or 'random', see
+#       relay_strategy() in relay_functions.py; default='flood'
+# '--forward': probability of the non-designated relays for the 'random' strategy; default=0.5
+
+# The probabilistic consensus trials given to a process are run together as a batch, see
+# consensus_trials() in consensus_functions.py. The role assignment trials are run one by
+# one, see role_assignment_trial() in relay_functions.py.
+
+from __future__ import division
+from trigridnet_generator import *
+from neighbor_functions import *
+from consensus_functions import *
+from relay_functions import *
+from index_functions import *
+import multiprocessing
+import math, sys, os, getopt, time
+import numpy as np
+
+# parameters of the decision distribution evolution, same as the consensus simulation
+dist_diff_thres = 0.3
+dist_diff_power = 0.3
+
+# the network and options shared by the trials in a process, set when the process starts
+trial_setup = {}
+
+# seed of a trial, derived from the base seed and the trial index
+def trial_seed(base_seed, trial_index):
+    return int(np.random.RandomState([base_seed, trial_index]).randint(2**31-1))
+
+# prepare the network for the trials of this process
+def init_trials(net_filepath, deci_num, top_k, epsilon, role_mode, relay_name, forward_prob):
+    net_index = NetworkIndex(net_filepath)  # the index is already built by the main process
+    connections = net_index.connections()
+    trial_setup['connections'] = connections
+    trial_setup['deci_num'] = deci_num
+    trial_setup['top_k'] = top_k
+    trial_setup['epsilon'] = epsilon
+    trial_setup['role_mode'] = role_mode
+    if role_mode:
+        relay_targets = RelayTargets.from_gradients(connections, net_index.hop_counts())
+        trial_setup['relay_targets'] = relay_strategy(relay_targets, relay_name, forward_prob)
+
+# run a chunk of trials, each given as (trial index, seed)
+# return a list of (trial index, seed, steps, decision, order of decision) for consensus, or
+# (trial index, seed, iterations, transmissions, most transmissions of a node in an iteration)
+# for role assignment
+def run_trials(trials):
+    connections = trial_setup['connections']
+    net_size = connections.size
+    results = []
+    if trial_setup['role_mode']:
+        relay_targets = trial_setup['relay_targets']
+        for trial_index, seed in trials:
+            # same initial preference distribution as the simulation seeded by '-s'
+            random_state = np.random.RandomState(seed)
+            pref_dist = random_state.rand(net_size, net_size)
+            if isinstance(relay_targets, RandomRelay):
+                relay_targets.random_state = random_state  # same forwarding as the simulation
+            iter_count, transmission_sum, peak_transmissions = role_assignment_trial(
+                connections, relay_targets, pref_dist)
+            results.append((trial_index, seed, iter_count, transmission_sum,
+                            peak_transmissions))
+        return results
+    deci_num = trial_setup['deci_num']
+    top_k = trial_setup['top_k']
+    if top_k is None:
+        deci_dists = np.array([np.random.RandomState(seed).rand(net_size, deci_num)
+                               for trial_index, seed in trials])
+        deci_dists = deci_dists / np.sum(deci_dists, axis=2)[:,:,None]
+        # the order of average initial decisions for each trial
+        avg_dist_id_sorts = np.argsort(np.mean(deci_dists, axis=1), axis=1)[:,::-1]
+    else:
+        # sparse distributions of the nodes of all trials one after another
+        dists_list = [TopKDists.from_random(np.random.RandomState(seed), net_size, deci_num,
+                      top_k) for trial_index, seed in trials]
+        deci_dists = TopKDists.concatenate(dists_list, deci_num, top_k)
+        avg_dist_id_sorts = np.array([np.argsort(dists.mean())[::-1]
+                                      for dists in dists_list])
+    all_steps, all_decisions, skipped_total = consensus_trials(connections, deci_dists,
+        dist_diff_thres, dist_diff_power, trial_setup['epsilon'])
+    for k in range(len(trials)):
+        deci_order = list(avg_dist_id_sorts[k]).index(all_decisions[k]) + 1
+        results.append((trials[k][0], trials[k][1], int(all_steps[k]),
+                        int(all_decisions[k]), deci_order))
+    return results
+
+# print the results of all trials in order of trial index, then the merged statistics
+def report_trials(results, role_mode):
+    results = sorted(results)
+    steps = np.array([result[2] for result in results])
+    if role_mode:
+        print("\ntrial, seed, iterations, transmissions, peak transmissions of a node")
+    else:
+        print("\ntrial, seed, steps, decision, order of decision")
+    for result in results:
+        print(", ".join([str(value) for value in result]))
+    print("\nstatistics of {} trials".format(len(results)))
+    print("average steps: {}".format(np.mean(steps)))
+    print("maximum steps: {} (seed {})".format(np.max(steps), results[np.argmax(steps)][1]))
+    print("minimum steps: {} (seed {})".format(np.min(steps), results[np.argmin(steps)][1]))
+    print("std dev of steps: {}".format(np.std(steps)))
+    if role_mode:
+        transmissions = np.array([result[3] for result in results])
+        print("average transmissions: {} ({} bytes)".format(np.mean(transmissions),
+            np.mean(transmissions) * message_bytes))
+        print("most transmissions of a node in an iteration: {}".format(
+            max([result[4] for result in results])))
+    else:
+        deci_orders = np.array([result[4] for result in results])
+        print("average order of decision: {}".format(np.mean(deci_orders)))
+        # trials converged to the first decision, which the seed robots command
+        steps_seed = steps[np.array([result[3] for result in results]) == 0]
+        print("{} out of {} trials converge to decision 0".format(len(steps_seed),
+            len(results)))
+        if len(steps_seed) != 0:
+            print("\ton average of {} steps".format(np.mean(steps_seed)))
+
+def main():
+    net_folder = 'trigrid-networks'  # folder for triangle grid network files
+    net_filename = '30-1'  # default filename of the network file, if no input
+    net_filepath = os.path.join(os.getcwd(), net_folder, net_filename)
+    deci_num = 30  # default number of decisions each node can choose from
+    trial_num = 100  # default number of trials
+    process_num = multiprocessing.cpu_count()  # default one process for each core
+    base_seed = 0  # default base seed
+    single_seed = None  # seed of the single trial to reproduce
+    top_k = None  # number of probabilities kept for each node, all kept if None
+    epsilon = None  # threshold of the active-set scheduling, all nodes updated if None
+    role_mode = False  # option as to whether or not running the role assignment
+    relay_name = 'flood'  # relay strategy of the role assignment
+    forward_prob = 0.5  # probability of the non-designated relays of 'random' strategy
+
+    # read command line options
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'f:d:r:p:s:k:e:', ['seed=', 'role', 'relay=',
+                                                                   'forward='])
+    except getopt.GetoptError as err:
+        print(str(err))
+        sys.exit()
+    for opt,arg in opts:
+        if opt == '-f':
+            net_filename = arg
+            net_filepath = os.path.join(os.getcwd(), net_folder, net_filename)
+            # check if this file exists
+            if not os.path.isfile(net_filepath):
+                print("{} does not exist".format(net_filename))
+                sys.exit()
+        elif opt == '-d':
+            deci_num = int(arg)
+        elif opt == '-r':
+            trial_num = int(arg)
+        elif opt == '-p':
+            process_num = int(arg)
+        elif opt == '-s':
+            base_seed = int(arg)
+        elif opt == '-k':
+            top_k = int(arg)
+        elif opt == '-e':
+            epsilon = float(arg)
+        elif opt == '--seed':
+            single_seed = int(arg)
+        elif opt == '--role':
+            role_mode = True
+        elif opt == '--relay':
+            relay_name = arg
+            if relay_name not in relay_strategy_names:
+                print("relay strategy should be one of {}".format(relay_strategy_names))
+                sys.exit()
+        elif opt == '--forward':
+            forward_prob = float(arg)
+
+    # reproduce a single trial in this process
+    if single_seed is not None:
+        init_trials(net_filepath, deci_num, top_k, epsilon, role_mode, relay_name, forward_prob)
+        report_trials(run_trials([(0, single_seed)]), role_mode)
+        return
+
+    # build the analytics index of the network once, before the processes read it
+    net_index = NetworkIndex(net_filepath)
+    net_index.connections()
+    if role_mode:
+        net_index.hop_counts()
+
+    # divide the trials into chunks, a few chunks for each process to balance the load
+    trials = [(i, trial_seed(base_seed, i)) for i in range(trial_num)]
+    chunk_size = max(1, int(math.ceil(trial_num / (process_num * 4.0))))
+    chunks = [trials[i:i+chunk_size] for i in range(0, trial_num, chunk_size)]
+    print("{} trials on {}, {} processes".format(trial_num, net_filename, process_num))
+    time_start = time.time()
+    pool = multiprocessing.Pool(process_num, init_trials,
+                                (net_filepath, deci_num, top_k, epsilon, role_mode, relay_name,
+                                 forward_prob))
+    results = []
+    for chunk_results in pool.imap_unordered(run_trials, chunks):
+        results.extend(chunk_results)
+        print("{} trials finished".format(len(results)))
+    pool.close()
+    pool.join()
+    report_trials(results, role_mode)
+    print("time spent: {} seconds".format(time.time() - time_start))
+
+if __name__ == '__main__':
+    main()
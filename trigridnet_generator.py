@@ -23,16 +23,16 @@
 
 
 import math, random, sys, os, time
-import matplotlib.pyplot as plt
 import getopt
 
 def main():
     size = 0  # network size to be read from input
 
     savefile = True
+    plotting = True
     # read command line options
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'n:', ['nosave'])
+        opts, args = getopt.getopt(sys.argv[1:], 'n:', ['nosave', 'noplot'])
     except getopt.GetoptError as err:
         print str(err)
         sys.exit()
@@ -41,42 +41,12 @@ def main():
             size = int(arg)
         elif opt == '--nosave':
             savefile = False
+        elif opt == '--noplot':
+            plotting = False
 
     node_size = 10  # default 10
 
-    # use list to store the node information
-    nodes_t = []  # target nodes pool, for decided nodes in target network
-    nodes_a = []  # available nodes pool, for nodes available to be added to network
-    # place the first node at the origin for the network
-    nodes_t.append((0,0))
-    for pos in get_neighbors(nodes_t[0]):
-        nodes_a.append(pos)  # append all six neighbors to available pool
-
-    # loop for randomly placing new nodes from available pool to generate the network
-    for i in range(size-1):  # first node is decided and excluded
-        # randomly choose one from the available pool
-        pos_new = random.choice(nodes_a)
-        nodes_a.remove(pos_new)  # remove selected node from available pool
-        nodes_t.append(pos_new)  # add new node to the target pool
-        # check and update every neighbor of newly selected node
-        for pos in get_neighbors(pos_new):
-            if pos in nodes_t: continue
-            if pos in nodes_a: continue
-            # if none of the above, add to the available pool
-            nodes_a.append(pos)
-
-    # generate the connection variable, 0 for not connected, 1 for connected
-    connections = [[0 for j in range(size)] for i in range(size)]  # populated with zeros
-    for i in range(size):
-        for j in range(i+1, size):
-            # find if nodes[i] and nodes[j] are neighbors
-            diff_x = nodes_t[i][0] - nodes_t[j][0]
-            diff_y = nodes_t[i][1] - nodes_t[j][1]
-            if abs(diff_x) + abs(diff_y) == 1 or diff_x * diff_y == -1:
-                # condition 1: one of the axis value difference is 1, the other is 0
-                # condition 2: one of the axis value difference is 1, the other is -1
-                connections[i][j] = 1
-                connections[j][i] = 1
+    nodes_t = generate_trigrid(size)  # node positions of the network
 
     # the network has been generated, save it to file
     if savefile:
@@ -91,9 +61,16 @@ def main():
             new_filename = str(size) + '-' + str(filename_count)
         new_filepath = os.path.join(save_path, new_filename)
         f = open(new_filepath, 'w')
-        for pos in nodes_t:
-            f.write(str(pos[0]) + ' ' + str(pos[1]) + '\n')
+        f.write(''.join([str(pos[0]) + ' ' + str(pos[1]) + '\n' for pos in nodes_t]))
         f.close()
+        print "network saved to {}".format(new_filename)
+
+    if not plotting:
+        return
+    import matplotlib.pyplot as plt  # only needed for plotting the network
+
+    # generate the connections, each connected pair of nodes listed once
+    pairs_i, pairs_j = trigrid_pairs(nodes_t)
 
     # plot the network as dots and lines
     fig_side_size = int(math.sqrt(size)*0.7)  # calculate fig side size from network size
@@ -119,11 +96,9 @@ def main():
     splt.set_xlim([xmin-0.5, xmax+0.5])  # leave space on both sides
     splt.set_ylim([ymin-0.5, ymax+0.5])
     # draw the connections as lines
-    for i in range(size):
-        for j in range(i+1, size):
-            if connections[i][j] == 1:
-                splt.plot([nodes_t_plt[i][0], nodes_t_plt[j][0]],
-                          [nodes_t_plt[i][1], nodes_t_plt[j][1]], '-k')
+    for i, j in zip(pairs_i, pairs_j):
+        splt.plot([nodes_t_plt[i][0], nodes_t_plt[j][0]],
+                  [nodes_t_plt[i][1], nodes_t_plt[j][1]], '-k')
     for i in range(size):
         splt.plot(nodes_t_plt[i][0], nodes_t_plt[i][1], 'o',
                   markersize=node_size, markerfacecolor='black')
@@ -135,6 +110,35 @@ def main():
     plt.close(fig)
 
 
+# generate a random network of "size" nodes on triangle grid, return the node positions
+# The new nodes are picked at random from the available positions around the network. The
+# available positions are kept in a list for the random picking, and in a set for checking if
+# a position is taken or available; a picked position is removed from the list by moving the
+# last one to its place. (It used to check and remove the positions in lists, which took time
+# growing with the network size for every new node.)
+def generate_trigrid(size):
+    nodes_t = [(0,0)]  # target nodes pool, place the first node at the origin
+    nodes_t_set = set(nodes_t)
+    nodes_a = get_neighbors(nodes_t[0])  # available nodes pool, all six neighbors
+    nodes_a_set = set(nodes_a)
+    for i in range(size-1):  # first node is decided and excluded
+        # randomly choose one from the available pool
+        index = random.randrange(len(nodes_a))
+        pos_new = nodes_a[index]
+        nodes_a[index] = nodes_a[-1]
+        nodes_a.pop()
+        nodes_a_set.remove(pos_new)
+        nodes_t.append(pos_new)  # add new node to the target pool
+        nodes_t_set.add(pos_new)
+        # check and update every neighbor of newly selected node
+        for pos in get_neighbors(pos_new):
+            if pos in nodes_t_set: continue
+            if pos in nodes_a_set: continue
+            # if none of the above, add to the available pool
+            nodes_a.append(pos)
+            nodes_a_set.add(pos)
+    return nodes_t
+
 # return the positions of the six neighbors of the input node on triangle grid
 # The first four neighbors are just like the situation in the Cartesian coordinates, the last
 # two neighbors are the two on the diagonal line along the y=-x axis, because the triangle
@@ -146,6 +150,24 @@ def get_neighbors(pos):
             (x, y+1), (x, y-1),
             (x+1, y-1), (x-1, y+1)]
 
+# find the connected pairs of nodes on triangle grid
+# Instead of testing every pair of nodes, the six neighbor positions of each node are looked up
+# in a hash map of the node positions, so it takes linear time of the network size.
+# return two lists of node indices, each connection listed once with smaller index first
+def trigrid_pairs(nodes):
+    node_indices = {}  # key is the node position, value is the node index
+    for i in range(len(nodes)):
+        node_indices[tuple(nodes[i])] = i
+    pairs_i = []
+    pairs_j = []
+    for i in range(len(nodes)):
+        for pos in get_neighbors(nodes[i]):
+            j = node_indices.get(pos, -1)
+            if j > i:  # -1 for no node at this position
+                pairs_i.append(i)
+                pairs_j.append(j)
+    return pairs_i, pairs_j
+
 # return Cartesian coordinates of triangle grid nodes for plotting
 def trigrid_to_cartesian(pos):
     # the resulting coordinates should be in floating point numbers
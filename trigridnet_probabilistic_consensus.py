@@ -10,24 +10,27 @@
 # '-d': number of decisions each node can choose from
 # '-r': repeat times of simulation, with different initial random distribution; default=0
 # '--nobargraph': option to skip the bar graph visualization
+# '--batch': run all the repeated simulations together as a batch, skipping the graphics
+# '--headless': run as the batch without any window or per-iteration output, and print the
+#       results as one line of JSON at exit, for running on servers without display
+# '-s': seed of the random initial distributions, to watch a trial from trial_runner.py
+# '-k': keep only the k largest probabilities of each node in the batch, see TopKDists in
+#       consensus_functions.py; default is to keep all of them
+# '-e': only update the nodes whose distribution, or a neighbor's distribution, moved more
+#       than this epsilon in last iteration, see ActiveSet in consensus_functions.py
+# '-m': path of the file to write the entropy and groups of every iteration, also in batch
+#       mode and with '--nobargraph', see metrics_functions.py and metrics_plotter.py
 
 # Pygame will be used to animate the dynamic group changes in the network;
 # Matplotlib will be used to draw the unipolarity in a 3D bar graph, the whole decision
 # distribution is not necessary.
 
 # Algorithm to update the groups in 2D triangle grid network:
-# Using a pool of indices for nodes that have not been grouped, those labeled into a
-# group will be remove from the pool. As long as the pool is not enpty, a while loop
-# will continue searching groups one by one. In the loop, it initialize a new group
-# with first node in the pool. It also initialize a fifo-like variable(p_members) for
-# potential members of this group, and an index variable(p_index) for iterating through
-# the potential members. If p_members[p_index] doesn't share same decidion with first node,
-# p_index increases by 1, will check next value in p_members. If it does, then a new member
-# for this group has been found, it will be removed from the pool and p_members, and added
-# to current group. The new group member will also introduce its neighbors as new
-# potential members, but they should not be in p_members and current group, and should be
-# in node pool. The member search for this group will end if p_index iterates to the end
-# of p_members.
+# The groups are the connected components of the network, after removing the connections
+# between nodes of different dominant decisions. They are labeled by union-find on all the
+# remaining connections at once, see consensus_groups() in consensus_functions.py. (It used to
+# search groups one by one from a pool of ungrouped nodes, growing each group from a list of
+# potential members, which took much longer with the removals from the lists.)
 
 # 01/19/2018
 # Testing an invented concept called "holistic dependency", for measuring how much the most
@@ -95,12 +98,14 @@
 # background. Make the node size larger.
 
 
-import pygame
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
 from trigridnet_generator import *
 from formation_functions import *
-import math, sys, os, getopt, time
+from neighbor_functions import *
+from consensus_functions import *
+from metrics_functions import *
+from dependency_functions import *
+from index_functions import *
+import math, sys, os, getopt, time, json
 import numpy as np
 
 net_size = 30  # default size of the triangle grid network
@@ -114,9 +119,22 @@ repeat_times = 1  # default times of running the program repeatly
 
 nobargraph = False  # option as to whether or not skipping the 3D bar graph
 
+batch_mode = False  # option as to whether or not running the simulations as a batch
+
+headless = False  # option as to whether or not running without any window
+
+random_seed = None  # seed of numpy random generator, not seeded if None
+
+top_k = None  # number of probabilities kept for each node in batch mode, all kept if None
+
+epsilon = None  # threshold of the active-set scheduling, all nodes updated if None
+
+metrics_filepath = None  # path of the metrics file, no metrics written if None
+
 # read command line options
 try:
-    opts, args = getopt.getopt(sys.argv[1:], 'f:d:r:', ['nobargraph'])
+    opts, args = getopt.getopt(sys.argv[1:], 'f:d:r:s:k:e:m:', ['nobargraph', 'batch',
+                                                               'headless'])
     # The colon after 'f' means '-f' requires an argument, it will raise an error if no
     # argument followed by '-f'. But if '-f' is not even in the arguments, this won't raise
     # an error. So it's necessary to define the default network filename
@@ -142,107 +160,118 @@ for opt,arg in opts:
         repeat_times = int(arg)
     elif opt == '--nobargraph':
         nobargraph = True
-
-# read the network from file
-nodes = []  # integers only is necessary to describe the network's node positions
-f = open(net_filepath, 'r')
-new_line = f.readline()
-while len(new_line) != 0:  # not the end of the file yet
-    pos_str = new_line[0:-1].split(' ')  # get rid of '\n' at end
-    pos = [int(pos_str[0]), int(pos_str[1])]  # convert to integers
-    nodes.append(pos)
-    new_line = f.readline()
-
-# generate the connection matrix, 0 for not connected, 1 for connected
-connections = [[0 for j in range(net_size)] for i in range(net_size)]  # all zeros
-for i in range(net_size):
-    for j in range(i+1, net_size):
-        # find if nodes[i] and nodes[j] are neighbors
-        diff_x = nodes[i][0] - nodes[j][0]
-        diff_y = nodes[i][1] - nodes[j][1]
-        if abs(diff_x) + abs(diff_y) == 1 or diff_x * diff_y == -1:
-            # condition 1: one of the axis value difference is 1, the other is 0
-            # condition 2: one of the axis value difference is 1, the other is -1
-            connections[i][j] = 1
-            connections[j][i] = 1
+    elif opt == '--batch':
+        batch_mode = True
+    elif opt == '--headless':
+        headless = True
+        batch_mode = True  # the batch never opens a window
+    elif opt == '-s':
+        random_seed = int(arg)
+    elif opt == '-k':
+        top_k = int(arg)
+    elif opt == '-e':
+        epsilon = float(arg)
+    elif opt == '-m':
+        metrics_filepath = arg
+if top_k is not None and not batch_mode:
+    print "'-k' is only used in batch mode, all probabilities are kept"
+
+# read the network from the analytics index next to the network file, which is built on the
+# first run, see index_functions.py
+net_index = NetworkIndex(net_filepath)
+nodes = net_index.nodes().tolist()  # integers only to describe the network's node positions
+# the connections in sparse form, from the neighbors of the nodes on the grid
+connections = net_index.connections()
 # another list type variable for easily indexing from the nodes
-# converted from the above connection matrix variable
-connection_lists = []  # the lists of connecting nodes for each node
-for i in range(net_size):
-    connection_list_temp = []
-    for j in range(net_size):
-        if connections[i][j]: connection_list_temp.append(j)
-    connection_lists.append(connection_list_temp)
+connection_lists = connections.to_lists()  # the lists of connecting nodes for each node
 
 # until here, the network information has been read and interpreted completely
-# calculate the "holistic dependency"
+# calculate the "holistic dependency", see dependency_functions.py
 calculate_h_dependency = False  # option for calculating holistic dependency
-# this computation takes significant time when net_size is above 50
-# the algorithm below has been optimized to the best efficient I can achieve
+dependency_process_num = 1  # number of processes to spread the shortest path searches over
 if calculate_h_dependency:
-    dependencies = [0.0 for i in range(net_size)]  # individual dependency for each robot
-    holistic_dependency_abs = 0.0  # absolute holistic dependency
-    holistic_dependency_rel = 0.0  # relative holistic dependency
-    # Search the shortest path for every pair of nodes i and j.
-    for i in range(net_size-1):  # i is the starting node
-        for j in range(i+1, net_size):  # j is the target node
-            # (There might be multiple path sharing the shortest length, which are totally fine,
-            # all the path should count.)
-            # Some useful tricks have been used to make the search efficient.
-            path_potential = [[i]]  # the paths that are in progress, potentially the shortest
-            path_succeed = []  # the shortest paths
-            # start searching
-            search_end = False  # flag indicating if the shortest path is found
-            nodes_reached = {i}  # dynamic pool for nodes in at least one of the paths
-                # key to speed up this search algorithm
-            while not search_end:
-                # increase one step for all paths in path_potential
-                path_potential2 = []  # for the paths adding one step from path_potential
-                nodes_reached_add = set()  # to be added to nodes_reached
-                node_front_pool = dict()  # solutions for next qualified nodes of front node
-                for path in path_potential:
-                    node_front = path[-1]  # front node in this current path
-                    nodes_next = []  # for nodes qualified as next one on path
-                    if node_front in node_front_pool.keys():
-                        nodes_next = node_front_pool[node_front]
-                    else:
-                        for node_n in connection_lists[node_front]:  # neighbor node
-                            if node_n == j:  # the shortest path found, only these many steps needed
-                                nodes_next.append(node_n)
-                                search_end = True
-                                continue
-                            if node_n not in nodes_reached:
-                                nodes_reached_add.add(node_n)
-                                nodes_next.append(node_n)
-                        node_front_pool[node_front] = nodes_next[:]  # add new solution
-                    for node_next in nodes_next:
-                        path_potential2.append(path + [node_next])
-                for node in nodes_reached_add:
-                    nodes_reached.add(node)
-                # empty the old potential paths
-                path_potential = []
-                # assign the new potential paths, copy with list comprehension method
-                path_potential = [[node for node in path] for path in path_potential2]
-            # if here, the shortest paths have been found; locate them
-            for path in path_potential:
-                if path[-1] == j:
-                    path_succeed.append(path)
-            # distribute the dependency value evenly for each shortest paths
-            d_value = 1.0 / len(path_succeed)
-            for path in path_succeed:
-                for node in path[1:-1]:  # exclude start and end nodes
-                    dependencies[node] = dependencies[node] + d_value
-    # print(dependencies)
-    dependency_mean = sum(dependencies)/net_size
-    node_max = dependencies.index(max(dependencies))
-    holistic_dependency_abs = dependencies[node_max] - dependency_mean
-    holistic_dependency_rel = dependencies[node_max] / dependency_mean
+    # individual dependency for each robot
+    dependencies = net_index.dependencies(dependency_process_num).tolist()
+    # absolute and relative holistic dependency
+    holistic_dependency_abs, holistic_dependency_rel, node_max = holistic_dependency(
+        dependencies)
     print "absolute holistic dependency {}".format(holistic_dependency_abs)
     print "relative holistic dependency {}".format(holistic_dependency_rel)
 # Also uncomment two lines somewhere below to highlight maximum individual dependency node,
 # and halt the program after drawing the network.
 
+# parameters of the decision distribution evolution
+# Difference of two distributions is the sum of absolute values of differences
+# of all individual probabilities.
+# Overflow threshold for the distribution difference. Distribution difference larger than
+# this means neighbors are not quite agree with each other, so no further improvement on
+# unipolarity will be performed. If distribution difference is lower than the threshold,
+# linear multiplier will be used to improve unipolarity on the result distribution.
+dist_diff_thres = 0.3
+# Exponent of a power function to map the distribution difference ratio to a larger value,
+# and therefore slow donw the growing rate.
+dist_diff_power = 0.3
+
+# The first simulation after seeding has the same initial distributions as the trial of this
+# seed in trial_runner.py.
+np.random.seed(random_seed)
+
+# the entropy and groups of every iteration are streamed to the metrics file, the trial index
+# of a record is the index of the simulation
+metrics = None
+if metrics_filepath is not None:
+    metrics = MetricsWriter(metrics_filepath, net_size, deci_num)
+
+# report statistic result of the simulations
+def report_statistics(all_steps, all_deci_orders):
+    print("\nstatistics\nsteps to converge: {}".format(all_steps))
+    print("final decision in order: {}".format(all_deci_orders))
+    print("average steps: {}".format(np.mean(np.array(all_steps))))
+    print("maximum steps: {}".format(max(all_steps)))
+    print("minimum steps: {}".format(min(all_steps)))
+    print("std dev of steps: {}".format(np.std(np.array(all_steps))))
+
+# run all the simulations together as a batch, see consensus_trials() in consensus_functions.py
+# The distributions of all simulations evolve together in a (repeat_times, net_size, deci_num)
+# array, a simulation is retired from the batch once converged. No graphics are drawn, and
+# pygame is not even imported.
+if batch_mode:
+    if top_k is None:
+        # variable for decision distributions of all individuals in all simulations
+        deci_dists = np.random.rand(repeat_times, net_size, deci_num)
+        deci_dists = deci_dists / np.sum(deci_dists, axis=2)[:,:,None]
+        # the order of average initial decisions for each simulation
+        avg_dist_id_sorts = np.argsort(np.mean(deci_dists, axis=1), axis=1)[:,::-1]
+    else:
+        # sparse distributions of the nodes of all simulations one after another, drawn from
+        # the same random numbers as the dense ones
+        deci_dists = TopKDists.from_random(np.random, repeat_times*net_size, deci_num, top_k)
+        avg_dist_id_sorts = np.array([np.argsort(deci_dists.select(
+            slice(i*net_size, (i+1)*net_size)).mean())[::-1] for i in range(repeat_times)])
+    all_steps, all_decisions, skipped_total = consensus_trials(connections, deci_dists,
+        dist_diff_thres, dist_diff_power, epsilon, metrics, verbose=not headless)
+    if metrics is not None:
+        metrics.close()
+    all_steps = all_steps.tolist()
+    all_deci_orders = [list(avg_dist_id_sorts[i]).index(all_decisions[i]) + 1
+                       for i in range(repeat_times)]
+    if headless:
+        print(json.dumps({'network': net_filename, 'decisions': deci_num,
+                          'seed': random_seed, 'steps': all_steps,
+                          'final_decisions': all_decisions.tolist(),
+                          'decision_orders': all_deci_orders,
+                          'skipped_updates': int(skipped_total)}))
+        sys.exit()
+    report_statistics(all_steps, all_deci_orders)
+    if epsilon is not None:
+        print("node updates skipped: {}".format(skipped_total))
+    sys.exit()
+
 # plot the network as dots and lines in pygame window
+# only needed for the simulation window and the bar graph, not imported in batch mode
+import pygame
+import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import Axes3D
 pygame.init()  # initialize the pygame
 # find appropriate window size from current network
 # convert node positions from triangle grid to Cartesian, for plotting
@@ -288,8 +317,8 @@ nodes_disp = [world_to_display(nodes_plt[i], world_size, screen_size)
 screen.fill(color_white)  # fill the background
 # draw the connecting lines
 for i in range(net_size):
-    for j in range(i+1, net_size):
-        if connections[i][j]:
+    for j in connection_lists[i]:
+        if j > i:  # each connection drawn once
             pygame.draw.line(screen, color_black, nodes_disp[i], nodes_disp[j], norm_line_width)
 # draw the nodes as dots
 for i in range(net_size):
@@ -343,6 +372,12 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
     # the dominant decision of all nodes
     deci_domi = np.argmax(deci_dist, axis=1)
     print deci_domi
+    # disagreeing connections, updated only for the nodes changing their dominant decision
+    tracker = ConvergenceTracker(connections, deci_domi)
+    # nodes to update in each iteration, if active-set scheduling is used
+    active_set = None
+    if epsilon is not None:
+        active_set = ActiveSet(connections, epsilon)
     # only adjacent block of nodes sharing same dominant decision belongs to same group
     groups = []  # put nodes in groups by their local consensus
     group_sizes = [0 for i in range(net_size)]  # the group size that each node belongs to
@@ -352,13 +387,6 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
     color_assigns = [0 for i in range(color_quantity)]  # number of assignments for each color
     group_colors = []  # color for the groups
     node_colors = [0 for i in range(net_size)]  # color for the nodes
-    # Difference of two distributions is the sum of absolute values of differences
-    # of all individual probabilities.
-    # Overflow threshold for the distribution difference. Distribution difference larger than
-    # this means neighbors are not quite agree with each other, so no further improvement on
-    # unipolarity will be performed. If distribution difference is lower than the threshold,
-    # linear multiplier will be used to improve unipolarity on the result distribution.
-    dist_diff_thres = 0.3
     # Variable for ratio of distribution difference to distribution difference threshold.
     # The ratio is in range of [0,1], it will be used for constructing the corresponding linear
     # multiplier. At one side, the smaller the ratio, the smaller the distribution difference,
@@ -366,9 +394,6 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
     # related to the small end of the linear multiplier. The smallee the ratio gets, the steeper
     # the linear multiplier will be, and the faster the unipolarity increases.
     dist_diff_ratio = [0.0 for i in range(net_size)]
-    # Exponent of a power function to map the distribution difference ratio to a larger value,
-    # and therefore slow donw the growing rate.
-    dist_diff_power = 0.3
 
     # start the matplotlib window first before the simulation cycle
     fig = plt.figure()
@@ -420,49 +445,12 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
 
         # 1.update the dominant decision for all nodes
         deci_domi = np.argmax(deci_dist, axis=1)
+        tracker.update(deci_domi)
 
         # 2.update the groups
-        groups = []  # empty the group container
-        group_deci = []  # the exhibited decision of the groups
-        # a diminishing global pool for node indices, for nodes not yet assigned into groups
-        n_pool = range(net_size)
-        # start searching groups one by one from the global node pool
-        while len(n_pool) != 0:
-            # start a new group, with first node in the n_pool
-            first_member = n_pool[0]  # first member of this group
-            group_temp = [first_member]  # current temporary group
-            n_pool.pop(0)  # pop out first node in the pool
-            # a list of potential members for current group
-            # this list may increase when new members of group are discovered
-            p_members = connection_lists[first_member][:]
-            # an index for iterating through p_members, in searching group members
-            p_index = 0  # if it climbs to the end, the searching ends
-            # index of dominant decision for current group
-            current_domi = deci_domi[first_member]
-            # dynamically iterating through p_members with p_index
-            while p_index < len(p_members):  # index still in valid range
-                if deci_domi[p_members[p_index]] == current_domi:
-                    # a new member has been found
-                    new_member = p_members[p_index]  # get index of the new member
-                    p_members.remove(new_member)  # remove it from p_members list
-                        # but not increase p_index, because new value in p_members will flush in
-                    n_pool.remove(new_member)  # remove it from the global node pool
-                    group_temp.append(new_member)  # add it to current group
-                    # check if new potential members are available, due to new node discovery
-                    p_members_new = connection_lists[new_member]  # new potential members
-                    for member in p_members_new:
-                        if member not in p_members:  # should not already in p_members
-                            if member not in group_temp:  # should not in current group
-                                if member in n_pool:  # should be available in global pool
-                                    # if conditions satisfied, it is qualified as a potential member
-                                    p_members.append(member)  # append at the end
-                else:
-                    # a boundary node(share different decision) has been met
-                    # leave it in p_members, will help to avoid checking back again on this node
-                    p_index = p_index + 1  # shift right one position
-            # all connected members for this group have been located
-            groups.append(group_temp)  # append the new group
-            group_deci.append(deci_domi[first_member])  # append new group's exhibited decision
+        # the group index of each node, the size and exhibited decision of each group
+        group_labels, group_lens, group_deci = consensus_groups(connections, deci_domi)
+        groups = group_lists(group_labels, len(group_lens))
         # update the colors for the exhibited decisions
         if not color_initialized:
             color_initialized = True
@@ -523,119 +511,41 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
             group_colors.append(deci_colors[group_deci[i]])
 
         # 3.update the group size for each node
-        for i in range(len(groups)):
-            size_temp = len(groups[i])
-            color_temp = group_colors[i]
-            for node in groups[i]:
-                group_sizes[node] = size_temp
-                node_colors[node] = color_temp  # update the color for each node
+        group_sizes = group_lens[group_labels]
+        node_colors = np.array(group_colors)[group_labels]  # update the color for each node
 
         # the decision distribution evolution
-        converged_all = True  # flag for convergence of entire network
         deci_dist_t = np.copy(deci_dist)  # deep copy of the 'deci_dist'
-        for i in range(net_size):
-            # # skip updating the 20 commanding nodes, stubborn in their decisions
-            # if i in command_nodes_20:
-            #     if iter_count >= iter_cutin:
-            #         continue
-            host_domi = deci_domi[i]
-            converged = True
-            for neighbor in connection_lists[i]:
-                if host_domi != deci_domi[neighbor]:
-                    converged = False
-                    break
-            # action based on convergence of dominant decision
-            if converged:  # all neighbors have converged with host
-                # step 1: take equally weighted average on all distributions
-                # including host and all neighbors
-                deci_dist[i] = deci_dist_t[i]*1.0  # start with host itself
-                for neighbor in connection_lists[i]:
-                    # accumulate neighbor's distribution
-                    deci_dist[i] = deci_dist[i] + deci_dist_t[neighbor]
-                # normalize the distribution such that sum is 1.0
-                sum_temp = np.sum(deci_dist[i])
-                deci_dist[i] = deci_dist[i] / sum_temp
-                # step 2: increase the unipolarity by applying the linear multiplier
-                # (this step is only for when all neighbors are converged)
-                # First find the largest difference between two distributions in this block
-                # of nodes, including the host and all its neighbors.
-                comb_pool = [i] + connection_lists[i]  # add host to a pool with its neighbors
-                    # will be used to form combinations from this pool
-                comb_pool_len = len(comb_pool)
-                dist_diff = []
-                for j in range(comb_pool_len):
-                    for k in range(j+1, comb_pool_len):
-                        j_node = comb_pool[j]
-                        k_node = comb_pool[k]
-                        dist_diff.append(np.sum(abs(deci_dist[j_node] - deci_dist[k_node])))
-                dist_diff_max = max(dist_diff)  # maximum distribution difference of all
-                if dist_diff_max < dist_diff_thres:
-                    # distribution difference is small enough,
-                    # that linear multiplier should be applied to increase unipolarity
-                    dist_diff_ratio = dist_diff_max/dist_diff_thres
-                    # Linear multiplier is generated from value of smaller and larger ends, the
-                    # smaller end is positively related with dist_diff_ratio. The smaller the
-                    # maximum distribution difference, the smaller the dist_diff_ratio, and the
-                    # steeper the linear multiplier.
-                    # '1.0/deci_num' is the average value of the linear multiplier
-                    small_end = 1.0/deci_num * np.power(dist_diff_ratio, dist_diff_power)
-                    large_end = 2.0/deci_num - small_end
-                    # sort the magnitude of the current distribution
-                    dist_temp = np.copy(deci_dist[i])  # temporary distribution
-                    sort_index = range(deci_num)
-                    for j in range(deci_num-1):  # bubble sort, ascending order
-                        for k in range(deci_num-1-j):
-                            if dist_temp[k] > dist_temp[k+1]:
-                                # exchange values in 'dist_temp'
-                                temp = dist_temp[k]
-                                dist_temp[k] = dist_temp[k+1]
-                                dist_temp[k+1] = temp
-                                # exchange values in 'sort_index'
-                                temp = sort_index[k]
-                                sort_index[k] = sort_index[k+1]
-                                sort_index[k+1] = temp
-                    # applying the linear multiplier
-                    for j in range(deci_num):
-                        multiplier = small_end + float(j)/(deci_num-1) * (large_end-small_end)
-                        deci_dist[i][sort_index[j]] = deci_dist[i][sort_index[j]] * multiplier
-                    # normalize the distribution such that sum is 1.0
-                    sum_temp = np.sum(deci_dist[i])
-                    deci_dist[i] = deci_dist[i]/sum_temp
-                else:
-                    # not applying linear multiplier when distribution difference is large
-                    pass
-            else:  # at least one neighbor has different opinion with host
-                converged_all = False  # the network is not converged
-                # take unequal weights in the averaging process based on group sizes
-                deci_dist[i] = deci_dist_t[i]*group_sizes[i]  # start with host itself
-                for neighbor in connection_lists[i]:
-                    # accumulate neighbor's distribution
-                    deci_dist[i] = deci_dist[i] + deci_dist_t[neighbor]*group_sizes[neighbor]
-                # normalize the distribution
-                sum_temp = np.sum(deci_dist[i])
-                deci_dist[i] = deci_dist[i] / sum_temp
+        # all nodes are updated together, see consensus_step() in consensus_functions.py
+        active = None  # all nodes are active without the active-set scheduling
+        if active_set is not None:
+            active = active_set.schedule(group_sizes, tracker.converged())
+        deci_dist, converged = consensus_step(connections, deci_dist_t, deci_domi,
+            group_sizes, dist_diff_thres, dist_diff_power, tracker.converged(), active)
+        if active_set is not None:
+            active_set.record(deci_dist_t, deci_dist)
+        # # skip updating the 20 commanding nodes, stubborn in their decisions
+        # if iter_count >= iter_cutin:
+        #     deci_dist[command_nodes_20] = deci_dist_t[command_nodes_20]
+        converged_all = tracker.all_converged()  # flag for convergence of entire network
 
         # graphics animation, both pygame window and matplotlib window
         # 1.pygame window for dynamics of network's groups
         screen.fill(color_white)
         # draw the regualr connecting lines
         for i in range(net_size):
-            for j in range(i+1, net_size):
-                if connections[i][j]:
+            for j in connection_lists[i]:
+                if j > i:  # each connection drawn once
                     pygame.draw.line(screen, color_black,
                                      nodes_disp[i], nodes_disp[j], norm_line_width)
         # draw the connecting lines marking the groups
-        for i in range(len(groups)):
-            group_len = len(groups[i])
-            for j in range(group_len):
-                for k in range(j+1, group_len):
-                    j_node = groups[i][j]
-                    k_node = groups[i][k]
-                    # check if two nodes in one group is connected
-                    if connections[j_node][k_node]:
-                        # wider lines for group connections
-                        pygame.draw.line(screen, distinct_color_set[group_colors[i]],
-                            nodes_disp[j_node], nodes_disp[k_node], group_line_width)
+        for i in range(net_size):
+            for j in connection_lists[i]:
+                # check if two connected nodes are in one group
+                if j > i and group_labels[i] == group_labels[j]:
+                    # wider lines for group connections
+                    pygame.draw.line(screen, distinct_color_set[node_colors[i]],
+                        nodes_disp[i], nodes_disp[j], group_line_width)
         # draw the nodes as dots
         for i in range(net_size):
             pygame.draw.circle(screen, distinct_color_set[node_colors[i]],
@@ -647,17 +557,15 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
         #     ax.bar3d(x_pos, y_pos, z_pos, dx, dy, dz, color='b')
         #     fig.canvas.draw()
         #     fig.show()
+        # calculate the discrete entropy for all distributions, for the bar graph and the metrics
+        if not nobargraph or metrics is not None:
+            dz = discrete_entropy(deci_dist)
+            ent_sum = np.sum(dz)
+        if metrics is not None:
+            group_nums, group_maxs = group_metrics(group_labels, group_lens, net_size)
+            metrics.write([sim_index], iter_count, dz[None,:], group_nums, group_maxs)
         # 2.matplotlib window for 2D bar graph of discrete entropy
         if not nobargraph:
-            # calculate the discrete entropy for all distributions
-            ent_sum = 0
-            for i in range(net_size):
-                ent = 0
-                for j in range(deci_num):
-                    if deci_dist[i][j] == 0: continue
-                    ent = ent - deci_dist[i][j] * math.log(deci_dist[i][j],2)
-                dz[i] = ent
-                ent_sum = ent_sum + ent
             print("summation of entropy of all distributions: {}".format(ent_sum))
             # draw the bar graph
                 # somehow the old bars are overlapping the current ones, have to clear the
@@ -681,7 +589,10 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
             time_last = pygame.time.get_ticks()  # reset time-last
 
         # iteration count
-        print "iteration {}".format(iter_count)
+        if active_set is not None:
+            print "iteration {}, {} node updates skipped".format(iter_count, active_set.skipped)
+        else:
+            print "iteration {}".format(iter_count)
         iter_count = iter_count + 1
         # hold the program to check the network
         # raw_input("<Press Enter to continue>")
@@ -693,6 +604,8 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
                 list(avg_dist_id_sort).index(deci_domi[0]) + 1))
             print("the order of average initial decision:")
             print(avg_dist_id_sort)
+            if active_set is not None:
+                print("node updates skipped: {}".format(active_set.skipped_total))
             break
 
     # record result of this simulation
@@ -701,14 +614,12 @@ for sim_index in range(repeat_times):  # repeat the simulation for these times
     if deci_domi[0] == 0:
         steps_seed.append(iter_count - 1)
 
+if metrics is not None:
+    metrics.close()
+
 # report statistic result if simulation runs more than once
 if repeat_times > 1:
-    print("\nstatistics\nsteps to converge: {}".format(all_steps))
-    print("final decision in order: {}".format(all_deci_orders))
-    print("average steps: {}".format(np.mean(np.array(all_steps))))
-    print("maximum steps: {}".format(max(all_steps)))
-    print("minimum steps: {}".format(min(all_steps)))
-    print("std dev of steps: {}".format(np.std(np.array(all_steps))))
+    report_statistics(all_steps, all_deci_orders)
     # # statistics for simulations with seed robots
     # print("{} out of {} trials follow command from seed robots".format(
     #     len(steps_seed), repeat_times))
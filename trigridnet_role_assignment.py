@@ -6,6 +6,12 @@
 
 # input arguments:
 # '-f': filename of the triangle grid network
+# '-s': seed of the random preference distribution, to watch a trial from trial_runner.py
+# '--headless': run the role assignment without any window and speed control, and print the
+#       results as one line of JSON at exit, for running on servers without display
+# '--relay': relay strategy of the messages, 'flood', 'tree' or 'random', see relay_strategy()
+#       in relay_functions.py; default='flood'
+# '--forward': probability of the non-designated relays for the 'random' strategy; default=0.5
 
 # Inter-node communication is used to let one node know the status of another node that
 # is not directly connected. Enabling message relay is what I consider the most convenient
@@ -25,25 +31,26 @@
 # extra circle on node for locally converged role assignment scheme
 
 
-import pygame
-import matplotlib.pyplot as plt
 from trigridnet_generator import *
 from formation_functions import *
+from neighbor_functions import *
+from relay_functions import *
+from index_functions import *
 import numpy as np
-import os, getopt, sys, time, random
-
-import pandas as pd
-pd.set_option('display.max_columns', None)
-# print pd.DataFrame(gradients, range(net_size), range(net_size))
+import os, getopt, sys, time, random, json
 
 net_folder = 'trigrid-networks'
 net_filename = '30-1'  # default network
 net_size = 30  # default network size
 net_filepath = os.path.join(os.getcwd(), net_folder, net_filename)
+random_seed = None  # seed of numpy random generator, not seeded if None
+headless = False  # option as to whether or not running without any window
+relay_name = 'flood'  # relay strategy of the messages
+forward_prob = 0.5  # probability of the non-designated relays of 'random' strategy
 
 # read command line options
 try:
-    opts, args = getopt.getopt(sys.argv[1:], 'f:')
+    opts, args = getopt.getopt(sys.argv[1:], 'f:s:', ['headless', 'relay=', 'forward='])
 except getopt.GetoptError as err:
     print str(err)
     sys.exit()
@@ -57,35 +64,56 @@ for opt,arg in opts:
             sys.exit()
         # parse the network size
         net_size = int(net_filename.split('-')[0])
+    elif opt == '-s':
+        random_seed = int(arg)
+    elif opt == '--headless':
+        headless = True
+    elif opt == '--relay':
+        relay_name = arg
+        if relay_name not in relay_strategy_names:
+            print "relay strategy should be one of {}".format(relay_strategy_names)
+            sys.exit()
+    elif opt == '--forward':
+        forward_prob = float(arg)
 
-# read the network from file
-nodes_tri = []
+# read the network from the analytics index next to the network file, which is built on the
+# first run, see index_functions.py
+net_index = NetworkIndex(net_filepath)
 # nodes_tri: node positions in the triangle grid network
 # nodes_cart: node positions in Cartesian coordinates
 # nodes_disp: node positions for display
-f = open(net_filepath, 'r')
-new_line = f.readline()
-while len(new_line) != 0:
-    pos_str = new_line[0:-1].split(' ')
-    pos = [int(pos_str[0]), int(pos_str[1])]
-    nodes_tri.append(pos)
-    new_line = f.readline()
-
-# generate the connection matrix, 0 for not connected, 1 for connected
-connections = np.zeros((net_size, net_size))
-for i in range(net_size):
-    for j in range(i+1, net_size):
-        diff_x = nodes_tri[i][0] - nodes_tri[j][0]
-        diff_y = nodes_tri[i][1] - nodes_tri[j][1]
-        if abs(diff_x) + abs(diff_y) == 1 or diff_x * diff_y == -1:
-            connections[i,j] = 1
-            connections[j,i] = 1
+nodes_tri = net_index.nodes().tolist()
+
+# the sparse connections, connections[i,j] is 0 for not connected, 1 for connected
+connections = net_index.connections()
 # connection list indexed by node
-connection_lists = []
-for i in range(net_size):
-    connection_lists.append(list(np.where(connections[i] == 1)[0]))
+connection_lists = connections.to_lists()
+
+# run the role assignment iterations back to back, with the same preference distribution and
+# relay strategy as below
+if headless:
+    np.random.seed(random_seed)
+    pref_dist = np.random.rand(net_size, net_size)
+    relay_targets = relay_strategy(RelayTargets.from_gradients(connections,
+        net_index.hop_counts()), relay_name, forward_prob)
+    assignment = RoleAssignment(connections, relay_targets, pref_dist)
+    while not assignment.all_converged():
+        assignment.iterate()
+    print json.dumps({'network': net_filename, 'seed': random_seed, 'relay': relay_name,
+                      'iterations': assignment.iter_count,
+                      'transmissions': assignment.transmission_sum,
+                      'transmission_bytes': assignment.transmission_bytes(),
+                      'peak_node_transmissions': assignment.peak_transmissions,
+                      'transmissions_per_iteration': assignment.transmission_history})
+    sys.exit()
 
 # plot the network as dots and lines in pygame window
+# only needed for the simulation window, not imported in headless mode
+import pygame
+import matplotlib.pyplot as plt
+import pandas as pd
+pd.set_option('display.max_columns', None)
+# print pd.DataFrame(gradients, range(net_size), range(net_size))
 pygame.init()
 font = pygame.font.SysFont("Cabin", 14)
 nodes_cart = np.array([trigrid_to_cartesian(pos) for pos in nodes_tri])
@@ -123,8 +151,8 @@ nodes_disp = [world_to_display(nodes_cart[i], world_size, screen_size)
 # draw the network for the first time
 screen.fill(color_white)
 for i in range(net_size):
-    for j in range(i+1, net_size):
-        if connections[i,j]:
+    for j in connection_lists[i]:
+        if j > i:  # each connection drawn once
             pygame.draw.line(screen, color_black, nodes_disp[i], nodes_disp[j], line_width)
 for i in range(net_size):
     pygame.draw.circle(screen, color_black, nodes_disp[i], node_size, 0)
@@ -155,85 +183,26 @@ raw_input("press <ENTER> to continue")
 # is also developed to deal with any unstable communication for message transmissions.
 
 # However, to simplify the role assignment simulation, the gradient map is pre-calculated.
-# Although I could use algorithm similar in the holistic dependency calculation, a new one that
-# searching the shortest path between any two nodes is investigated in the following.
-gradients = np.copy(connections)  # build gradient map on the connection map
+# It's a breadth-first search from all message sources together, see relay_gradients() in
+# relay_functions.py, and it's kept in the analytics index as the hop counts.
+gradients = net_index.hop_counts()
     # gradients[i,j] indicates gradient value of node j, to message source i
-pool_gradient = 1  # gradients of the connections in the pool
-pool_conn = {}
-for i in range(net_size):
-    pool_conn[i] = connection_lists[i][:]  # start with gradient 1 connections
-while len(pool_conn.keys()) != 0:
-    source_deactivate = []
-    for source in pool_conn:
-        targets_temp = []  # the new targets
-        for target in pool_conn[source]:
-            for target_new in connection_lists[target]:
-                if target_new == source: continue  # skip itself
-                if gradients[source, target_new] == 0:
-                    gradients[source, target_new] = pool_gradient + 1
-                    targets_temp.append(target_new)
-        if len(targets_temp) == 0:
-            source_deactivate.append(source)
-        else:
-            pool_conn[source] = targets_temp[:]  # update with new targets
-    for source in source_deactivate:
-        pool_conn.pop(source)  # remove the finished sources
-    pool_gradient = pool_gradient + 1
-
-# calculate the relative gradient values
-gradients_rel = []
-    # gradients_rel[i][j,k] refers to gradient of k relative to j with message source i
-for i in range(net_size):  # message source i
-    gradient_temp = np.zeros((net_size, net_size))
-    for j in range(net_size):  # in the view point of j
-        gradient_temp[j] = gradients[i] - gradients[i,j]
-    gradients_rel.append(gradient_temp)
-
-# list the neighbors a node can send message to regarding a message source
-neighbors_send = [[[] for j in range(net_size)] for i in range(net_size)]
-    # neighbors_send[i][j][k] means, if message from source i is received in j,
-    # it should be send to k
-for i in range(net_size):  # message source i
-    for j in range(net_size):  # in the view point of j
-        for neighbor in connection_lists[j]:
-            if gradients_rel[i][j,neighbor] == 1:
-                neighbors_send[i][j].append(neighbor)
+# list the neighbors a node can send message to regarding a message source, the nodes only
+# relay a message to the neighbors one gradient higher
+relay_targets = RelayTargets.from_gradients(connections, gradients)
+    # relay_targets[i,j] is the neighbors to send to, if message from source i is received in j
 
 # generate the initial preference distribution
+np.random.seed(random_seed)  # same distribution as the trial of this seed in trial_runner.py
 pref_dist = np.random.rand(net_size, net_size)  # no need to normalize it
-initial_roles = np.argmax(pref_dist, axis=1)  # the chosen role
-
-# the local assignment information
-local_role_assignment = [[[-1, 0, -1] for j in range(net_size)] for i in range(net_size)]
-    # local_role_assignment[i][j] is local assignment information of node i for node j
-    # first number is chosen role, second is probability, third is time stamp
-local_node_assignment = [[[] for j in range(net_size)] for i in range(net_size)]
-    # local_node_assignment[i][j] is local assignment of node i for role j
-    # contains a list of nodes that choose role j
-# populate the chosen role of itself to the local assignment information
-for i in range(net_size):
-    local_role_assignment[i][i][0] = initial_roles[i]
-    local_role_assignment[i][i][1] = pref_dist[i, initial_roles[i]]
-    local_role_assignment[i][i][2] = 0
-    local_node_assignment[i][initial_roles[i]].append(i)
-
-# received message container for all nodes
-message_rx = [[] for i in range(net_size)]
-# for each message entry, it containts:
-    # message[0]: ID of message source
-    # message[1]: its preferred role
-    # message[2]: probability of chosen role
-    # message[3]: time stamp
+# the neighbors actually sent to by the relay strategy, see relay_strategy() in relay_functions.py
+relay_targets = relay_strategy(relay_targets, relay_name, forward_prob)
+
+# the local assignment information, received messages and flags of all nodes, see the
+# RoleAssignment class in relay_functions.py
 # all nodes transmit once their chosen role before the loop
-transmission_total = 0  # count message transmissions for each iteration
-iter_count = 0  # also used as time stamp in message
-for source in range(net_size):
-    chosen_role = local_role_assignment[source][source][0]
-    message_temp = [source, chosen_role, pref_dist[source, chosen_role], iter_count]
-    for target in connection_lists[source]:  # send to all neighbors
-        message_rx[target].append(message_temp)
-        transmission_total = transmission_total + 1
+assignment = RoleAssignment(connections, relay_targets, pref_dist)
+scheme_converged = assignment.scheme_converged
 role_color = [0 for i in range(net_size)]  # colors for a conflicting role
 # Dynamically manage color for conflicting nodes is unnecessarily complicated, might as
 # well assign the colors in advance.
@@ -249,13 +218,6 @@ while len(role_index_pool) != 0:
         color_index_pool = range(color_quantity)
         random.shuffle(color_index_pool)
 
-# flags
-transmit_flag = [[False for j in range(net_size)] for i in range(net_size)]
-    # whether node i should transmit received message of node j
-change_flag = [False for i in range(net_size)]
-    # whether node i should change its chosen role
-scheme_converged = [False for i in range(net_size)]
-
 sim_exit = False
 sim_pause = False
 time_now = pygame.time.get_ticks()
@@ -284,111 +246,33 @@ while not sim_exit:
     else:
         continue
 
-    iter_count = iter_count + 1
-
-    # process the received messages
-    # transfer messages to the processing buffer, then empty the message receiver
-    message_rx_buf = [[[k for k in j] for j in i] for i in message_rx]
-    message_rx = [[] for i in range(net_size)]
-    yield_nodes = []  # the nodes that are yielding on chosen roles
-    yield_roles = []  # the old roles of yield_nodes before yielding
-    for i in range(net_size):  # messages received by node i
-        for message in message_rx_buf[i]:
-            source = message[0]
-            role = message[1]
-            probability = message[2]
-            time_stamp = message[3]
-            if source == i:
-                print "error, node {} receives message of itself".format(i)
-                sys.exit()
-            if time_stamp > local_role_assignment[i][source][2]:
-                # received message will only take any effect if time stamp is new
-                # update local_node_assignment
-                role_old = local_role_assignment[i][source][0]
-                if role_old >= 0:  # has been initialized before, not -1
-                    local_node_assignment[i][role_old].remove(source)
-                local_node_assignment[i][role].append(source)
-                # update local_role_assignment
-                local_role_assignment[i][source][0] = role
-                local_role_assignment[i][source][1] = probability
-                local_role_assignment[i][source][2] = time_stamp
-                transmit_flag[i][source] = True
-                # check conflict with itself
-                if role == local_role_assignment[i][i][0]:
-                    if probability >= pref_dist[i, local_role_assignment[i][i][0]]:
-                        # change its choice after all message received
-                        change_flag[i] = True
-                        yield_nodes.append(i)
-                        yield_roles.append(local_role_assignment[i][i][0])
-    # change the choice of role for those decide to
-    for i in range(net_size):
-        if change_flag[i]:
-            change_flag[i] = False
-            role_old = local_role_assignment[i][i][0]
-            pref_dist_temp = np.copy(pref_dist[i])
-            pref_dist_temp[local_role_assignment[i][i][0]] = -1
-                # set to negative to avoid being chosen
-            for j in range(net_size):
-                if len(local_node_assignment[i][j]) != 0:
-                    # eliminate those choices that have been taken
-                    pref_dist_temp[j] = -1
-            role_new = np.argmax(pref_dist_temp)
-            if pref_dist_temp[role_new] < 0:
-                print "error, node {} has no available role".format(i)
-                sys.exit()
-            # role_new is good to go
-            # update local_node_assignment
-            local_node_assignment[i][role_old].remove(i)
-            local_node_assignment[i][role_new].append(i)
-            # update local_role_assignment
-            local_role_assignment[i][i][0] = role_new
-            local_role_assignment[i][i][1] = pref_dist[i][role_new]
-            local_role_assignment[i][i][2] = iter_count
-            transmit_flag[i][i] = True
+    # process the received messages, change the choice of role for those decide to, then
     # transmit the received messages or initial new message transmission
-    transmission_total = 0
-    for transmitter in range(net_size):  # transmitter node
-        for source in range(net_size):  # message is for this source node
-            if transmit_flag[transmitter][source]:
-                transmit_flag[transmitter][source] = False
-                message_temp = [source, local_role_assignment[transmitter][source][0],
-                                        local_role_assignment[transmitter][source][1],
-                                        local_role_assignment[transmitter][source][2]]
-                for target in neighbors_send[source][transmitter]:
-                    message_rx[target].append(message_temp)
-                    transmission_total = transmission_total + 1
-
-    # check if role assignment scheme is converged at individual node
-    for i in range(net_size):
-        if not scheme_converged[i]:
-            converged = True
-            for j in range(net_size):
-                if len(local_node_assignment[i][j]) != 1:
-                    converged  = False
-                    break
-            if converged:
-                scheme_converged[i] = True
+    yield_nodes, yield_roles = assignment.iterate()
 
     # for display, scan the nodes that have detected conflict but not yielding
+    chosen_roles = assignment.chosen_roles()
+    conflicting = assignment.conflicting()
     persist_nodes = []
     for i in range(net_size):
         if i in yield_nodes: continue
-        if len(local_node_assignment[i][local_role_assignment[i][i][0]]) > 1:
+        if conflicting[i]:
             persist_nodes.append(i)
 
     # debug print
-    print "iteration {}, total transmission {}".format(iter_count, transmission_total)
+    print "iteration {}, total transmission {}".format(assignment.iter_count,
+        assignment.transmission_total)
 
     # update the display
     for i in range(net_size):
-        for j in range(i+1, net_size):
-            if connections[i,j]:
+        for j in connection_lists[i]:
+            if j > i:  # each connection drawn once
                 pygame.draw.line(screen, color_black, nodes_disp[i], nodes_disp[j], line_width)
     for i in range(net_size):
         pygame.draw.circle(screen, color_black, nodes_disp[i], node_size, 0)
     # draw the persisting nodes with color of conflicting role
     for i in persist_nodes:
-        pygame.draw.circle(screen, distinct_color_set[role_color[local_role_assignment[i][i][0]]],
+        pygame.draw.circle(screen, distinct_color_set[role_color[chosen_roles[i]]],
             nodes_disp[i], node_size, 0)
     # draw extra ring on node if local scheme has converged
     for i in range(net_size):
@@ -411,11 +295,12 @@ while not sim_exit:
         pygame.time.delay(flash_delay)
 
     # exit the simulation if all role assignment schemes have converged
-    all_converged = scheme_converged[0]
-    for i in range(1, net_size):
-        all_converged = all_converged and scheme_converged[i]
-        if not all_converged: break
-    if all_converged: sim_exit = True
+    if assignment.all_converged(): sim_exit = True
+
+# the bandwidth taken by the role assignment
+print "{} message transmissions, {} bytes, at most {} by one node in an iteration".format(
+    assignment.transmission_sum, assignment.transmission_bytes(),
+    assignment.peak_transmissions)
 
 # hold the simulation window to exit manually
 raw_input("role assignment finished, press <ENTER> to exit")